@@ -5,11 +5,14 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'coloby.settings')
 
+# Sets up Django (app registry included) before the routing pulls in models
+django_asgi_app = get_asgi_application()
+
 from cowork import routing
 
 
 application = ProtocolTypeRouter({
-    'http': get_asgi_application(),
+    'http': django_asgi_app,
     "websocket":AuthMiddlewareStack(
         URLRouter(
             routing.websocket_urlpatterns
@@ -106,7 +106,12 @@ DATABASES = {
 
 
 database_url = config("DATABASE_URL")
-DATABASES["default"] = dj_database_url.parse(database_url)
+DATABASES["default"] = dj_database_url.parse(
+    database_url,
+    # Keep connections open between requests; the chat DB pool threads
+    # (CHAT_DB_THREADS) each reuse their own connection this way.
+    conn_max_age=config("DATABASE_CONN_MAX_AGE", default=0, cast=int),
+)
 
 
 
@@ -149,10 +154,123 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CHANNEL_LAYERS = {
     'default': {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
+        "BACKEND": config('CHANNEL_LAYER_BACKEND', default="channels.layers.InMemoryChannelLayer"),
     }
 }
 
+# Running several daphne workers on one host? Use
+# CHANNEL_LAYER_BACKEND=cowork.layers.UnixSocketChannelLayer so group messages
+# reach sockets held by the other workers. All workers must share the socket dir.
+if CHANNEL_LAYERS['default']['BACKEND'] == 'cowork.layers.UnixSocketChannelLayer':
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'socket_dir': config('CHANNEL_LAYER_SOCKET_DIR', default='/tmp/coloby-channels'),
+    }
+
+# Size of the dedicated thread pool (and so DB connections) used by the chat
+# consumer for its queries, separate from asgiref's thread-sensitive executor.
+CHAT_DB_THREADS = config('CHAT_DB_THREADS', default=4, cast=int)
+# Seconds those pool connections stay open when DATABASE_CONN_MAX_AGE is
+# shorter, so the pool does not reconnect on every query.
+CHAT_DB_CONN_MAX_AGE = config('CHAT_DB_CONN_MAX_AGE', default=60, cast=int)
+
+# Chat messages are persisted write-behind: flushed with one bulk insert once
+# the queue reaches the batch size or the interval (seconds) elapses.
+CHAT_PERSIST_BATCH_SIZE = config('CHAT_PERSIST_BATCH_SIZE', default=100, cast=int)
+CHAT_PERSIST_FLUSH_INTERVAL = config('CHAT_PERSIST_FLUSH_INTERVAL', default=0.5, cast=float)
+
+# Recent frames kept per room so reconnecting clients can be caught up without
+# a history query; older gaps are filled from the DB, up to the DB limit.
+CHAT_REPLAY_BUFFER_SIZE = config('CHAT_REPLAY_BUFFER_SIZE', default=256, cast=int)
+CHAT_REPLAY_MAX_ROOMS = config('CHAT_REPLAY_MAX_ROOMS', default=1000, cast=int)
+CHAT_REPLAY_DB_LIMIT = config('CHAT_REPLAY_DB_LIMIT', default=500, cast=int)
+
+# Worker number (0-1023) mixed into room slugs (cowork.identifiers); give each
+# process its own to guarantee unique slugs across hosts. Unset, each process
+# claims a free one by locking a file in CHAT_ID_WORKER_DIR (default: a
+# coloby-id-workers directory in the system temp dir).
+CHAT_ID_WORKER = config('CHAT_ID_WORKER', default=None, cast=lambda v: None if v is None else int(v))
+CHAT_ID_WORKER_DIR = config('CHAT_ID_WORKER_DIR', default='')
+
+# Room.has_member answers are cached per process (cowork.membership) for this
+# many seconds, which bounds how long other workers may miss a join or leave.
+CHAT_MEMBERSHIP_CACHE_SIZE = config('CHAT_MEMBERSHIP_CACHE_SIZE', default=10000, cast=int)
+CHAT_MEMBERSHIP_CACHE_TTL = config('CHAT_MEMBERSHIP_CACHE_TTL', default=30, cast=float)
+
+# Message history is served in keyset pages (cowork.pagination)
+CHAT_HISTORY_PAGE_SIZE = config('CHAT_HISTORY_PAGE_SIZE', default=50, cast=int)
+CHAT_HISTORY_MAX_PAGE_SIZE = config('CHAT_HISTORY_MAX_PAGE_SIZE', default=200, cast=int)
+# Rows fetched per round trip when streaming a room export
+CHAT_EXPORT_CHUNK_SIZE = config('CHAT_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
+# Full-text search (cowork.search): hits per page by default and at most, and
+# how far the total is counted before it is reported as capped.
+CHAT_SEARCH_PAGE_SIZE = config('CHAT_SEARCH_PAGE_SIZE', default=25, cast=int)
+CHAT_SEARCH_MAX_PAGE_SIZE = config('CHAT_SEARCH_MAX_PAGE_SIZE', default=100, cast=int)
+CHAT_SEARCH_COUNT_CAP = config('CHAT_SEARCH_COUNT_CAP', default=1000, cast=int)
+
+# Task lists of a room (cowork.pagination.TaskPagination): tasks per page by
+# default and at most; and how many tasks one bulk write (cowork.task_batches)
+# may carry.
+CHAT_TASK_PAGE_SIZE = config('CHAT_TASK_PAGE_SIZE', default=50, cast=int)
+CHAT_TASK_MAX_PAGE_SIZE = config('CHAT_TASK_MAX_PAGE_SIZE', default=200, cast=int)
+CHAT_TASK_BATCH_MAX = config('CHAT_TASK_BATCH_MAX', default=200, cast=int)
+
+# Room name autocomplete (cowork.autocomplete): suggestions by default and at
+# most, the longest input considered, the per-process LRU of answers, and how
+# often the in-memory index (non-PostgreSQL) reloads from the database.
+CHAT_AUTOCOMPLETE_LIMIT = config('CHAT_AUTOCOMPLETE_LIMIT', default=10, cast=int)
+CHAT_AUTOCOMPLETE_MAX_LIMIT = config('CHAT_AUTOCOMPLETE_MAX_LIMIT', default=20, cast=int)
+CHAT_AUTOCOMPLETE_MAX_QUERY = config('CHAT_AUTOCOMPLETE_MAX_QUERY', default=64, cast=int)
+CHAT_AUTOCOMPLETE_CACHE_SIZE = config('CHAT_AUTOCOMPLETE_CACHE_SIZE', default=1024, cast=int)
+CHAT_AUTOCOMPLETE_CACHE_TTL = config('CHAT_AUTOCOMPLETE_CACHE_TTL', default=60, cast=int)
+CHAT_AUTOCOMPLETE_MAX_AGE = config('CHAT_AUTOCOMPLETE_MAX_AGE', default=300, cast=int)
+
+# Resumable media uploads (cowork.uploads): partial files live in
+# CHAT_UPLOAD_DIR (outside MEDIA_ROOT) until complete; sizes are in bytes.
+CHAT_UPLOAD_DIR = config('CHAT_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'uploads'))
+CHAT_UPLOAD_MAX_SIZE = config('CHAT_UPLOAD_MAX_SIZE', default=2 * 1024 ** 3, cast=int)
+CHAT_UPLOAD_MAX_CHUNK_SIZE = config('CHAT_UPLOAD_MAX_CHUNK_SIZE', default=8 * 1024 ** 2, cast=int)
+CHAT_UPLOAD_EXPIRY_HOURS = config('CHAT_UPLOAD_EXPIRY_HOURS', default=24, cast=int)
+
+# Thumbnails/previews of message media are rendered by this many worker
+# processes (0 renders inline) into MEDIA_ROOT/derivatives, capped in bytes;
+# each process re-measures the directory at least this often (seconds).
+CHAT_DERIVATIVE_WORKERS = config('CHAT_DERIVATIVE_WORKERS', default=2, cast=int)
+CHAT_DERIVATIVE_CACHE_BYTES = config('CHAT_DERIVATIVE_CACHE_BYTES', default=512 * 1024 ** 2, cast=int)
+CHAT_DERIVATIVE_CACHE_RESCAN = config('CHAT_DERIVATIVE_CACHE_RESCAN', default=3600, cast=int)
+
+# Messages sent over HTTP (cowork.sending): at most CHAT_MESSAGE_BATCH_MAX per
+# request. Idempotency keys are stored on the messages themselves.
+CHAT_MESSAGE_BATCH_MAX = config('CHAT_MESSAGE_BATCH_MAX', default=100, cast=int)
+
+# Media is served by MessageMediaView (cowork.serving). Leave CHAT_MEDIA_SENDFILE
+# empty to stream from Django, or hand the transfer to the front server with
+# "x-sendfile" (Apache/lighttpd) or "x-accel-redirect" (nginx, internal location
+# CHAT_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT).
+CHAT_MEDIA_SENDFILE = config('CHAT_MEDIA_SENDFILE', default='')
+CHAT_MEDIA_ACCEL_PREFIX = config('CHAT_MEDIA_ACCEL_PREFIX', default='/protected-media/')
+CHAT_MEDIA_MAX_RANGES = config('CHAT_MEDIA_MAX_RANGES', default=16, cast=int)
+
+# Outgoing frames are queued per connection. When a slow client's queue is
+# full the policy applies: drop_oldest, coalesce (into array frames) or disconnect.
+CHAT_SEND_QUEUE_SIZE = config('CHAT_SEND_QUEUE_SIZE', default=256, cast=int)
+CHAT_SEND_QUEUE_POLICY = config('CHAT_SEND_QUEUE_POLICY', default='drop_oldest')
+CHAT_SEND_COALESCE_MAX = config('CHAT_SEND_COALESCE_MAX', default=50, cast=int)
+# Clients connecting with ?batch=1 get the frames of each window (in ms) as one
+# array frame instead of one frame per event.
+CHAT_SEND_BATCH_WINDOW_MS = config('CHAT_SEND_BATCH_WINDOW_MS', default=15, cast=int)
+
+# Chat flood control (cowork.throttle): sustained frames per second and burst
+# size per user and per room; policy is reject, delay or drop, and the buckets
+# live in process memory ("local") or in the default cache ("cache").
+CHAT_USER_RATE = config('CHAT_USER_RATE', default=5, cast=float)
+CHAT_USER_BURST = config('CHAT_USER_BURST', default=10, cast=int)
+CHAT_ROOM_RATE = config('CHAT_ROOM_RATE', default=50, cast=float)
+CHAT_ROOM_BURST = config('CHAT_ROOM_BURST', default=100, cast=int)
+CHAT_THROTTLE_POLICY = config('CHAT_THROTTLE_POLICY', default='reject')
+CHAT_THROTTLE_MAX_DELAY = config('CHAT_THROTTLE_MAX_DELAY', default=2.0, cast=float)
+CHAT_THROTTLE_BACKEND = config('CHAT_THROTTLE_BACKEND', default='local')
+
 
 AUTHENTICATION_BACKENDS = [
     # Needed to login by username in Django admin, regardless of `allauth`
@@ -10,6 +10,8 @@ admin.site.register(Message)
 admin.site.register(Room)
 admin.site.register(Task)
 admin.site.register(Comment)
+admin.site.register(MediaBlob)
+admin.site.register(UploadSession)
 # admin.site.register(Branch)
 # admin.site.register(UploadedFile)
 # admin.site.register(FileAccessLog)
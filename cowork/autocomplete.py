@@ -0,0 +1,269 @@
+"""
+Room name autocomplete.
+
+Suggestions are public rooms whose name, or any word of it, starts with what
+the user typed; when that finds fewer than ``limit`` rooms, typo-tolerant
+matches fill up the rest. Private rooms are joined by slug and never
+suggested.
+
+PostgreSQL
+    a ``pg_trgm`` GIN index on ``lower(name)`` (migration 0008) answers both
+    the prefix ``LIKE`` and the fuzzy ``<%`` (word similarity) match.
+other databases
+    a sorted in-memory list of ``(normalized name or word suffix, room id)``
+    per process. A prefix is a ``bisect`` range; fuzzy matches retry the
+    prefix with one edit (deletion, transposition, substitution or
+    insertion). The list is loaded on first use, kept current in this
+    process by Room signals, and reloaded in the background every
+    ``CHAT_AUTOCOMPLETE_MAX_AGE`` seconds to pick up other workers' changes.
+    Expect a few hundred bytes of memory per room.
+
+Answers for hot prefixes are kept in a per-process LRU
+(``CHAT_AUTOCOMPLETE_CACHE_SIZE``), which is dropped whenever a room changes
+in this process and expires after ``CHAT_AUTOCOMPLETE_CACHE_TTL`` seconds.
+"""
+import bisect
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+
+from cowork import metrics
+from cowork.models import Room
+
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_SECONDS = metrics.histogram("chat.autocomplete.lookup_seconds")
+CACHE_HITS = metrics.counter("chat.autocomplete.cache_hits")
+
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+_SPACES = re.compile(r"\s+")
+# Fuzzy matching kicks in from this many characters; shorter input has too
+# many one-edit neighbours to be useful.
+FUZZY_MIN_LENGTH = 3
+
+
+def normalize(text):
+    """Case-folded, accent-free, single-spaced."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _SPACES.sub(" ", text.casefold()).strip()
+
+
+def _keys(name):
+    """The name and every suffix of it that starts a word."""
+    name = normalize(name)
+    keys = [name]
+    for match in re.finditer(r" (?=\S)", name):
+        keys.append(name[match.end():])
+    return keys
+
+
+def _one_edit(query):
+    """Strings one deletion, transposition, substitution or insertion away."""
+    variants = set()
+    for i in range(len(query)):
+        variants.add(query[:i] + query[i + 1:])
+        if i + 1 < len(query):
+            variants.add(query[:i] + query[i + 1] + query[i] + query[i + 2:])
+        for char in _ALPHABET:
+            variants.add(query[:i] + char + query[i + 1:])
+            variants.add(query[:i] + char + query[i:])
+    variants.discard(query)
+    return variants
+
+
+class PrefixIndex:
+    """Sorted ``(key, room id)`` entries over room names."""
+
+    def __init__(self, rooms=()):
+        self._rooms = {}
+        entries = []
+        for pk, name, slug in rooms:
+            self._rooms[pk] = (name, slug)
+            entries.extend((key, pk) for key in _keys(name))
+        entries.sort()
+        self._entries = entries
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def add(self, pk, name, slug):
+        with self._lock:
+            self._remove(pk)
+            self._rooms[pk] = (name, slug)
+            for key in _keys(name):
+                bisect.insort(self._entries, (key, pk))
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        room = self._rooms.pop(pk, None)
+        if room is None:
+            return
+        for key in _keys(room[0]):
+            position = bisect.bisect_left(self._entries, (key, pk))
+            if position < len(self._entries) and self._entries[position] == (key, pk):
+                del self._entries[position]
+
+    def _prefixed(self, prefix, found, limit):
+        entries = self._entries
+        position = bisect.bisect_left(entries, (prefix,))
+        while len(found) < limit and position < len(entries):
+            key, pk = entries[position]
+            if not key.startswith(prefix):
+                break
+            found.setdefault(pk, None)
+            position += 1
+
+    def lookup(self, query, limit):
+        """Returns up to ``limit`` ``(name, slug)``, prefix matches first."""
+        query = normalize(query)
+        if not query:
+            return []
+        found = {}
+        with self._lock:
+            self._prefixed(query, found, limit)
+            if len(found) < limit and len(query) >= FUZZY_MIN_LENGTH:
+                for variant in sorted(_one_edit(query)):
+                    self._prefixed(variant, found, limit)
+                    if len(found) >= limit:
+                        break
+            return [self._rooms[pk] for pk in found]
+
+
+class LRUCache:
+    def __init__(self, size, ttl, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < self._clock():
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RoomAutocomplete:
+    def __init__(self):
+        self._index = None
+        self._loaded_at = 0
+        self._loading = False
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = LRUCache(
+                getattr(settings, "CHAT_AUTOCOMPLETE_CACHE_SIZE", 1024),
+                getattr(settings, "CHAT_AUTOCOMPLETE_CACHE_TTL", 60),
+            )
+        return self._cache
+
+    def suggest(self, query, limit):
+        """Returns up to ``limit`` ``{"name", "slug"}`` for what the user typed."""
+        started = time.perf_counter()
+        key = (normalize(query), limit)
+        if not key[0]:
+            return []
+        suggestions = self.cache.get(key)
+        if suggestions is not None:
+            CACHE_HITS.inc()
+        else:
+            if connection.vendor == "postgresql":
+                rooms = self._trigram_lookup(key[0], limit)
+            else:
+                rooms = self._memory_index().lookup(key[0], limit)
+            suggestions = [{"name": name, "slug": slug} for name, slug in rooms]
+            self.cache.set(key, suggestions)
+        LOOKUP_SECONDS.observe(time.perf_counter() - started)
+        return suggestions
+
+    def _trigram_lookup(self, query, limit):
+        prefix = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rooms = Room.objects.filter(is_private=False).extra(
+            where=["(lower(cowork_room.name) LIKE %s OR %s <%% lower(cowork_room.name))"],
+            params=[prefix, query],
+            select={
+                "prefixed": "lower(cowork_room.name) LIKE %s",
+                "similarity": "word_similarity(%s, lower(cowork_room.name))",
+            },
+            select_params=[prefix, query],
+        ).order_by("-prefixed", "-similarity", "name")
+        return list(rooms.values_list("name", "slug")[:limit])
+
+    def _memory_index(self):
+        with self._lock:
+            index = self._index
+            stale = time.monotonic() - self._loaded_at > getattr(settings, "CHAT_AUTOCOMPLETE_MAX_AGE", 300)
+            if index is not None and stale and not self._loading:
+                # Serve the current index while a fresh one loads
+                self._loading = True
+                threading.Thread(target=self._reload, daemon=True).start()
+        if index is None:
+            index = self._load()
+        return index
+
+    def _load(self):
+        index = PrefixIndex(Room.objects.filter(is_private=False).values_list("pk", "name", "slug").iterator())
+        with self._lock:
+            self._index = index
+            self._loaded_at = time.monotonic()
+        self.cache.clear()
+        return index
+
+    def _reload(self):
+        try:
+            self._load()
+        except Exception:
+            logger.exception("Reloading the room autocomplete index failed")
+        finally:
+            self._loading = False
+            connection.close()
+
+    def room_saved(self, room):
+        self.cache.clear()
+        if self._index is not None:
+            if room.is_private:
+                self._index.remove(room.pk)
+            else:
+                self._index.add(room.pk, room.name, room.slug)
+
+    def room_deleted(self, room):
+        self.cache.clear()
+        if self._index is not None:
+            self._index.remove(room.pk)
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+        self.cache.clear()
+
+
+room_autocomplete = RoomAutocomplete()
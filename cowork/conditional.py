@@ -0,0 +1,37 @@
+"""
+Conditional GET for room endpoints.
+
+Validators come from ``Room.version`` and ``Room.updated_at`` (see
+``cowork.signals``), both already on the row the view loads anyway, so a
+client whose copy is current gets a 304 before any serializer runs. The
+checks run after authentication and permission checks, so they never tell
+anyone more than the full response would.
+"""
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def room_validators(room):
+    """Returns ``(etag, last_modified)``, the latter as a Unix timestamp."""
+    # updated_at is in the ETag too because Room.save() writes back the
+    # version it loaded, which concurrent touches may have moved past.
+    etag = quote_etag(f"{room.pk}.{room.version}.{room.updated_at.timestamp():.6f}")
+    return etag, timegm(room.updated_at.utctimetuple())
+
+
+def not_modified(request, room):
+    """Returns the 304 (or 412) response for a current client copy, else None."""
+    etag, last_modified = room_validators(room)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    return with_validators(response, room) if response is not None else None
+
+
+def with_validators(response, room):
+    etag, last_modified = room_validators(room)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    # Authenticated content: shared caches must not keep it, clients revalidate
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -1,79 +1,227 @@
-import json
+import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from cowork.db import chat_db
 from cowork.models import Room, Message
+from cowork.outbound import OutboundQueue
+from cowork.persistence import message_writer
+from cowork.presence import presence
+from cowork.protocol import negotiate
+from cowork.replay import buffers_are_complete, replay_buffers
+from cowork.throttle import DROP, flood_control
 
 class ChatConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.room = None
         self.user = None
+        self.is_present = False
+        self.outbound = None
+        # A replay may run its database query, so each connection gets one
+        self.resumed = False
 
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_slug"]
         self.room_group_name = f"chat_{self.room_name}"
         self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            # Messages need an author, so anonymous sockets are turned away
+            await self.close(code=4001)
+            return
         self.room = await self.get_or_create_room(self.room_name)
-        
+        if self.room.is_private and not await self.is_member(self.room, self.user):
+            # Reject the handshake: private rooms are for members only
+            await self.close(code=4003)
+            return
+        params = parse_qs(self.scope.get("query_string", b"").decode())
+        # Clients that can handle array frames may opt into batched sends
+        batch_window = (
+            getattr(settings, "CHAT_SEND_BATCH_WINDOW_MS", 15) / 1000
+            if params.get("batch", ["0"])[0] == "1" else 0
+        )
+        self.outbound = OutboundQueue(self.send_frame, self.close_slow_consumer, batch_window=batch_window)
+        # JSON text frames unless the client offered the binary subprotocol
+        self.codec = negotiate(self.scope.get("subprotocols"))
+
         await self.channel_layer.group_add(
             self.room_group_name, self.channel_name
         )
-        
-        await self.add_user_to_room(self.room, self.user)
-        await self.accept()
+
+        presence.connect(self.room.id, self.user.id)
+        self.is_present = True
+        await self.accept(subprotocol=self.codec.subprotocol)
+        self.outbound.start()
+
+        # Reconnecting clients pass the last frame they saw:
+        # chat/<room_slug>/?last_seq=<seq>&epoch=<epoch>&since=<created_at>[&since_id=<id>]
+        if "last_seq" in params or "since" in params:
+            await self.replay(
+                params.get("last_seq", [None])[0],
+                params.get("epoch", [None])[0],
+                params.get("since", [None])[0],
+                params.get("since_id", [None])[0],
+            )
 
     async def disconnect(self, close_code):
-        await self.remove_user_from_room(self.room, self.user)
+        if self.is_present:
+            presence.disconnect(self.room.id, self.user.id)
+            self.is_present = False
         await self.channel_layer.group_discard(
             self.room_group_name, self.channel_name
         )
+        if self.outbound is not None:
+            await self.outbound.stop()
+        # Make sure nothing this client sent is still sitting in memory
+        await message_writer.flush()
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
-        username = self.user.username
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.codec.decode(text_data, bytes_data)
+        if not isinstance(text_data_json, dict):
+            self.outbound.put({"error": "invalid_message"})
+            return
+        if text_data_json.get("type") == "resume":
+            if self.resumed:
+                self.outbound.put({"error": "already_resumed"})
+                return
+            await self.replay(
+                text_data_json.get("last_seq"),
+                text_data_json.get("epoch"),
+                text_data_json.get("since"),
+                text_data_json.get("since_id"),
+            )
+            return
 
-        await self.save_message(self.room, self.user, message)
+        allowed, retry_after = await flood_control.admit(self.room.id, self.user.id)
+        if not allowed:
+            if flood_control.policy != DROP:
+                self.outbound.put({"error": "rate_limited", "retry_after": round(retry_after, 3)})
+            return
+
+        text = text_data_json.get("message")
+        if not isinstance(text, str):
+            self.outbound.put({"error": "invalid_message"})
+            return
+        # Built before anything is broadcast, so a frame that cannot be stored
+        # never reaches the room or the replay buffer
+        message = Message(room=self.room, user=self.user, message=text, created_at=timezone.now())
+
+        frame = replay_buffers.get(self.room.id).append({
+            "message": message.message,
+            "username": self.user.username,
+            "created_at": message.created_at.isoformat(),
+        })
 
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                "type": "chat_message",
-                "message": message,
-                "username": username,
-            }
+            dict(frame, type="chat_message")
         )
 
+        # Persisted in batches by the write-behind queue, off the broadcast path.
+        # The frame is already out, so if the write fails the sender is told
+        # which one will not be in the history.
+        message_writer.enqueue(message, on_dropped=lambda: self.outbound.put(
+            {"error": "not_saved", "seq": frame["seq"], "epoch": frame["epoch"]}))
+
     async def chat_message(self, event):
         message = event["message"]
         username = event["username"]
         message_html = f"{message}"
-        await self.send(
-            text_data=json.dumps(
-                {
-                    "message": message_html,
-                    "username": username
-                }
-            )
-        )
+        # Queued rather than sent inline so one slow socket cannot hold up
+        # this consumer's channel layer receive loop.
+        frame = {
+            "message": message_html,
+            "username": username,
+            "seq": event.get("seq"),
+            "epoch": event.get("epoch"),
+            "created_at": event.get("created_at"),
+        }
+        if "id" in event:
+            # Replayed from the database: resume with since_id as well
+            frame["id"] = event["id"]
+        self.outbound.put(frame)
+
+    async def send_frame(self, frame):
+        text_data, bytes_data = self.codec.encode(frame)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def close_slow_consumer(self):
+        # 1013 "try again later": the client should reconnect and resume
+        await self.close(code=1013)
+
+    async def replay(self, last_seq, epoch, since, since_id=None):
+        """
+        Sends the frames the client missed while it was disconnected, from the
+        room's ring buffer when possible and from the database otherwise. With
+        a channel layer that spans workers the buffer misses the other
+        workers' frames, so the database is always used.
+        Only the first call on a connection does anything.
+        """
+        if self.resumed:
+            return
+        self.resumed = True
+        frames = None
+        buffer = replay_buffers.get(self.room.id)
+        complete = buffers_are_complete(self.channel_layer)
+        if complete and last_seq is not None and epoch == buffer.epoch:
+            try:
+                frames = buffer.since(int(last_seq))
+            except (TypeError, ValueError):
+                frames = None
 
-    @sync_to_async
-    def save_message(self, room, user, message):
-        Message.objects.create(room=room, user=user, message=message)
+        if frames is None:
+            since = parse_datetime(since) if isinstance(since, str) else None
+            if since is None:
+                return
+            try:
+                since_id = int(since_id) if since_id is not None else None
+            except (TypeError, ValueError):
+                since_id = None
+            await message_writer.flush()
+            if not complete:
+                # Other workers write their queued messages at least this often
+                await asyncio.sleep(message_writer.flush_interval)
+            frames = await self.get_messages_since(self.room, since, since_id)
+
+        for frame in frames:
+            await self.chat_message(frame)
+
+    @chat_db
+    def get_messages_since(self, room, since, since_id=None):
+        """
+        Keyset query on ``(created_at, id)``, capped like the ring buffer is.
+        Live frames are broadcast before they are written and carry no id, so
+        without one the cursor's own timestamp is included: a message the
+        client already has may come again, but none sharing that timestamp
+        is lost.
+        """
+        if since_id is None:
+            after = Q(created_at__gte=since)
+        else:
+            after = Q(created_at__gt=since) | Q(created_at=since, id__gt=since_id)
+        messages = (
+            Message.objects.filter(after, room=room)
+            .select_related("user")
+            .order_by("created_at", "id")[:getattr(settings, "CHAT_REPLAY_DB_LIMIT", 500)]
+        )
+        return [
+            {
+                "id": message.pk,
+                "message": message.message,
+                "username": message.user.username,
+                "created_at": message.created_at.isoformat(),
+            }
+            for message in messages
+        ]
 
-    @sync_to_async
+    @chat_db
     def get_or_create_room(self, slug):
         return get_object_or_404(Room, slug=slug)
 
-    @sync_to_async
-    def add_user_to_room(self, room, user):
-        if user not in room.users.all():
-            room.users.add(user)
-            room.save()
-
-    @sync_to_async
-    def remove_user_from_room(self, room, user):
-        if user in room.users.all():
-            room.users.remove(user)
-            room.save()
+    @chat_db
+    def is_member(self, room, user):
+        return room.has_member(user)
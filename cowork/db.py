@@ -0,0 +1,55 @@
+"""
+Database access path for the real-time chat code.
+
+``sync_to_async`` defaults to thread-sensitive mode, which funnels every call
+through one shared thread, so chat traffic queues up behind (and blocks) all
+other sync work in the process. ``chat_db`` runs the consumer's queries on a
+dedicated, sized thread pool instead. Each pool thread holds its own database
+connection (Django connections are per thread), which is only closed once it
+is unusable or older than its maximum age. That age is ``CONN_MAX_AGE`` or
+``CHAT_DB_CONN_MAX_AGE``, whichever is longer: with Django's default
+``CONN_MAX_AGE`` of 0, every call would otherwise open a new connection.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "CHAT_DB_THREADS", 4),
+    thread_name_prefix="chat-db",
+)
+
+
+class ChatDatabaseSyncToAsync(SyncToAsync):
+    """
+    SyncToAsync that runs on the chat database pool and cleans up unusable
+    or expired database connections around every call.
+    """
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False, executor=_executor)
+
+    def thread_handler(self, loop, *args, **kwargs):
+        close_old_connections()
+        unopened = [conn for conn in connections.all() if conn.connection is None]
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            for conn in unopened:
+                _keep_open(conn)
+            close_old_connections()
+
+
+def _keep_open(conn):
+    """Extends a connection opened by the pool to ``CHAT_DB_CONN_MAX_AGE``."""
+    max_age = getattr(settings, "CHAT_DB_CONN_MAX_AGE", 60)
+    if conn.connection is not None and conn.close_at is not None:
+        conn.close_at = max(conn.close_at, time.monotonic() + max_age)
+
+
+# Used as a decorator, like database_sync_to_async
+chat_db = ChatDatabaseSyncToAsync
@@ -0,0 +1,246 @@
+"""
+Background thumbnails and previews for message media.
+
+When a message with media is saved its derivatives are rendered in a process
+pool (``cowork.imaging``), so decoding large images and videos never runs in a
+request or consumer thread. Every write path hands its messages to
+``schedule_on_commit``. Derivatives are keyed by the source: the blob's
+SHA-256 for uploads stored by content. A source whose derivatives already
+exist, or are being rendered, is skipped, so a file reposted in many rooms is
+rendered once.
+
+They are written under ``MEDIA_ROOT/derivatives``, a cache capped at
+``CHAT_DERIVATIVE_CACHE_BYTES``: when it grows past the cap the least recently
+used files are deleted. Each process keeps a running total of the cache size,
+adding what it renders. It walks the directory only when that total passes
+the cap, or every ``CHAT_DERIVATIVE_CACHE_RESCAN`` seconds to catch up with
+other processes. Serializers only advertise derivatives that exist, and
+asking for a missing one (never rendered, or evicted) schedules it again.
+"""
+import hashlib
+import logging
+import mimetypes
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from cowork import imaging, metrics, serving
+
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "derivatives"
+KINDS = tuple(imaging.SIZES)
+# Bump a derivative's mtime (its LRU position) at most this often
+TOUCH_INTERVAL = 3600
+# Do not retry a source that failed to render for this long
+RETRY_AFTER = 3600
+
+RENDERED = metrics.counter("chat.derivatives.rendered")
+FAILED = metrics.counter("chat.derivatives.failed")
+EVICTED = metrics.counter("chat.derivatives.evicted")
+RENDER_SECONDS = metrics.histogram("chat.derivatives.render_seconds")
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = set()
+_failed = {}
+_in_flight_lock = threading.Lock()
+# Running size of the derivatives directory; None until it has been walked
+_cache_bytes = None
+_cache_scanned_at = 0
+_cache_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, "CHAT_DERIVATIVE_WORKERS", 2),
+                # Forking a process with live DB connections and threads is unsafe
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def source_of(message):
+    """Returns ``(key, storage name, content type)`` of the message's media, or None."""
+    if message.media_blob_id:
+        blob = message.media_blob
+        content_type = blob.content_type or mimetypes.guess_type(blob.file.name)[0]
+        return blob.sha256, blob.file.name, content_type or ""
+    if message.media:
+        name = message.media.name
+        key = hashlib.sha256(name.encode()).hexdigest()
+        return key, name, mimetypes.guess_type(name)[0] or ""
+    return None
+
+
+def derivative_name(key, kind):
+    return f"{PREFIX}/{key[:2]}/{key}-{kind}.jpg"
+
+
+def urls(message):
+    """
+    Returns ``{kind: url or None}`` for the message's media (None if it has no
+    renderable media) and schedules whatever is not ready yet.
+    """
+    source = source_of(message)
+    if source is None or not imaging.can_render(source[2]):
+        return None
+    key = source[0]
+    result, missing = {}, False
+    now = time.time()
+    for kind in KINDS:
+        name = derivative_name(key, kind)
+        path = default_storage.path(name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            result[kind] = None
+            missing = True
+            continue
+        if now - mtime > TOUCH_INTERVAL:
+            os.utime(path)
+        result[kind] = serving.media_url(message.room.slug, message.pk, kind)
+    if missing:
+        schedule(message)
+    return result
+
+
+def schedule_on_commit(messages):
+    """Schedules the derivatives of saved messages once the transaction commits."""
+    messages = [message for message in messages if message.media or message.media_blob_id]
+    if messages:
+        transaction.on_commit(lambda: [schedule(message) for message in messages])
+
+
+def schedule(message):
+    """
+    Queues rendering of the message's derivatives. Returns a future, or None
+    when there is nothing to do: no renderable media, derivatives that already
+    exist, or the same source being rendered right now.
+    With ``CHAT_DERIVATIVE_WORKERS = 0`` rendering happens inline (tests, dev).
+    """
+    source = source_of(message)
+    if source is None or not imaging.can_render(source[2]):
+        return None
+    key, name, content_type = source
+    targets = {kind: default_storage.path(derivative_name(key, kind)) for kind in KINDS}
+    if all(os.path.exists(path) for path in targets.values()):
+        return None
+    with _in_flight_lock:
+        if key in _in_flight or time.time() - _failed.get(key, 0) < RETRY_AFTER:
+            return None
+        _in_flight.add(key)
+
+    try:
+        path, cleanup = _local_copy(name)
+    except Exception:
+        _finish(key, None)
+        logger.exception("Cannot read media %s for derivatives", name)
+        FAILED.inc()
+        return None
+
+    started = time.perf_counter()
+
+    def done(future):
+        if cleanup:
+            os.remove(path)
+        _finish(key, future, started)
+
+    if not getattr(settings, "CHAT_DERIVATIVE_WORKERS", 2):
+        future = Future()
+        try:
+            future.set_result(imaging.render(path, content_type, targets))
+        except Exception as e:
+            future.set_exception(e)
+        done(future)
+        return future
+
+    future = _executor().submit(imaging.render, path, content_type, targets)
+    future.add_done_callback(done)
+    return future
+
+
+def _local_copy(name):
+    """Pool processes need a file path; remote storages are copied to a temp file."""
+    try:
+        return default_storage.path(name), False
+    except NotImplementedError:
+        with default_storage.open(name, "rb") as src, \
+                tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(name)[1]) as dst:
+            for chunk in iter(lambda: src.read(64 * 1024), b""):
+                dst.write(chunk)
+        return dst.name, True
+
+
+def _finish(key, future, started=None):
+    with _in_flight_lock:
+        _in_flight.discard(key)
+        if future is None or future.exception() is not None:
+            if len(_failed) > 10000:
+                _failed.clear()
+            _failed[key] = time.time()
+    if future is None:
+        return
+    if future.exception() is not None:
+        FAILED.inc()
+        logger.error("Rendering derivatives for %s failed", key, exc_info=future.exception())
+        return
+    RENDERED.inc()
+    RENDER_SECONDS.observe(time.perf_counter() - started)
+    _account(sum(future.result().values()))
+
+
+def _max_bytes():
+    return getattr(settings, "CHAT_DERIVATIVE_CACHE_BYTES", 512 * 1024 ** 2)
+
+
+def _account(added):
+    """Adds newly rendered bytes to the running total, evicting when it is over the cap."""
+    global _cache_bytes
+    rescan = getattr(settings, "CHAT_DERIVATIVE_CACHE_RESCAN", 3600)
+    with _cache_lock:
+        fresh = _cache_bytes is not None and time.time() - _cache_scanned_at < rescan
+        if fresh:
+            _cache_bytes += added
+            if _cache_bytes <= _max_bytes():
+                return
+    enforce_cache_limit()
+
+
+def enforce_cache_limit(max_bytes=None):
+    """Deletes the least recently used derivatives until the cache fits."""
+    global _cache_bytes, _cache_scanned_at
+    max_bytes = max_bytes if max_bytes is not None else _max_bytes()
+    root = default_storage.path(PREFIX)
+    files = []
+    for directory, _, names in os.walk(root):
+        for filename in names:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        EVICTED.inc()
+    with _cache_lock:
+        _cache_bytes, _cache_scanned_at = total, time.time()
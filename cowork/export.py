@@ -0,0 +1,52 @@
+"""
+Streaming NDJSON export of a room's message history.
+
+Rows are read through ``QuerySet.iterator(chunk_size=...)`` (a server-side
+cursor on PostgreSQL, ``fetchmany`` batches elsewhere) as plain tuples and
+written out as they arrive, so memory use depends on the chunk size and not on
+the size of the room. Under ASGI the view fetches the chunks one at a time
+through ``cowork.streaming``. One line per message, oldest first::
+
+    {"id": 1, "user": "ada", "message": "hi", "media": null, "created_at": "..."}
+"""
+import json
+
+from django.conf import settings
+
+from cowork.models import Message
+from cowork.serving import media_url
+
+
+FIELDS = ("id", "room__slug", "user__username", "message", "media", "media_blob_id", "created_at")
+
+
+def export_queryset(room, since=None, until=None, username=None):
+    messages = Message.objects.filter(room=room)
+    if since is not None:
+        messages = messages.filter(created_at__gte=since)
+    if until is not None:
+        messages = messages.filter(created_at__lt=until)
+    if username:
+        messages = messages.filter(user__username=username)
+    return messages.order_by("created_at", "id").values_list(*FIELDS)
+
+
+def iter_ndjson(queryset, chunk_size=None):
+    """Yields the export a few hundred lines at a time."""
+    chunk_size = chunk_size or getattr(settings, "CHAT_EXPORT_CHUNK_SIZE", 2000)
+    lines = []
+    for pk, room_slug, username, message, media, blob_id, created_at in queryset.iterator(chunk_size=chunk_size):
+        lines.append(json.dumps({
+            "id": pk,
+            "user": username,
+            "message": message,
+            "media": media_url(room_slug, pk) if media or blob_id else None,
+            "created_at": created_at.isoformat(),
+        }))
+        if len(lines) >= 500:
+            lines.append("")
+            yield "\n".join(lines)
+            lines = []
+    if lines:
+        lines.append("")
+        yield "\n".join(lines)
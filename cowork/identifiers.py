@@ -0,0 +1,123 @@
+"""
+Time-ordered unique IDs for rooms.
+
+IDs are 63-bit integers laid out like Twitter's Snowflake:
+
+    41 bits  milliseconds since ``EPOCH_MS``
+    10 bits  worker
+    12 bits  sequence within the millisecond
+
+Two IDs only collide if they were made by the same worker in the same
+millisecond with the same sequence number, and one generator never does
+that, so uniqueness needs no database round trip as long as no two processes
+share a worker number. Set ``CHAT_ID_WORKER`` (0-1023) to a distinct value
+per process to guarantee that across hosts. Otherwise each process claims
+the first free worker number, starting from a hash of the host name, by
+locking a file in ``CHAT_ID_WORKER_DIR``. That is unique among the processes
+of one host; processes on different hosts may still pick the same number,
+and the unique constraint on the column storing the ID (see ``Room.save``)
+catches what slips through. Without ``fcntl`` (Windows) the number is a hash
+of the host name and pid.
+
+If the clock steps backwards the generator keeps counting from the last
+timestamp it used instead of going back with it.
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class IdGenerator:
+    def __init__(self, worker=None, clock=time.time):
+        self._worker = worker
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pid = None
+        self._claim = None
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _worker_id(self):
+        worker = self._worker
+        if worker is None:
+            worker = getattr(settings, "CHAT_ID_WORKER", None)
+        if worker is None and fcntl is not None:
+            worker, self._claim = _claim_worker(zlib.crc32(socket.gethostname().encode()))
+        if worker is None:
+            worker = zlib.crc32(f"{socket.gethostname()}:{os.getpid()}".encode())
+        return worker & MAX_WORKER
+
+    def next(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # New process (or forked from one that already made IDs)
+                self._pid = os.getpid()
+                self._worker_bits = self._worker_id() << SEQUENCE_BITS
+            now = max(int(self._clock() * 1000) - EPOCH_MS, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 IDs this millisecond already: borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | self._worker_bits | self._sequence
+
+
+def _claim_worker(start):
+    """
+    Locks the first free worker number from ``start`` on and returns it with
+    the open lock file, which holds the claim until the process exits.
+    """
+    directory = getattr(settings, "CHAT_ID_WORKER_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "coloby-id-workers")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    for offset in range(MAX_WORKER + 1):
+        worker = (start + offset) & MAX_WORKER
+        handle = open(os.path.join(directory, f"{worker}.lock"), "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            continue
+        return worker, handle
+    raise RuntimeError(f"All {MAX_WORKER + 1} ID workers in {directory} are taken; set CHAT_ID_WORKER.")
+
+
+def base36(number):
+    digits = []
+    while True:
+        number, remainder = divmod(number, 36)
+        digits.append(_DIGITS[remainder])
+        if not number:
+            return "".join(reversed(digits))
+
+
+room_ids = IdGenerator()
+
+
+def room_slug(name, max_length=50):
+    """``<slugified name>-<unique id>``, truncated to fit ``max_length``."""
+    suffix = base36(room_ids.next())
+    prefix = slugify(name)[:max_length - len(suffix) - 1].strip("-")
+    return f"{prefix}-{suffix}" if prefix else suffix
@@ -0,0 +1,65 @@
+"""
+Renders media derivatives. Runs in the derivative process pool, so this module
+must not import Django (pool processes are spawned without app setup).
+
+Images are decoded with Pillow. Videos (first frame) and PDFs (first page) are
+rasterised by ``ffmpeg`` and ``pdftoppm`` when installed. Anything else has
+no derivatives.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageOps
+
+
+# name -> longest edge in pixels
+SIZES = {"thumbnail": 320, "preview": 1280}
+
+
+def can_render(content_type):
+    if content_type.startswith("image/"):
+        return True
+    if content_type.startswith("video/"):
+        return shutil.which("ffmpeg") is not None
+    if content_type == "application/pdf":
+        return shutil.which("pdftoppm") is not None
+    return False
+
+
+def _rasterise(source, content_type, workdir):
+    """Returns the path of an image Pillow can open for the source's first page or frame."""
+    if content_type.startswith("image/"):
+        return source
+    target = os.path.join(workdir, "frame.png")
+    if content_type.startswith("video/"):
+        subprocess.run(
+            ["ffmpeg", "-loglevel", "error", "-y", "-i", source, "-frames:v", "1", target],
+            check=True, timeout=60)
+        return target
+    subprocess.run(
+        ["pdftoppm", "-f", "1", "-l", "1", "-png", "-singlefile", source, target[:-len(".png")]],
+        check=True, timeout=60)
+    return target
+
+
+def render(source, content_type, targets):
+    """
+    Writes a JPEG per ``{kind: path}`` in ``targets`` and returns
+    ``{kind: bytes written}``. Files appear atomically (write then rename).
+    """
+    written = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        with Image.open(_rasterise(source, content_type, workdir)) as image:
+            image.seek(0)
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            for kind, path in targets.items():
+                copy = image.copy()
+                copy.thumbnail((SIZES[kind], SIZES[kind]))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                partial = f"{path}.{os.getpid()}.tmp"
+                copy.save(partial, "JPEG", quality=80, optimize=True)
+                os.replace(partial, path)
+                written[kind] = os.path.getsize(path)
+    return written
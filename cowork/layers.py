@@ -0,0 +1,220 @@
+"""
+A channel layer that spans several worker processes on one host without Redis.
+
+Every process keeps its own channels and group memberships in memory (exactly
+like ``InMemoryChannelLayer``) and listens on a Unix domain socket in
+``socket_dir``. Group membership is therefore sharded by process: each worker
+only knows which of *its* channels belong to a group. ``group_send`` delivers to
+the local members and forwards the event once to every other worker, which in
+turn delivers it to its own members. Process-specific channel names embed the
+owning worker id, so ``send`` to a channel that lives elsewhere is routed
+straight to that worker.
+
+Enable it with::
+
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "cowork.layers.UnixSocketChannelLayer",
+            "CONFIG": {"socket_dir": "/run/coloby/channels"},
+        }
+    }
+
+Every daphne worker on the host must point at the same ``socket_dir``.
+"""
+import asyncio
+import errno
+import logging
+import os
+import random
+import string
+import struct
+import tempfile
+import time
+import uuid
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+def _pack(payload):
+    body = msgpack.packb(payload, use_bin_type=True)
+    return _HEADER.pack(len(body)) + body
+
+
+async def _read_frame(reader):
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return msgpack.unpackb(await reader.readexactly(length), raw=False)
+
+
+class UnixSocketChannelLayer(InMemoryChannelLayer):
+    """
+    In-memory channel layer whose groups fan out to sibling worker processes
+    over Unix domain sockets.
+
+    Messages forwarded to another worker are fire-and-forget: if the remote
+    channel is full the message is dropped there, which matches what
+    ``group_send`` already does for local channels.
+    """
+
+    def __init__(self, socket_dir=None, peer_refresh_interval=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.socket_dir = socket_dir or os.path.join(tempfile.gettempdir(), "coloby-channels")
+        self.peer_refresh_interval = peer_refresh_interval
+        self.worker_id = "%d-%s" % (os.getpid(), uuid.uuid4().hex[:8])
+        self.socket_path = os.path.join(self.socket_dir, self.worker_id + ".sock")
+        self._server = None
+        self._loop = None
+        self._writers = {}
+        self._connect_lock = None
+        self._peer_ids = []
+        self._peers_checked_at = 0.0
+
+    # Channel layer API
+
+    async def new_channel(self, prefix="specific."):
+        await self._ensure_server()
+        return "%s.%s!%s" % (
+            prefix,
+            self.worker_id,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    async def send(self, channel, message):
+        owner = self._owner_of(channel)
+        if owner is None or owner == self.worker_id:
+            await super().send(channel, message)
+        else:
+            assert isinstance(message, dict), "message is not a dict"
+            assert self.valid_channel_name(channel), "Channel name not valid"
+            await self._send_to_peer(owner, {"op": "send", "channel": channel, "message": message})
+
+    async def group_add(self, group, channel):
+        await self._ensure_server()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group, message):
+        await super().group_send(group, message)
+        frame = _pack({"op": "group", "group": group, "message": message})
+        peers = self._peers()
+        if peers:
+            await asyncio.gather(*(self._send_to_peer(peer, frame) for peer in peers))
+
+    async def close(self):
+        writers, self._writers = list(self._writers.values()), {}
+        for writer in writers:
+            writer.close()
+        # Closing only completes once buffered frames have been flushed
+        for writer in writers:
+            await writer.wait_closed()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            self._unlink(self.socket_path)
+
+    # Local server
+
+    async def _ensure_server(self):
+        loop = asyncio.get_running_loop()
+        if self._server is not None and self._loop is loop:
+            return
+        os.makedirs(self.socket_dir, mode=0o700, exist_ok=True)
+        self._unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_peer, path=self.socket_path)
+        self._loop = loop
+        self._writers = {}
+        self._connect_lock = asyncio.Lock()
+
+    async def _handle_peer(self, reader, writer):
+        try:
+            while True:
+                frame = await _read_frame(reader)
+                try:
+                    if frame["op"] == "group":
+                        await InMemoryChannelLayer.group_send(self, frame["group"], frame["message"])
+                    elif frame["op"] == "send":
+                        await InMemoryChannelLayer.send(self, frame["channel"], frame["message"])
+                except ChannelFull:
+                    logger.warning("Dropping message for full channel %s", frame.get("channel"))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    # Peers
+
+    def _owner_of(self, channel):
+        if "!" not in channel:
+            return None
+        return channel[:channel.index("!")].rsplit(".", 1)[-1]
+
+    def _peers(self):
+        now = time.monotonic()
+        if now - self._peers_checked_at >= self.peer_refresh_interval:
+            try:
+                names = os.listdir(self.socket_dir)
+            except FileNotFoundError:
+                names = []
+            self._peer_ids = [
+                name[:-len(".sock")] for name in names
+                if name.endswith(".sock") and name[:-len(".sock")] != self.worker_id
+            ]
+            self._peers_checked_at = now
+        return self._peer_ids
+
+    async def _send_to_peer(self, peer, frame):
+        if isinstance(frame, dict):
+            frame = _pack(frame)
+        path = os.path.join(self.socket_dir, peer + ".sock")
+        own_loop = asyncio.get_running_loop() is self._loop
+        try:
+            if own_loop:
+                writer = await self._writer_for(peer, path)
+                writer.write(frame)
+                await writer.drain()
+            else:
+                # Called from a foreign loop (e.g. async_to_sync in a view):
+                # use a one-off connection instead of the cached ones.
+                _, writer = await asyncio.open_unix_connection(path)
+                writer.write(frame)
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+        except (ConnectionError, FileNotFoundError, OSError) as exc:
+            self._forget_peer(peer, path, exc, own_loop)
+
+    async def _writer_for(self, peer, path):
+        writer = self._writers.get(peer)
+        if writer is not None and not writer.is_closing():
+            return writer
+        async with self._connect_lock:
+            writer = self._writers.get(peer)
+            if writer is None or writer.is_closing():
+                _, writer = await asyncio.open_unix_connection(path)
+                self._writers[peer] = writer
+        return writer
+
+    def _forget_peer(self, peer, path, exc, own_loop):
+        if own_loop:
+            writer = self._writers.pop(peer, None)
+            if writer is not None:
+                writer.close()
+        if peer in self._peer_ids:
+            self._peer_ids.remove(peer)
+        # Nobody is listening on the socket any more: the worker is gone.
+        if isinstance(exc, ConnectionRefusedError) or getattr(exc, "errno", None) == errno.ECONNREFUSED:
+            self._unlink(path)
+        logger.info("Lost channel layer peer %s: %s", peer, exc)
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
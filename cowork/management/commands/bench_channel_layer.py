@@ -0,0 +1,93 @@
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from cowork.layers import UnixSocketChannelLayer
+
+
+GROUP = "chat_bench"
+
+
+def _worker(socket_dir, members, messages, ready, results):
+    asyncio.run(_worker_main(socket_dir, members, messages, ready, results))
+
+
+async def _worker_main(socket_dir, members, messages, ready, results):
+    layer = UnixSocketChannelLayer(socket_dir=socket_dir, capacity=messages + 1)
+    channels = [await layer.new_channel() for _ in range(members)]
+    for channel in channels:
+        await layer.group_add(GROUP, channel)
+    ready.set()
+
+    async def drain(channel):
+        for _ in range(messages):
+            await layer.receive(channel)
+
+    await asyncio.gather(*(drain(channel) for channel in channels))
+    results.put(time.monotonic())
+    await layer.close()
+
+
+async def _publish(socket_dir, messages):
+    layer = UnixSocketChannelLayer(socket_dir=socket_dir)
+    # Join the mesh like a real worker so frames go over cached connections
+    await layer.new_channel()
+    start = time.monotonic()
+    for i in range(messages):
+        await layer.group_send(GROUP, {"type": "chat_message", "message": f"bench {i}", "username": "bench"})
+    await layer.close()
+    return start
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks group fan-out of the Unix socket channel layer across a growing "
+        "number of worker processes. Prints one JSON object per worker count."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", default="1,2,4,8",
+                            help="Comma separated worker process counts to measure.")
+        parser.add_argument("--members", type=int, default=50,
+                            help="Group members (sockets) per worker process.")
+        parser.add_argument("--messages", type=int, default=500,
+                            help="group_send calls per run.")
+
+    def handle(self, *args, **options):
+        for workers in [int(n) for n in options["workers"].split(",")]:
+            result = self.run_once(workers, options["members"], options["messages"])
+            self.stdout.write(json.dumps(result))
+
+    def run_once(self, workers, members, messages):
+        ctx = multiprocessing.get_context("spawn")
+        results = ctx.Queue()
+        with tempfile.TemporaryDirectory(prefix="coloby-bench-") as socket_dir:
+            readies, procs = [], []
+            for _ in range(workers):
+                ready = ctx.Event()
+                proc = ctx.Process(target=_worker, args=(socket_dir, members, messages, ready, results))
+                proc.start()
+                readies.append(ready)
+                procs.append(proc)
+            for ready in readies:
+                ready.wait()
+
+            start = asyncio.run(_publish(socket_dir, messages))
+            finished = max(results.get() for _ in procs)
+            for proc in procs:
+                proc.join()
+
+        elapsed = finished - start
+        deliveries = workers * members * messages
+        return {
+            "workers": workers,
+            "members_per_worker": members,
+            "messages": messages,
+            "deliveries": deliveries,
+            "seconds": round(elapsed, 4),
+            "deliveries_per_second": round(deliveries / elapsed, 1) if elapsed else None,
+        }
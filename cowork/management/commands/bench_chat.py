@@ -0,0 +1,330 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+
+from cowork import metrics
+from cowork.models import Room
+from cowork.routing import websocket_urlpatterns
+from cowork.throttle import flood_control
+
+
+User = get_user_model()
+
+BENCH_PREFIX = "bench-"
+# Fixture users get addresses here, which no real account can have
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {}
+
+    def pick(pct):
+        return round(samples[min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))] * 1000, 3)
+
+    return {"p50_ms": pick(50), "p90_ms": pick(90), "p99_ms": pick(99), "max_ms": pick(100)}
+
+
+class CommunicatorClient:
+    """Drives ChatConsumer in-process through channels' WebsocketCommunicator."""
+
+    def __init__(self, room_slug, user, query):
+        self.communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/chat/{room_slug}/{query}")
+        self.communicator.scope["user"] = user
+
+    async def connect(self):
+        connected, _ = await self.communicator.connect(timeout=30)
+        if not connected:
+            raise ConnectionError("Connection rejected")
+
+    async def send(self, text):
+        await self.communicator.send_to(text_data=text)
+
+    async def receive(self, timeout):
+        return await self.communicator.receive_from(timeout=timeout)
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class DaphneClient:
+    """
+    A minimal RFC 6455 client over asyncio streams. autobahn cannot be used
+    here because daphne has already pinned txaio to Twisted in this process.
+    """
+
+    def __init__(self, host, port, room_slug, session_key, query):
+        self.host, self.port = host, port
+        self.path = f"/chat/{room_slug}/{query}"
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={session_key}"
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.writer.write((
+            f"GET {self.path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n"
+            f"Cookie: {self.cookie}\r\n\r\n"
+        ).encode())
+        response = await asyncio.wait_for(self.reader.readuntil(b"\r\n\r\n"), 30)
+        if not response.startswith(b"HTTP/1.1 101"):
+            raise ConnectionError(response.split(b"\r\n", 1)[0].decode())
+
+    async def send(self, text):
+        payload = text.encode()
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x81, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x81, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x81, 0x80 | 127, length)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.writer.write(header + mask + masked)
+        await self.writer.drain()
+
+    async def receive(self, timeout):
+        return await asyncio.wait_for(self._read_message(), timeout)
+
+    async def _read_message(self):
+        while True:
+            first, second = await self.reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+            payload = await self.reader.readexactly(length)
+            opcode = first & 0x0F
+            if opcode == 0x1:
+                return payload.decode()
+            if opcode == 0x2:
+                return payload
+            if opcode == 0x8:
+                raise ConnectionError("Server closed the connection")
+
+    async def close(self):
+        self.writer.write(struct.pack("!BB", 0x88, 0x80) + os.urandom(4))
+        self.writer.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-generates chat traffic against ChatConsumer, either in-process "
+        "(WebsocketCommunicator) or through a real daphne server on localhost, and "
+        "prints connect rate, end-to-end latency percentiles and throughput as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=["communicator", "daphne"], default="communicator")
+        parser.add_argument("--connections", type=int, default=1000)
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--senders-per-room", type=int, default=5)
+        parser.add_argument("--messages", type=int, default=20, help="Messages per sender.")
+        parser.add_argument("--interval", type=float, default=0.05, help="Seconds between a sender's messages.")
+        parser.add_argument("--connect-concurrency", type=int, default=100)
+        parser.add_argument("--batch", action="store_true", help="Connect with ?batch=1.")
+        parser.add_argument("--throttle", action="store_true",
+                            help="Keep the configured flood control limits (lifted by default).")
+        parser.add_argument("--port", type=int, default=0, help="daphne port (default: pick a free one).")
+        parser.add_argument("--timeout", type=float, default=60)
+        parser.add_argument("--output", help="Also write the JSON result to this file.")
+        parser.add_argument("--keep", action="store_true", help="Keep the bench users and rooms.")
+
+    def handle(self, *args, **options):
+        users, rooms = self.setup_fixtures(options["connections"], options["rooms"])
+        server = None
+        if not options["throttle"]:
+            # Senders go well past the per-user rate by design
+            flood_control.user_rate = flood_control.room_rate = 1e9
+            flood_control.user_burst = flood_control.room_burst = 1e9
+        try:
+            if options["mode"] == "daphne":
+                server, options["port"] = self.start_daphne(options["port"], options["throttle"])
+            result = asyncio.run(self.run(users, rooms, options))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            if not options["keep"]:
+                self.teardown_fixtures()
+
+        output = json.dumps(result)
+        self.stdout.write(output)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+
+    # Fixtures
+
+    def setup_fixtures(self, connections, rooms):
+        """
+        Creates this run's users and rooms and remembers their ids, so that
+        teardown deletes exactly these and never real rows that happen to
+        look alike (a user "bench-alice", a room slugged "bench-press-...").
+        """
+        run = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create([
+            User(username=f"{BENCH_PREFIX}{run}-{i}", email=f"{BENCH_PREFIX}{run}-{i}@{BENCH_EMAIL_DOMAIN}",
+                 first_name="Bench")
+            for i in range(connections)
+        ])
+        room_list = Room.objects.bulk_create([
+            Room(name=f"Bench room {i}", slug=f"{BENCH_PREFIX}{run}-{i}") for i in range(rooms)
+        ])
+        self.fixture_user_ids = [user.pk for user in users]
+        self.fixture_room_ids = [room.pk for room in room_list]
+        return users, room_list
+
+    def teardown_fixtures(self):
+        Room.objects.filter(pk__in=self.fixture_room_ids).delete()
+        User.objects.filter(pk__in=self.fixture_user_ids, email__endswith=f"@{BENCH_EMAIL_DOMAIN}").delete()
+
+    def session_key(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def start_daphne(self, port, throttle):
+        if not port:
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                port = sock.getsockname()[1]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "coloby.settings"))
+        if not throttle:
+            env.update(CHAT_USER_RATE="1e9", CHAT_USER_BURST="1000000000",
+                       CHAT_ROOM_RATE="1e9", CHAT_ROOM_BURST="1000000000")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "daphne", "-b", "127.0.0.1", "-p", str(port), "coloby.asgi:application"],
+            env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return server, port
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise RuntimeError("daphne did not start listening")
+
+    # Load
+
+    async def run(self, users, rooms, options):
+        query = "?batch=1" if options["batch"] else ""
+        if options["mode"] == "daphne":
+            keys = await sync_to_async(lambda: [self.session_key(user) for user in users])()
+            clients = [
+                DaphneClient("127.0.0.1", options["port"], rooms[i % len(rooms)].slug, keys[i], query)
+                for i in range(len(users))
+            ]
+        else:
+            clients = [
+                CommunicatorClient(rooms[i % len(rooms)].slug, users[i], query) for i in range(len(users))
+            ]
+        room_of = [i % len(rooms) for i in range(len(clients))]
+
+        # Connect phase
+        semaphore = asyncio.Semaphore(options["connect_concurrency"])
+
+        async def connect(client):
+            async with semaphore:
+                await client.connect()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connect(client) for client in clients))
+        connect_seconds = time.perf_counter() - start
+
+        # Message phase: the first N clients of every room are senders
+        senders, seen = [], {}
+        for index, room in enumerate(room_of):
+            if seen.get(room, 0) < options["senders_per_room"]:
+                senders.append(index)
+                seen[room] = seen.get(room, 0) + 1
+        members = {room: room_of.count(room) for room in set(room_of)}
+        expected = sum(members[room_of[i]] for i in senders) * options["messages"]
+
+        latencies = []
+        delivered = 0
+        done = asyncio.Event()
+
+        async def listen(client):
+            nonlocal delivered
+            while not done.is_set():
+                try:
+                    data = await client.receive(timeout=options["timeout"])
+                except asyncio.TimeoutError:
+                    return
+                now = time.perf_counter()
+                frames = json.loads(data)
+                for frame in frames if isinstance(frames, list) else [frames]:
+                    text = frame.get("message") or ""
+                    if text.startswith("bench:"):
+                        latencies.append(now - float(text.split(":", 1)[1]))
+                        delivered += 1
+                if delivered >= expected:
+                    done.set()
+
+        async def send(client):
+            for _ in range(options["messages"]):
+                await client.send(json.dumps({"message": f"bench:{time.perf_counter()!r}"}))
+                await asyncio.sleep(options["interval"])
+
+        listeners = [asyncio.ensure_future(listen(client)) for client in clients]
+        start = time.perf_counter()
+        await asyncio.gather(*(send(clients[i]) for i in senders))
+        try:
+            await asyncio.wait_for(done.wait(), options["timeout"])
+        except asyncio.TimeoutError:
+            pass
+        message_seconds = time.perf_counter() - start
+        done.set()
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+        result = {
+            "mode": options["mode"],
+            "batch": options["batch"],
+            "throttle": options["throttle"],
+            "connections": len(clients),
+            "rooms": len(rooms),
+            "connect_seconds": round(connect_seconds, 4),
+            "connects_per_second": round(len(clients) / connect_seconds, 1) if connect_seconds else None,
+            "messages_sent": len(senders) * options["messages"],
+            "deliveries_expected": expected,
+            "deliveries": delivered,
+            "delivery_seconds": round(message_seconds, 4),
+            "deliveries_per_second": round(delivered / message_seconds, 1) if message_seconds else None,
+            "latency": _percentiles(latencies),
+        }
+        if options["mode"] == "communicator":
+            result["server_metrics"] = metrics.snapshot()
+        return result
@@ -0,0 +1,74 @@
+import json
+import random
+import string
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cowork.protocol import JSONCodec, MsgpackCodec
+from cowork.replay import RoomReplayBuffer
+
+
+def _frames(count, senders):
+    buffer = RoomReplayBuffer(size=count)
+    usernames = ["user_%s" % "".join(random.choices(string.ascii_lowercase, k=8)) for _ in range(senders)]
+    return [
+        buffer.append({
+            "message": "".join(random.choices(string.ascii_letters + " ", k=random.randint(10, 120))),
+            "username": random.choice(usernames),
+            "created_at": timezone.now().isoformat(),
+        })
+        for _ in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the JSON and MessagePack chat protocols for one room: bytes on the "
+        "wire and encode/decode CPU time for fanning each message out to every member."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=500, help="Sockets in the room.")
+        parser.add_argument("--messages", type=int, default=200, help="Messages sent to the room.")
+        parser.add_argument("--senders", type=int, default=50, help="Distinct users sending them.")
+
+    def handle(self, *args, **options):
+        frames = _frames(options["messages"], options["senders"])
+        results = [
+            self.measure("json", JSONCodec, json.loads, frames, options["members"]),
+            self.measure("msgpack", MsgpackCodec, msgpack.unpackb, frames, options["members"]),
+        ]
+        for result in results:
+            self.stdout.write(json.dumps(result))
+
+    def measure(self, name, codec_class, client_decode, frames, members):
+        # Every member has its own codec (user interning is per connection)
+        codecs = [codec_class() for _ in range(members)]
+        wire = []
+
+        start = time.process_time()
+        for frame in frames:
+            for codec in codecs:
+                text_data, bytes_data = codec.encode(frame)
+                wire.append(bytes_data if bytes_data is not None else text_data.encode())
+        encode_seconds = time.process_time() - start
+
+        start = time.process_time()
+        for data in wire:
+            client_decode(data)
+        decode_seconds = time.process_time() - start
+
+        total_bytes = sum(len(data) for data in wire)
+        return {
+            "protocol": name,
+            "members": members,
+            "messages": len(frames),
+            "frames_sent": len(wire),
+            "bytes_on_wire": total_bytes,
+            "bytes_per_frame": round(total_bytes / len(wire), 1),
+            "encode_cpu_seconds": round(encode_seconds, 4),
+            "decode_cpu_seconds": round(decode_seconds, 4),
+        }
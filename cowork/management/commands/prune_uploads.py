@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cowork import uploads
+from cowork.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes resumable uploads that have not received a chunk for "
+        "CHAT_UPLOAD_EXPIRY_HOURS, together with their partial files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=None,
+                            help="Override CHAT_UPLOAD_EXPIRY_HOURS.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        hours = options["hours"] or getattr(settings, "CHAT_UPLOAD_EXPIRY_HOURS", 24)
+        stale = UploadSession.objects.filter(
+            blob__isnull=True, updated_at__lt=timezone.now() - timedelta(hours=hours))
+        count = 0
+        for session in stale.iterator():
+            count += 1
+            if not options["dry_run"]:
+                uploads.discard(session)
+        self.stdout.write(f"{'Would delete' if options['dry_run'] else 'Deleted'} {count} stale uploads.")
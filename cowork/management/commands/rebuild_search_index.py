@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cowork import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the full-text search index of rooms, messages, tasks and "
+        "comments from scratch. Normally the index is kept current as objects "
+        "change; run this after upgrading or restoring a database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = search.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(f"Indexed {total} documents ({search.backend()}).")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from cowork.models import Room
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts Room.likes and fixes rooms whose denormalized like_count has "
+        "drifted (likes changed outside Room.toggle_like)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        likes = (
+            Room.likes.through.objects.filter(room_id=OuterRef("pk"))
+            .order_by().values("room_id").annotate(total=Count("*")).values("total")
+        )
+        drifted = (
+            Room.objects.annotate(actual=Coalesce(Subquery(likes, output_field=IntegerField()), 0))
+            .exclude(like_count=F("actual"))
+            .values_list("pk", "like_count", "actual")
+        )
+        count = 0
+        for pk, stored, actual in drifted.iterator():
+            count += 1
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Room {pk}: {stored} -> {actual}")
+            if not options["dry_run"]:
+                Room.objects.filter(pk=pk).update(
+                    like_count=actual, version=F("version") + 1, updated_at=timezone.now())
+        self.stdout.write(f"{'Would fix' if options['dry_run'] else 'Fixed'} {count} like counts.")
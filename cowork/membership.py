@@ -0,0 +1,82 @@
+"""
+Per-process cache of room membership answers, used by ``Room.has_member``.
+
+A miss costs one EXISTS query on the room/user through table, whose unique
+(room, user) index makes it the same price for a room of ten members as for a
+room of ten thousand. Answers, positive and negative, are kept for
+``CHAT_MEMBERSHIP_CACHE_TTL`` seconds in a bounded LRU of
+``CHAT_MEMBERSHIP_CACHE_SIZE`` entries.
+
+``m2m_changed`` on ``Room.users`` (cowork.signals) drops the affected entries
+in the process that made the change. Other workers only see it once their
+entry expires, so the TTL bounds how stale a membership answer can be.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from cowork import metrics
+
+
+HITS = metrics.counter("chat.membership.hits")
+MISSES = metrics.counter("chat.membership.misses")
+
+
+class MembershipCache:
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries or getattr(settings, "CHAT_MEMBERSHIP_CACHE_SIZE", 10000)
+        self.ttl = ttl if ttl is not None else getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 30)
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a lookup that raced one is not stored
+        self._generation = 0
+
+    def get(self, room_id, user_id, lookup):
+        """Returns the cached answer for (room, user), or calls ``lookup()`` for it."""
+        key = (room_id, user_id)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                HITS.inc()
+                return entry[0]
+            generation = self._generation
+        MISSES.inc()
+
+        is_member = lookup()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (is_member, now + self.ttl)
+                self._entries.move_to_end(key)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return is_member
+
+    def invalidate(self, room_ids=None, user_ids=None):
+        """
+        Forgets the answers for the given rooms and/or users: both given means
+        their pairs, one given means everything about those rooms (or users).
+        """
+        with self._lock:
+            self._generation += 1
+            if room_ids is not None and user_ids is not None:
+                for room_id in room_ids:
+                    for user_id in user_ids:
+                        self._entries.pop((room_id, user_id), None)
+                return
+            rooms = set(room_ids or ())
+            users = set(user_ids or ())
+            for key in [key for key in self._entries if key[0] in rooms or key[1] in users]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+memberships = MembershipCache()
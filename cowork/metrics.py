@@ -0,0 +1,152 @@
+"""
+Lightweight in-process metrics for the real-time chat path.
+
+Counters, gauges and histograms are registered by name the first time they are
+requested and live for the lifetime of the worker process. ``snapshot()`` returns
+a JSON-serializable view of every metric, which is what the metrics endpoint
+exposes to staff users.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Counter:
+    """A monotonically increasing value, e.g. number of frames flushed."""
+
+    def __init__(self, name):
+        self.name = name
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return {"type": "counter", "value": self._value}
+
+
+class Gauge:
+    """A value that can go up and down, e.g. current queue depth."""
+
+    def __init__(self, name):
+        self.name = name
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return {"type": "gauge", "value": self._value}
+
+
+class Histogram:
+    """
+    Tracks a distribution of observations (usually durations in seconds).
+
+    Only the most recent ``reservoir_size`` observations are kept for the
+    percentile calculation, so memory stays bounded on long-running workers.
+    """
+
+    def __init__(self, name, reservoir_size=2048):
+        self.name = name
+        self._samples = deque(maxlen=reservoir_size)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self._samples.append(value)
+            self._count += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self):
+        return self._count
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        return _pick(samples, pct)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self._count, self._sum
+
+        return {
+            "type": "histogram",
+            "count": count,
+            "sum": total,
+            "p50": _pick(samples, 50),
+            "p90": _pick(samples, 90),
+            "p99": _pick(samples, 99),
+            "max": samples[-1] if samples else None,
+        }
+
+
+def _pick(samples, pct):
+    """Nearest-rank percentile over an already sorted list."""
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))]
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(name, metric_class):
+    metric = _registry.get(name)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.setdefault(name, metric_class(name))
+    if not isinstance(metric, metric_class):
+        raise TypeError(f"Metric {name!r} is already registered as a {type(metric).__name__}.")
+    return metric
+
+
+def counter(name):
+    return _get_or_create(name, Counter)
+
+
+def gauge(name):
+    return _get_or_create(name, Gauge)
+
+
+def histogram(name):
+    return _get_or_create(name, Histogram)
+
+
+def snapshot():
+    """Returns the current value of every registered metric, keyed by name."""
+    return {name: metric.snapshot() for name, metric in sorted(_registry.items())}
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0002_alter_message_created_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'created_at', 'id'], name='message_room_created_id'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:21
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_likes(apps, schema_editor):
+    Room = apps.get_model('cowork', 'Room')
+    likes = (
+        Room.likes.through.objects.filter(room_id=OuterRef('pk'))
+        .order_by().values('room_id').annotate(total=Count('*')).values('total')
+    )
+    Room.objects.update(like_count=Coalesce(Subquery(likes, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0005_media_blobs_and_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_likes, migrations.RunPython.noop),
+    ]
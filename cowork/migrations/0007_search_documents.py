@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Must match the expressions cowork.search queries with
+POSTGRES_INDEX = [
+    "CREATE INDEX cowork_searchdocument_body_fts ON cowork_searchdocument "
+    "USING GIN (to_tsvector('english', body))",
+]
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE cowork_searchdocument_fts USING fts5("
+    "body, content='cowork_searchdocument', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER cowork_searchdocument_fts_insert AFTER INSERT ON cowork_searchdocument BEGIN "
+    "INSERT INTO cowork_searchdocument_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER cowork_searchdocument_fts_delete AFTER DELETE ON cowork_searchdocument BEGIN "
+    "INSERT INTO cowork_searchdocument_fts(cowork_searchdocument_fts, rowid, body) "
+    "VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER cowork_searchdocument_fts_update AFTER UPDATE ON cowork_searchdocument BEGIN "
+    "INSERT INTO cowork_searchdocument_fts(cowork_searchdocument_fts, rowid, body) "
+    "VALUES ('delete', old.id, old.body); "
+    "INSERT INTO cowork_searchdocument_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_INDEX
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # cowork.search falls back to scanning
+                return
+        statements = SQLITE_INDEX
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS cowork_searchdocument_body_fts")
+    elif vendor == 'sqlite':
+        for action in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS cowork_searchdocument_fts_{action}")
+        schema_editor.execute("DROP TABLE IF EXISTS cowork_searchdocument_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0006_room_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('body', models.TextField()),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cowork.room')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchdocument',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='searchdocument_kind_object'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+# Must match the expression cowork.autocomplete queries with
+POSTGRES_INDEX = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX cowork_room_name_trgm ON cowork_room USING GIN (lower(name) gin_trgm_ops)",
+]
+
+
+def create_trigram_index(apps, schema_editor):
+    # Other databases autocomplete from an in-memory index
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_INDEX:
+            schema_editor.execute(statement)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS cowork_room_name_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0007_search_documents'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
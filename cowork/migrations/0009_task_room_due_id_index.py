@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0008_room_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['room', 'due_date', 'id'], name='task_room_due_id'),
+        ),
+    ]
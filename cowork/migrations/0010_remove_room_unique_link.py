@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cowork', '0009_task_room_due_id_index'),
+    ]
+
+    operations = [
+        # Room.save no longer fills this NOT NULL column, so creating a room
+        # would fail while it exists
+        migrations.RemoveField(
+            model_name='room',
+            name='unique_link',
+        ),
+    ]
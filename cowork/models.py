@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from collections.abc import Iterable
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.db.models.query import QuerySet
 
 # Create your models here.
@@ -13,6 +15,9 @@ from accounts.models import CustomUser
 import datetime
 from tinymce.models import HTMLField
 
+from cowork.identifiers import room_slug
+from cowork.membership import memberships
+
 
 User = get_user_model()
 
@@ -77,25 +82,143 @@ class Room(BaseModel):
     )
     likes = models.ManyToManyField(
         CustomUser, related_name="liked_rooms", blank=True)
+    # Denormalized len(likes), kept by toggle_like; the reconcile_like_counts
+    # command repairs drift from likes changed any other way.
+    like_count = models.PositiveIntegerField(default=0, editable=False)
     description = models.CharField(max_length=300, blank=True, null=True)
+    # Bumped whenever the room, its messages, members or likes change; together
+    # they make the validators (ETag / Last-Modified) of the room's endpoints.
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def touch(cls, *room_ids):
+        """Marks rooms as changed, invalidating their ETags."""
+        if room_ids:
+            cls.objects.filter(pk__in=room_ids).update(version=F("version") + 1, updated_at=timezone.now())
+
+    def has_member(self, user):
+        """
+        Whether ``user`` created or joined the room. Answered from a
+        per-process cache (cowork.membership), or one indexed EXISTS query.
+        """
+        if not user.is_authenticated:
+            return False
+        if self.created_by_id == user.pk:
+            return True
+        return memberships.get(self.pk, user.pk, lambda: Room.users.through.objects.filter(
+            room_id=self.pk, customuser_id=user.pk).exists())
+
+    def is_liked_by(self, user):
+        """One indexed EXISTS query, however many likes the room has."""
+        return user.is_authenticated and Room.likes.through.objects.filter(
+            room_id=self.pk, customuser_id=user.pk).exists()
+
+    def toggle_like(self, user):
+        """
+        Likes the room for ``user``, or unlikes it if they already do, and
+        returns whether they like it now. Constant time: one DELETE or INSERT
+        on the likes table and one UPDATE of ``like_count`` (which also touches
+        the room), all in one transaction.
+        """
+        likes = Room.likes.through.objects
+        with transaction.atomic():
+            if likes.filter(room_id=self.pk, customuser_id=user.pk).delete()[0]:
+                liked, delta = False, -1
+            else:
+                try:
+                    with transaction.atomic():
+                        likes.create(room_id=self.pk, customuser_id=user.pk)
+                except IntegrityError:
+                    # A concurrent request from the same user liked it first
+                    return True
+                liked, delta = True, 1
+            Room.objects.filter(pk=self.pk).update(
+                like_count=Greatest(F("like_count") + delta, 0),
+                version=F("version") + 1, updated_at=timezone.now())
+        self.refresh_from_db(fields=["like_count", "version", "updated_at"])
+        return liked
 
     def save(self, *args, **kwargs):
-        if not self.unique_link or Room.objects.filter(unique_link=self.unique_link).exists():
-            self.unique_link = uuid.uuid4().hex[:50]
-            while Room.objects.filter(unique_link=self.unique_link).exists():
-                self.unique_link = uuid.uuid4().hex[:50]
-        super(Room, self).save(*args, **kwargs)
+        if self.slug:
+            return super(Room, self).save(*args, **kwargs)
+        # Unique by construction (cowork.identifiers), so no lookup first
+        max_length = self._meta.get_field("slug").max_length
+        self.slug = room_slug(self.name, max_length)
+        try:
+            with transaction.atomic():
+                return super(Room, self).save(*args, **kwargs)
+        except IntegrityError:
+            # Another host's process shares our worker number and made the
+            # same slug in the same millisecond: draw a new one
+            self.slug = room_slug(self.name, max_length)
+            return super(Room, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+class MediaBlob(models.Model):
+    """
+    An uploaded file stored once under its SHA-256, however many messages (in
+    however many rooms) reference it.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='blobs')
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress (see cowork.uploads). Chunks are appended
+    to a partial file until ``size`` bytes have arrived, then the file is
+    moved into (or deduplicated against) a MediaBlob.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    blob = models.ForeignKey(MediaBlob, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_complete(self):
+        return self.blob_id is not None
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
 class Message(BaseModel):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     message = models.TextField(blank=True, null=True, default=None)
     media = models.FileField(upload_to='media', null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Uploads made through cowork.uploads; ``media`` holds legacy single-request uploads
+    media_blob = models.ForeignKey(MediaBlob, on_delete=models.PROTECT, null=True, blank=True)
+    # Stamped when the message is received rather than when it is written, so
+    # batched (write-behind) inserts keep the original ordering.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # SHA-256 of the client's idempotency key for HTTP sends (cowork.sending)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Serves history pages and replay, which seek on (created_at, id)
+            models.Index(fields=["room", "created_at", "id"], name="message_room_created_id"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "idempotency_key"], name="message_user_idempotency_key"),
+        ]
 
     def __str__(self):
         return f"{self.room.name} - {self.user.username}: {self.message}"
@@ -133,6 +256,12 @@ class Task(BaseModel):
     assigned_to = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serves a room's task list, which is ordered by (due_date, id)
+            models.Index(fields=["room", "due_date", "id"], name="task_room_due_id"),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -147,4 +276,23 @@ class Comment(BaseModel):
         return f"Comment by {self.user.username} on {self.task.title}"
 
 
+class SearchDocument(models.Model):
+    """
+    The searchable text of one room, message, task or comment (see
+    cowork.search). The full-text index over ``body`` is created by the
+    migration for the database in use: a GIN index on its tsvector on
+    PostgreSQL, an FTS5 table kept in sync by triggers on SQLite.
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.PositiveBigIntegerField()
+    # Hits are filtered by the rooms the searching user can see
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="+")
+    body = models.TextField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="searchdocument_kind_object"),
+        ]
 
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
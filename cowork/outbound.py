@@ -0,0 +1,136 @@
+"""
+Bounded per-connection send queues for the chat socket.
+
+Group events are put on the connection's queue and written by a dedicated
+task, so a client that reads slowly only delays itself and never blocks the
+consumer from taking the next event off the channel layer. When the queue is
+full the configured policy decides what gives:
+
+``drop_oldest``
+    discard the oldest queued frame to make room (default);
+``coalesce``
+    fold the new frame into the newest queued entry (up to
+    ``CHAT_SEND_COALESCE_MAX`` frames per entry, after which the oldest entry
+    is dropped). Batching connections get the entry as a single JSON array
+    frame; the others still get its frames one by one, as they expect one
+    object per frame;
+``disconnect``
+    close the socket; the client is expected to reconnect and resume.
+
+Connections can also opt into batching: the writer then waits
+``batch_window`` seconds after the first queued frame and sends everything
+that arrived meanwhile as one array frame, trading a few milliseconds of
+latency for far fewer sends in busy rooms. Queueing latency is recorded per
+frame, separately for batched and unbatched connections.
+"""
+import asyncio
+import time
+from collections import deque
+
+from django.conf import settings
+
+from cowork import metrics
+
+
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+DROPPED = metrics.counter("chat.outbound.dropped")
+COALESCED = metrics.counter("chat.outbound.coalesced")
+DISCONNECTED = metrics.counter("chat.outbound.disconnected")
+LATENCY = metrics.histogram("chat.outbound.latency_seconds")
+BATCHED_LATENCY = metrics.histogram("chat.outbound.batched_latency_seconds")
+BATCH_SIZE = metrics.histogram("chat.outbound.batch_size")
+
+
+class OutboundQueue:
+    """
+    ``send`` is awaited with either a single frame or a list of frames;
+    ``close`` is awaited when the ``disconnect`` policy kicks in. A
+    ``batch_window`` (seconds) greater than zero turns batching on.
+    """
+
+    def __init__(self, send, close, maxsize=None, policy=None, coalesce_max=None, batch_window=0):
+        self.maxsize = maxsize or getattr(settings, "CHAT_SEND_QUEUE_SIZE", 256)
+        self.policy = policy or getattr(settings, "CHAT_SEND_QUEUE_POLICY", DROP_OLDEST)
+        self.coalesce_max = coalesce_max or getattr(settings, "CHAT_SEND_COALESCE_MAX", 50)
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown send queue policy {self.policy!r}, expected one of {POLICIES}.")
+        self.batch_window = batch_window
+        self._send = send
+        self._close = close
+        self._entries = deque()
+        self._ready = asyncio.Event()
+        self._task = None
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._entries.clear()
+
+    def put(self, frame):
+        """Queues a frame without waiting; applies the overflow policy if full."""
+        if self.closed:
+            return
+        if len(self._entries) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                self.closed = True
+                DISCONNECTED.inc()
+                asyncio.get_running_loop().create_task(self._close())
+                return
+            if self.policy == COALESCE and len(self._entries[-1]) < self.coalesce_max:
+                self._entries[-1].append((time.perf_counter(), frame))
+                self.coalesced += 1
+                COALESCED.inc()
+                return
+            dropped = len(self._entries.popleft())
+            self.dropped += dropped
+            DROPPED.inc(dropped)
+        self._entries.append([(time.perf_counter(), frame)])
+        self._ready.set()
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            if self.batch_window:
+                # Cleared before waiting so frames queued during the window or
+                # the send schedule the next batch.
+                self._ready.clear()
+                await asyncio.sleep(self.batch_window)
+                entry = [item for entry in self._entries for item in entry]
+                self._entries.clear()
+                if entry:
+                    BATCH_SIZE.observe(len(entry))
+                    await self._send_entry(entry, BATCHED_LATENCY)
+            else:
+                while self._entries:
+                    await self._send_entry(self._entries.popleft(), LATENCY)
+                self._ready.clear()
+
+    async def _send_entry(self, entry, latency):
+        now = time.perf_counter()
+        for enqueued_at, _ in entry:
+            latency.observe(now - enqueued_at)
+        frames = [frame for _, frame in entry]
+        if self.batch_window and len(frames) > 1:
+            await self._send(frames)
+        else:
+            for frame in frames:
+                await self._send(frame)
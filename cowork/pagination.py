@@ -0,0 +1,88 @@
+"""
+Keyset (cursor) pagination for chat history.
+
+Pages are cut on ``(created_at, id)`` rather than with OFFSET, so fetching a
+page costs one index range scan on ``(room, created_at, id)`` however far
+back the client has scrolled, and messages arriving meanwhile never shift
+the pages. Cursors are opaque to clients: a URL-safe base64 of the boundary
+message's timestamp (in microseconds) and id.
+"""
+import base64
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+
+
+_EPOCH_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(message):
+    created_at_us = (message.created_at - _EPOCH_START) // _MICROSECOND
+    raw = f"{created_at_us}.{message.pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the ``(created_at, id)`` a cursor points at."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at_us, pk = raw.split(".")
+        return _EPOCH_START + int(created_at_us) * _MICROSECOND, int(pk)
+    except (ValueError, OverflowError):
+        raise ValidationError({"cursor": "Invalid cursor."})
+
+
+def paginate_messages(queryset, before=None, after=None, limit=None):
+    """
+    Returns ``(messages, previous, next)`` with messages oldest first.
+
+    Without a cursor the newest page is returned. ``previous`` pages towards
+    older messages (pass it as ``before``) and ``next`` towards newer ones
+    (pass it as ``after``); either is None when there is nothing more.
+    """
+    max_limit = getattr(settings, "CHAT_HISTORY_MAX_PAGE_SIZE", 200)
+    try:
+        limit = int(limit) if limit is not None else getattr(settings, "CHAT_HISTORY_PAGE_SIZE", 50)
+    except (TypeError, ValueError):
+        raise ValidationError({"limit": "Must be an integer."})
+    limit = max(1, min(limit, max_limit))
+    if before and after:
+        raise ValidationError({"cursor": "Pass either before or after, not both."})
+
+    if after:
+        created_at, pk = decode_cursor(after)
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+        page = list(queryset.order_by("created_at", "id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        # Arrived here from an older page, so there is always one before it
+        older, newer = bool(page), has_more
+    else:
+        if before:
+            created_at, pk = decode_cursor(before)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        page = list(queryset.order_by("-created_at", "-id")[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+        older, newer = has_more, bool(before) and bool(page)
+
+    previous = encode_cursor(page[0]) if older else None
+    next_cursor = encode_cursor(page[-1]) if newer else None
+    return page, previous, next_cursor
+
+
+class TaskPagination(PageNumberPagination):
+    """
+    Numbered pages of a room's tasks (``page``, ``limit``). Task lists are
+    short and re-sorted by due date, so a page and a count are cheap here.
+    """
+    page_size_query_param = "limit"
+
+    def get_page_size(self, request):
+        self.page_size = getattr(settings, "CHAT_TASK_PAGE_SIZE", 50)
+        self.max_page_size = getattr(settings, "CHAT_TASK_MAX_PAGE_SIZE", 200)
+        return super().get_page_size(request)
@@ -0,0 +1,153 @@
+"""
+Write-behind persistence for chat messages.
+
+The consumer builds the ``Message`` (so a frame that cannot be stored is never
+sent), broadcasts its frame and then hands it to ``message_writer``.
+Queued messages are written with a single ``bulk_create`` once the queue holds
+``CHAT_PERSIST_BATCH_SIZE`` messages or ``CHAT_PERSIST_FLUSH_INTERVAL`` seconds
+have passed, whichever comes first. Consumers flush on disconnect and the queue
+is drained one last time when the worker process exits. A message that still
+cannot be written is dropped, and its sender gets a ``not_saved`` error frame.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from cowork import metrics, search
+from cowork.db import chat_db
+from cowork.models import Message, Room
+
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.gauge("chat.persist.queue_depth")
+FLUSH_SECONDS = metrics.histogram("chat.persist.flush_seconds")
+FLUSHED = metrics.counter("chat.persist.flushed")
+FAILED = metrics.counter("chat.persist.failed")
+
+
+class MessageWriteBehind:
+    """
+    Buffers chat messages in memory and persists them in batches.
+
+    ``enqueue`` must be called from the event loop; the flusher task is started
+    lazily on the running loop and exits once the queue is empty, so idle workers
+    do not keep a timer alive.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        self.batch_size = batch_size or getattr(settings, "CHAT_PERSIST_BATCH_SIZE", 100)
+        self.flush_interval = flush_interval or getattr(settings, "CHAT_PERSIST_FLUSH_INTERVAL", 0.5)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def has_pending(self, room_id):
+        """Whether messages of ``room_id`` are queued but not yet written."""
+        with self._lock:
+            return any(message.room_id == room_id for message, _ in self._pending)
+
+    def enqueue(self, message, on_dropped=None):
+        """
+        Queues an unsaved ``Message`` for persistence and returns it.
+        ``on_dropped`` is called on the event loop if the message could not be
+        written, so the sender can be told about it.
+        """
+        with self._lock:
+            self._pending.append((message, on_dropped))
+            depth = len(self._pending)
+        QUEUE_DEPTH.set(depth)
+
+        self._ensure_flusher()
+        if depth >= self.batch_size:
+            self._wakeup.set()
+        return message
+
+    async def flush(self):
+        """Writes everything queued so far. Safe to call concurrently."""
+        batch = self._drain()
+        if batch:
+            dropped = await chat_db(self._write)([message for message, _ in batch])
+            dropped = {id(message) for message in dropped}
+            for message, on_dropped in batch:
+                if on_dropped is not None and id(message) in dropped:
+                    on_dropped()
+
+    def flush_sync(self):
+        """Blocking flush for code paths without an event loop (e.g. shutdown)."""
+        batch = self._drain()
+        if batch:
+            self._write([message for message, _ in batch])
+
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+    def _drain(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        QUEUE_DEPTH.set(0)
+        return batch
+
+    def _write(self, batch):
+        """Persists ``batch`` and returns the messages that had to be dropped."""
+        start = time.perf_counter()
+        dropped = []
+        try:
+            Message.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            # One bad row (e.g. its room was deleted meanwhile) must not take the
+            # whole batch down with it, so fall back to saving row by row.
+            logger.exception("bulk_create of %d messages failed, retrying individually", len(batch))
+            for message in batch:
+                try:
+                    message.save()
+                    FLUSHED.inc()
+                except Exception:
+                    FAILED.inc()
+                    dropped.append(message)
+                    logger.exception("Dropping message for room %s", message.room_id)
+        else:
+            FLUSHED.inc(len(batch))
+            # bulk_create sends no post_save, so invalidate the rooms' ETags
+            # and index the messages for search here
+            Room.touch(*{message.room_id for message in batch})
+            search.index_messages(batch)
+        finally:
+            FLUSH_SECONDS.observe(time.perf_counter() - start)
+        return dropped
+
+
+message_writer = MessageWriteBehind()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        message_writer.flush_sync()
+    except Exception:
+        logger.exception("Final write-behind flush failed")
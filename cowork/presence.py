@@ -0,0 +1,68 @@
+"""
+Tracks who is currently connected to which room.
+
+Presence is deliberately kept apart from ``Room.users``: membership is durable
+and changed through the join endpoint, while presence only reflects open
+WebSocket connections. A user with several tabs open holds several
+connections, so presence is reference counted per (room, user) and both
+connect and disconnect are O(1).
+
+The tracker lives in process memory, so it reports the connections held by
+the worker that answers the query. With several workers (e.g. behind
+``cowork.layers.UnixSocketChannelLayer``) presence is per worker only: users
+connected to another worker are not listed, and the same user may be online
+on several workers at once. Nothing is shared between workers, so a crashed
+worker leaves no stale entries behind.
+"""
+import threading
+from collections import defaultdict
+
+from cowork import metrics
+
+
+CONNECTIONS = metrics.gauge("chat.presence.connections")
+
+
+class PresenceTracker:
+    def __init__(self):
+        self._rooms = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def connect(self, room_id, user_id):
+        """Registers a connection. Returns True if the user just came online."""
+        with self._lock:
+            users = self._rooms[room_id]
+            users[user_id] = users.get(user_id, 0) + 1
+            first = users[user_id] == 1
+        CONNECTIONS.inc()
+        return first
+
+    def disconnect(self, room_id, user_id):
+        """Releases a connection. Returns True if the user just went offline."""
+        with self._lock:
+            users = self._rooms.get(room_id)
+            if not users or user_id not in users:
+                return False
+            users[user_id] -= 1
+            last = users[user_id] == 0
+            if last:
+                del users[user_id]
+                if not users:
+                    del self._rooms[room_id]
+        CONNECTIONS.dec()
+        return last
+
+    def online(self, room_id):
+        """Ids of the users with at least one open connection to the room."""
+        with self._lock:
+            return list(self._rooms.get(room_id, ()))
+
+    def is_online(self, room_id, user_id):
+        return user_id in self._rooms.get(room_id, ())
+
+    def connection_count(self, room_id):
+        with self._lock:
+            return sum(self._rooms.get(room_id, {}).values())
+
+
+presence = PresenceTracker()
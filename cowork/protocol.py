@@ -0,0 +1,112 @@
+"""
+Wire formats for the chat socket.
+
+Clients that do not ask for anything keep getting the original JSON text
+frames. Clients that offer the ``coloby.msgpack.v1`` WebSocket subprotocol get
+binary frames instead: each frame is a MessagePack array of records, and each
+record is itself a short array whose first item is the record type::
+
+    [0, seq, user_ref, created_at_us, message, id]   chat message
+    [1, user_ref, username]                          user definition
+    [2, epoch]                                       replay epoch (see cowork.replay)
+    [4, code, retry_after, seq]                      error, e.g. "rate_limited"
+
+Usernames are interned per connection: the first time a user appears the
+server sends a user definition record, after which messages only carry the
+small integer ``user_ref``. The room is implied by the socket URL and never
+sent. ``id`` is null for live messages and set for messages replayed from the
+database, like the JSON frame's ``id``. Binary clients send::
+
+    [0, message]                                     chat message
+    [3, last_seq, epoch, since_us, since_id]         resume (same as the JSON frame)
+
+``since_id`` may be null or left out.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+
+
+MSGPACK_SUBPROTOCOL = "coloby.msgpack.v1"
+
+MESSAGE = 0
+USER = 1
+EPOCH = 2
+RESUME = 3
+ERROR = 4
+
+_EPOCH_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class JSONCodec:
+    subprotocol = None
+
+    def encode(self, frame):
+        """Returns ``(text_data, bytes_data)`` for ``AsyncWebsocketConsumer.send``."""
+        return json.dumps(frame), None
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+class MsgpackCodec:
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def __init__(self):
+        self._user_refs = {}
+        self._epoch = None
+
+    def encode(self, frame):
+        frames = frame if isinstance(frame, list) else [frame]
+        records = []
+        for frame in frames:
+            self._encode_frame(frame, records)
+        return None, msgpack.packb(records, use_bin_type=True)
+
+    def _encode_frame(self, frame, records):
+        if "error" in frame:
+            records.append([ERROR, frame["error"], frame.get("retry_after"), frame.get("seq")])
+            return
+
+        epoch = frame.get("epoch")
+        if epoch is not None and epoch != self._epoch:
+            self._epoch = epoch
+            records.append([EPOCH, epoch])
+
+        username = frame["username"]
+        user_ref = self._user_refs.get(username)
+        if user_ref is None:
+            user_ref = self._user_refs[username] = len(self._user_refs) + 1
+            records.append([USER, user_ref, username])
+
+        created_at = frame.get("created_at")
+        created_at_us = (
+            (datetime.fromisoformat(created_at) - _EPOCH_START) // _MICROSECOND if created_at else None
+        )
+        records.append([MESSAGE, frame.get("seq"), user_ref, created_at_us, frame["message"], frame.get("id")])
+
+    def decode(self, text_data=None, bytes_data=None):
+        """Translates a binary client record into the dict shape of the JSON protocol."""
+        if bytes_data is None:
+            return json.loads(text_data)
+        record = msgpack.unpackb(bytes_data, raw=False)
+        if record[0] == MESSAGE:
+            return {"message": record[1]}
+        if record[0] == RESUME:
+            last_seq, epoch, since_us = record[1:4]
+            since_id = record[4] if len(record) > 4 else None
+            since = (
+                (_EPOCH_START + since_us * _MICROSECOND).isoformat()
+                if since_us is not None else None
+            )
+            return {"type": "resume", "last_seq": last_seq, "epoch": epoch, "since": since, "since_id": since_id}
+        raise ValueError(f"Unknown record type {record[0]!r}")
+
+
+def negotiate(subprotocols):
+    """Picks the codec for a connection from the subprotocols the client offered."""
+    if MSGPACK_SUBPROTOCOL in (subprotocols or ()):
+        return MsgpackCodec()
+    return JSONCodec()
@@ -0,0 +1,81 @@
+"""
+Per-room ring buffers of recent chat frames, used to catch reconnecting
+clients up without querying the message history.
+
+Every frame gets a monotonically increasing ``seq`` within its room buffer.
+Buffers live in process memory and carry a random ``epoch``; a client that
+resumes with a sequence number from another epoch (another worker, or a
+restarted one) cannot be served from the buffer and falls back to the
+database. Buffers only see the frames sent through their own process, so when
+the channel layer spans several workers (``cowork.layers``) they are never
+used for replay: see ``buffers_are_complete``.
+"""
+import threading
+import uuid
+from collections import OrderedDict, deque
+from itertools import islice
+
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+
+
+class RoomReplayBuffer:
+    def __init__(self, size):
+        self.epoch = uuid.uuid4().hex[:12]
+        self._frames = deque(maxlen=size)
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def append(self, frame):
+        """Stamps ``frame`` with the next sequence number and the epoch, and stores it."""
+        with self._lock:
+            frame = dict(frame, seq=self._next_seq, epoch=self.epoch)
+            self._next_seq += 1
+            self._frames.append(frame)
+        return frame
+
+    def since(self, last_seq):
+        """
+        Returns the frames after ``last_seq``, or None if some of them have
+        already been evicted and the buffer cannot answer on its own.
+        """
+        with self._lock:
+            if last_seq >= self._next_seq - 1:
+                return []
+            if not self._frames or last_seq < self._frames[0]["seq"] - 1:
+                return None
+            start = last_seq - self._frames[0]["seq"] + 1
+            return list(islice(self._frames, start, None))
+
+
+class ReplayBuffers:
+    """Room id -> RoomReplayBuffer, keeping only the most recently used rooms."""
+
+    def __init__(self, buffer_size=None, max_rooms=None):
+        self.buffer_size = buffer_size or getattr(settings, "CHAT_REPLAY_BUFFER_SIZE", 256)
+        self.max_rooms = max_rooms or getattr(settings, "CHAT_REPLAY_MAX_ROOMS", 1000)
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, room_id):
+        with self._lock:
+            buffer = self._buffers.get(room_id)
+            if buffer is None:
+                buffer = self._buffers[room_id] = RoomReplayBuffer(self.buffer_size)
+                if len(self._buffers) > self.max_rooms:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(room_id)
+            return buffer
+
+
+def buffers_are_complete(layer):
+    """
+    Whether every frame of a room passes through this process. Layers that
+    span processes deliver other workers' frames, which never enter the local
+    buffer, so a resume served from it would miss them.
+    """
+    return type(layer) is InMemoryChannelLayer
+
+
+replay_buffers = ReplayBuffers()
@@ -0,0 +1,272 @@
+"""
+Full-text search over rooms, messages, tasks and comments.
+
+Every searchable object has one SearchDocument row holding its text and its
+room. Rows are kept current incrementally: model signals (cowork.signals)
+index single saves and deletes, and the bulk write paths (the write-behind
+queue, the batched send API and bulk task writes) index what they write.
+``manage.py rebuild_search_index`` indexes everything from scratch, e.g.
+after upgrading or restoring a dump.
+
+The index depends on the database (see migration 0007):
+
+PostgreSQL
+    a GIN index on ``to_tsvector('english', body)``. Queries go through
+    ``websearch_to_tsquery`` (quoted phrases, ``or``, ``-term``) and are
+    ranked with ``ts_rank``.
+SQLite
+    an external-content FTS5 table with porter stemming, kept in sync with
+    SearchDocument by triggers. Every word must match, and hits are ranked
+    with ``bm25``.
+anything else, or SQLite built without FTS5
+    every word must appear in the body. This scans the table and is unranked.
+
+Hits are limited to the rooms the searching user can see. Pages are cut in
+the database on ``(rank, id)`` (keyset), totals are counted only up to a cap,
+and a page is serialized with one query per kind of object on it.
+"""
+import base64
+import json
+import re
+
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from cowork import metrics
+from cowork.models import Comment, Message, Room, SearchDocument, Task
+
+
+ROOM = "room"
+MESSAGE = "message"
+TASK = "task"
+COMMENT = "comment"
+KINDS = (ROOM, MESSAGE, TASK, COMMENT)
+KIND_OF = {Room: ROOM, Message: MESSAGE, Task: TASK, Comment: COMMENT}
+
+QUERY_SECONDS = metrics.histogram("chat.search.query_seconds")
+INDEXED = metrics.counter("chat.search.indexed")
+
+FTS_TABLE = "cowork_searchdocument_fts"
+# Must match the expression index created by migration 0007
+TSVECTOR = "to_tsvector('english', cowork_searchdocument.body)"
+TSQUERY = "websearch_to_tsquery('english', %s)"
+
+_WORD = re.compile(r"\w+")
+_fts5_available = {}
+
+
+def _body(*parts):
+    return "\n".join(part for part in parts if part and part.strip())
+
+
+def _document(instance):
+    """``(room id, body)`` of a model instance."""
+    if isinstance(instance, Room):
+        return instance.pk, _body(instance.name, instance.description)
+    if isinstance(instance, Message):
+        return instance.room_id, _body(instance.message)
+    if isinstance(instance, Task):
+        return instance.room_id, _body(instance.title, instance.description)
+    return instance.task.room_id, _body(instance.text)
+
+
+def index(instance, created=False):
+    """Adds or refreshes the document of a saved instance: one write."""
+    room_id, body = _document(instance)
+    if not body:
+        if not created:
+            unindex(instance)
+        return
+    kind = KIND_OF[type(instance)]
+    if created or not SearchDocument.objects.filter(kind=kind, object_id=instance.pk).update(
+            room_id=room_id, body=body):
+        SearchDocument.objects.create(kind=kind, object_id=instance.pk, room_id=room_id, body=body)
+    INDEXED.inc()
+
+
+def unindex(instance):
+    SearchDocument.objects.filter(kind=KIND_OF[type(instance)], object_id=instance.pk).delete()
+
+
+def index_messages(messages):
+    """Indexes messages inserted with ``bulk_create``, which sends no post_save."""
+    documents = [
+        SearchDocument(kind=MESSAGE, object_id=message.pk, room_id=message.room_id, body=_body(message.message))
+        # Backends that cannot return ids from bulk inserts leave pk unset;
+        # rebuild_search_index picks those up.
+        for message in messages if message.pk is not None and _body(message.message)
+    ]
+    SearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+    INDEXED.inc(len(documents))
+
+
+def index_tasks(tasks):
+    """Indexes tasks written with ``bulk_create`` or ``bulk_update``, which send no post_save."""
+    tasks = [task for task in tasks if task.pk is not None]
+    SearchDocument.objects.filter(kind=TASK, object_id__in=[task.pk for task in tasks]).delete()
+    documents = [
+        SearchDocument(kind=TASK, object_id=task.pk, room_id=task.room_id, body=_body(task.title, task.description))
+        for task in tasks if _body(task.title, task.description)
+    ]
+    SearchDocument.objects.bulk_create(documents)
+    INDEXED.inc(len(documents))
+
+
+def move_task_comments(task):
+    """Comments are searched by their task's room, which may have changed."""
+    comment_ids = Comment.objects.filter(task=task).values("pk")
+    SearchDocument.objects.filter(kind=COMMENT, object_id__in=comment_ids).exclude(
+        room_id=task.room_id).update(room_id=task.room_id)
+
+
+def rebuild(batch_size=2000):
+    """Replaces the whole index. Returns the number of documents written."""
+    sources = [
+        (ROOM, Room.objects.values_list("pk", "pk", "name", "description")),
+        (MESSAGE, Message.objects.values_list("pk", "room_id", "message")),
+        (TASK, Task.objects.values_list("pk", "room_id", "title", "description")),
+        (COMMENT, Comment.objects.values_list("pk", "task__room_id", "text")),
+    ]
+    SearchDocument.objects.all().delete()
+    total = 0
+    for kind, rows in sources:
+        batch = []
+        for pk, room_id, *parts in rows.order_by("pk").iterator(chunk_size=batch_size):
+            body = _body(*parts)
+            if body:
+                batch.append(SearchDocument(kind=kind, object_id=pk, room_id=room_id, body=body))
+            if len(batch) >= batch_size:
+                SearchDocument.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+        total += len(batch)
+    return total
+
+
+def visible_rooms(user):
+    return Room.objects.filter(Q(is_private=False) | Q(created_by=user) | Q(users=user)).values("pk")
+
+
+def backend():
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        name = connection.settings_dict["NAME"]
+        if name not in _fts5_available:
+            _fts5_available[name] = FTS_TABLE in connection.introspection.table_names()
+        if _fts5_available[name]:
+            return "fts5"
+    return "scan"
+
+
+def search(query, user, kinds=None, after=None):
+    """
+    Returns a SearchDocument queryset of the hits for ``query`` visible to
+    ``user``, best first, each annotated with a ``rank`` (higher is better).
+    ``after`` is the ``(rank, id)`` of the last hit of the previous page.
+    Only ids are loaded; ``results`` fetches what the hits point at.
+    """
+    documents = SearchDocument.objects.filter(room_id__in=visible_rooms(user)).only("id", "kind", "object_id")
+    if kinds:
+        documents = documents.filter(kind__in=kinds)
+    words = _WORD.findall(query)
+    if not words:
+        return documents.none()
+
+    engine = backend()
+    tables = []
+    if engine == "postgresql":
+        rank, rank_params = f"ts_rank({TSVECTOR}, {TSQUERY})", [query]
+        where, params = [f"{TSVECTOR} @@ {TSQUERY}"], [query]
+    elif engine == "fts5":
+        rank, rank_params = f"-bm25({FTS_TABLE})", []
+        tables = [FTS_TABLE]
+        where = [f"{FTS_TABLE}.rowid = cowork_searchdocument.id", f"{FTS_TABLE} MATCH %s"]
+        # Quoted, so user input is never parsed as FTS5 query syntax
+        params = [" ".join('"%s"' % word for word in words)]
+    else:
+        rank, rank_params = "0.0", []
+        where, params = [], []
+        for word in words:
+            documents = documents.filter(body__icontains=word)
+
+    if after is not None:
+        # Keyset: strictly after the previous page's last (rank, id)
+        last_rank, last_id = after
+        where.append(f"(({rank}) < %s OR (({rank}) = %s AND cowork_searchdocument.id < %s))")
+        params += rank_params + [last_rank] + rank_params + [last_rank, last_id]
+
+    documents = documents.extra(
+        select={"rank": rank}, select_params=rank_params, tables=tables, where=where, params=params)
+    return documents.order_by("-rank", "-id")
+
+
+def capped_count(documents, cap):
+    """``(count, capped)``: counts at most ``cap`` hits instead of all of them."""
+    count = documents.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
+def encode_cursor(hit):
+    raw = json.dumps([hit.rank, hit.pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Returns the ``(rank, id)`` a cursor points at."""
+    try:
+        rank, pk = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rank), int(pk)
+    except (ValueError, TypeError, OverflowError):
+        raise ValidationError({"after": "Invalid cursor."})
+
+
+def _rooms(ids):
+    return {room.pk: {
+        "name": room.name, "slug": room.slug, "description": room.description,
+        "is_private": room.is_private, "like_count": room.like_count,
+    } for room in Room.objects.filter(pk__in=ids)}
+
+
+def _messages(ids):
+    messages = Message.objects.filter(pk__in=ids).select_related("user", "room")
+    return {message.pk: {
+        "room": message.room.slug, "user": message.user.username, "message": message.message,
+        "created_at": message.created_at.isoformat(),
+    } for message in messages}
+
+
+def _tasks(ids):
+    tasks = Task.objects.filter(pk__in=ids).select_related("assigned_to", "room")
+    return {task.pk: {
+        "room": task.room.slug, "title": task.title, "completed": task.completed,
+        "due_date": task.due_date.isoformat(), "assigned_to": task.assigned_to.username,
+    } for task in tasks}
+
+
+def _comments(ids):
+    comments = Comment.objects.filter(pk__in=ids).select_related("user", "task__room")
+    return {comment.pk: {
+        "room": comment.task.room.slug, "task": comment.task_id, "task_title": comment.task.title,
+        "user": comment.user.username, "text": comment.text, "created_at": comment.created_at.isoformat(),
+    } for comment in comments}
+
+
+_LOADERS = {ROOM: _rooms, MESSAGE: _messages, TASK: _tasks, COMMENT: _comments}
+
+
+def results(hits):
+    """
+    Serializes a page of hits with one query per kind on the page. Hits whose
+    object is gone (deleted without signals) are skipped.
+    """
+    ids = {}
+    for hit in hits:
+        ids.setdefault(hit.kind, []).append(hit.object_id)
+    objects = {kind: _LOADERS[kind](kind_ids) for kind, kind_ids in ids.items()}
+    return [
+        dict(objects[hit.kind][hit.object_id], type=hit.kind, id=hit.object_id, rank=round(hit.rank, 6))
+        for hit in hits if hit.object_id in objects[hit.kind]
+    ]
@@ -0,0 +1,104 @@
+"""
+Sending chat messages over HTTP.
+
+Clients on flaky networks retry, so every message may carry an idempotency
+key. The key's hash is stored on the message, and a unique constraint on
+(user, key) makes each key create at most one message, whichever worker the
+retry reaches. A retry with a key that was already used gets the first
+message back instead of creating another.
+
+Messages are inserted with a single ``bulk_create``, so an offline client can
+flush its whole backlog in one round trip. ``bulk_create`` sends no signals,
+so the room is touched, the messages are indexed for search and derivatives
+are queued here.
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+
+from cowork import derivatives, metrics, search
+from cowork.models import Message, Room
+
+
+SENT = metrics.counter("chat.send.sent")
+DUPLICATES = metrics.counter("chat.send.duplicates")
+
+
+def _hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _result(message):
+    return {"id": message.pk, "created_at": message.created_at.isoformat()}
+
+
+def _sent(user, keys):
+    """Hashed key -> result, for the keys ``user`` already sent messages with."""
+    if not keys:
+        return {}
+    messages = Message.objects.filter(user=user, idempotency_key__in=keys).only("id", "created_at", "idempotency_key")
+    return {message.idempotency_key: _result(message) for message in messages}
+
+
+def _insert(room, messages):
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        if messages:
+            Room.touch(room.pk)
+            search.index_messages(messages)
+
+
+def send_messages(room, user, items):
+    """
+    Persists ``items`` (validated dicts with ``message``, and optionally
+    ``media_file``, ``media_blob`` and ``idempotency_key``) to ``room`` as
+    ``user``.
+
+    Returns one ``{"id", "created_at", "duplicate"}`` per item, in order.
+    """
+    keys = [_hash_key(item["idempotency_key"]) if item.get("idempotency_key") else None for item in items]
+    sent = _sent(user, {key for key in keys if key})
+    results = [None] * len(items)
+    first = {}
+    repeats = {}
+    pending = []
+
+    for index, (item, key) in enumerate(zip(items, keys)):
+        if key in sent:
+            results[index] = dict(sent[key], duplicate=True)
+            continue
+        if key in first:
+            # Same key twice in one batch
+            repeats[index] = first[key]
+            continue
+        if key:
+            first[key] = index
+        message = Message(
+            room=room, user=user, message=item.get("message"), media_blob=item.get("media_blob"),
+            idempotency_key=key)
+        media_file = item.get("media_file")
+        if media_file:
+            message.media.save(media_file.name, media_file, save=False)
+        pending.append((index, message))
+
+    try:
+        _insert(room, [message for _, message in pending])
+    except IntegrityError:
+        # A concurrent request (e.g. a retry that reached another worker)
+        # stored some of these keys first: hand those back and insert the rest
+        sent = _sent(user, set(first))
+        for index, message in pending:
+            if message.idempotency_key in sent:
+                results[index] = dict(sent[message.idempotency_key], duplicate=True)
+        pending = [(index, message) for index, message in pending if results[index] is None]
+        _insert(room, [message for _, message in pending])
+
+    for index, message in pending:
+        results[index] = dict(_result(message), duplicate=False)
+    derivatives.schedule_on_commit([message for _, message in pending])
+    for index, earlier in repeats.items():
+        results[index] = dict(results[earlier], duplicate=True)
+
+    SENT.inc(len(pending))
+    DUPLICATES.inc(len(items) - len(pending))
+    return results
@@ -0,0 +1,226 @@
+"""
+Serving media files with HTTP range support.
+
+``serve_file`` answers GET/HEAD for a file on local disk. It handles:
+
+- strong ETags and conditional requests (If-None-Match, If-Range);
+- single ranges, answered with a 206 response;
+- multiple ranges, answered with a 206 ``multipart/byteranges`` response.
+
+Overlapping ranges are merged. Requests with more than
+``CHAT_MEDIA_MAX_RANGES`` ranges get the whole file instead.
+
+``CHAT_MEDIA_SENDFILE`` decides who moves the bytes:
+
+``""`` (default)
+    Django does. Under WSGI the response is a ``FileResponse`` over a
+    bounded view of the file, and a server with ``wsgi.file_wrapper`` (e.g.
+    gunicorn) uses ``sendfile(2)`` from the range's offset for exactly
+    Content-Length bytes. Django's ASGI handler would read such a response
+    to the end before sending it, so under ASGI the file is streamed through
+    an async iterator (``cowork.streaming``) that reads one block at a time
+    in a worker thread.
+``"x-sendfile"``
+    The front server (Apache mod_xsendfile, lighttpd) serves the absolute
+    path in the ``X-Sendfile`` header.
+``"x-accel-redirect"``
+    nginx serves ``CHAT_MEDIA_ACCEL_PREFIX`` + the path relative to
+    MEDIA_ROOT. That prefix must be an ``internal`` location aliased to
+    MEDIA_ROOT.
+
+In both offload modes the front server also handles ranges.
+"""
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import http_date, parse_etags, quote_etag
+
+from cowork.streaming import aiterate, is_asgi, streaming_content
+
+
+BLOCK_SIZE = 64 * 1024
+_RANGE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def media_url(room_slug, message_id, kind=None):
+    """Path of the MessageMediaView serving a message's media or a derivative of it."""
+    if kind is None:
+        return reverse("message-media", args=[room_slug, message_id])
+    return reverse("message-media-derivative", args=[room_slug, message_id, kind])
+
+
+class RangeFile:
+    """
+    Read-only view of ``length`` bytes of ``fh`` starting at ``start``. Exposes
+    ``fileno`` so WSGI file wrappers can sendfile() the window directly.
+    """
+
+    def __init__(self, fh, start, length):
+        self._fh = fh
+        self._remaining = length
+        fh.seek(start)
+
+    def fileno(self):
+        return self._fh.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fh.read(size) if size else b""
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._fh.close()
+
+
+def file_etag(path, stat=None):
+    """A strong validator for a file whose content is not known by hash."""
+    stat = stat or os.stat(path)
+    return quote_etag(f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}")
+
+
+def parse_ranges(header, size):
+    """
+    Returns the ``[(start, end)]`` (inclusive, merged, in order) a Range header
+    asks for, [] when none of them is satisfiable, or None to ignore the header.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    ranges = []
+    for spec in header[len("bytes="):].split(","):
+        match = _RANGE.match(spec)
+        if match is None:
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        elif last:
+            # Suffix range: the final N bytes
+            start, end = max(size - int(last), 0), size - 1
+            if not int(last):
+                continue
+        else:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    if len(ranges) > getattr(settings, "CHAT_MEDIA_MAX_RANGES", 16):
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def serve_file(request, path, content_type, etag=None, cache_control="private, no-cache"):
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = etag or file_etag(path, stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat.st_mtime),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+        return _with_headers(HttpResponseNotModified(), headers)
+
+    mode = getattr(settings, "CHAT_MEDIA_SENDFILE", "")
+    if mode:
+        return _with_headers(_offload(mode, path, content_type), headers)
+
+    ranges = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    # A stale If-Range means the client's partial copy is useless: send it all
+    if not if_range or if_range.strip() == etag:
+        ranges = parse_ranges(request.META.get("HTTP_RANGE"), size)
+
+    if ranges == []:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return _with_headers(response, headers)
+
+    if not ranges:
+        response = _window_response(request, path, 0, size, content_type)
+        return _with_headers(response, headers)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = _window_response(request, path, start, end - start + 1, content_type)
+        response.status_code = 206
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return _with_headers(response, headers)
+
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+         f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    length = sum(len(part) + end - start + 1 for part, (start, end) in zip(part_headers, ranges))
+    length += 2 * (len(ranges) - 1) + len(closing)
+
+    def parts():
+        with open(path, "rb") as fh:
+            for index, (part, (start, end)) in enumerate(zip(part_headers, ranges)):
+                yield (b"\r\n" if index else b"") + part
+                window = RangeFile(fh, start, end - start + 1)
+                for block in iter(lambda: window.read(BLOCK_SIZE), b""):
+                    yield block
+            yield closing
+
+    response = StreamingHttpResponse(streaming_content(request, parts(), thread_sensitive=False), status=206,
+                                     content_type=f"multipart/byteranges; boundary={boundary}")
+    response["Content-Length"] = str(length)
+    return _with_headers(response, headers)
+
+
+def _blocks(window):
+    try:
+        yield from iter(lambda: window.read(BLOCK_SIZE), b"")
+    finally:
+        window.close()
+
+
+def _window_response(request, path, start, length, content_type):
+    window = RangeFile(open(path, "rb"), start, length)
+    if is_asgi(request):
+        # File reads need no particular thread, so they may run in parallel
+        response = StreamingHttpResponse(aiterate(_blocks(window), thread_sensitive=False),
+                                         content_type=content_type)
+    else:
+        response = FileResponse(window, content_type=content_type)
+    response["Content-Length"] = str(length)
+    return response
+
+
+def _offload(mode, path, content_type):
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-sendfile":
+        response["X-Sendfile"] = os.path.abspath(path)
+    elif mode == "x-accel-redirect":
+        relative = os.path.relpath(path, settings.MEDIA_ROOT)
+        response["X-Accel-Redirect"] = getattr(settings, "CHAT_MEDIA_ACCEL_PREFIX", "/protected-media/") + relative
+    else:
+        raise ValueError(f"Unknown CHAT_MEDIA_SENDFILE mode {mode!r}")
+    return response
+
+
+def _with_headers(response, headers):
+    for name, value in headers.items():
+        response[name] = value
+    return response
@@ -0,0 +1,87 @@
+"""
+Keeps ``Room.version`` current so the conditional GET validators of a room's
+endpoints change whenever what they serve does. Messages written by the
+write-behind queue go through ``bulk_create``, which sends no signals; the
+queue touches their rooms itself.
+
+Saving a message with media also queues its thumbnails and previews
+(cowork.derivatives), membership changes drop the cached answers of
+``Room.has_member`` (cowork.membership), and rooms, messages, tasks and
+comments are kept in the search index (cowork.search) and rooms in the
+autocomplete index (cowork.autocomplete).
+"""
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from cowork import derivatives, search
+from cowork.autocomplete import room_autocomplete
+from cowork.membership import memberships
+from cowork.models import Comment, Message, Room, Task
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_changed(sender, instance, **kwargs):
+    Room.touch(instance.room_id)
+
+
+@receiver(post_save, sender=Message)
+def render_media_derivatives(sender, instance, **kwargs):
+    derivatives.schedule_on_commit([instance])
+
+
+@receiver(m2m_changed, sender=Room.users.through)
+@receiver(m2m_changed, sender=Room.likes.through)
+def room_relation_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            Room.touch(instance.pk)
+    elif action in ("post_add", "post_remove"):
+        # user.<accessor>.add(room, ...): pk_set holds the rooms
+        Room.touch(*pk_set)
+    elif action == "pre_clear":
+        # pk_set is not provided for clear(), so look the rooms up first
+        field = "users" if sender is Room.users.through else "likes"
+        Room.touch(*Room.objects.filter(**{field: instance}).values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Room.users.through)
+def room_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        if reverse:
+            memberships.invalidate(room_ids=pk_set, user_ids=[instance.pk])
+        else:
+            memberships.invalidate(room_ids=[instance.pk], user_ids=pk_set)
+    elif action == "post_clear":
+        if reverse:
+            memberships.invalidate(user_ids=[instance.pk])
+        else:
+            memberships.invalidate(room_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, created, **kwargs):
+    search.index(instance, created)
+    if sender is Task and not created:
+        search.move_task_comments(instance)
+
+
+@receiver(post_delete, sender=Room)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Comment)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.unindex(instance)
+
+
+@receiver(post_save, sender=Room)
+def update_autocomplete_index(sender, instance, **kwargs):
+    room_autocomplete.room_saved(instance)
+
+
+@receiver(post_delete, sender=Room)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    room_autocomplete.room_deleted(instance)
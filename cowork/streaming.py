@@ -0,0 +1,47 @@
+"""
+Streaming responses that stay streamed under ASGI.
+
+Django 4.2's ASGI handler cannot iterate a synchronous streaming iterator
+from the event loop, so it reads it to the end (``sync_to_async(list)``)
+before it sends the first byte, and the whole body sits in memory. Views
+pass their iterator through ``streaming_content``. Under ASGI that wraps it
+in an async iterator that fetches one chunk at a time in a worker thread.
+Under WSGI the iterator is returned unchanged.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+_DONE = object()
+
+
+async def aiterate(iterator, thread_sensitive=True):
+    """
+    Yields ``iterator``'s chunks, each fetched with ``sync_to_async``. Keep
+    ``thread_sensitive`` for iterators holding a database cursor: every fetch
+    then runs in the request's sync thread, on the cursor's connection.
+    """
+    iterator = iter(iterator)
+    fetch = sync_to_async(next, thread_sensitive=thread_sensitive)
+    try:
+        while True:
+            chunk = await fetch(iterator, _DONE)
+            if chunk is _DONE:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=thread_sensitive)()
+
+
+def is_asgi(request):
+    # DRF's Request wraps Django's
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def streaming_content(request, iterator, thread_sensitive=True):
+    """What to hand ``StreamingHttpResponse`` for ``iterator`` on this server."""
+    if is_asgi(request):
+        return aiterate(iterator, thread_sensitive)
+    return iterator
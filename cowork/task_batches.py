@@ -0,0 +1,89 @@
+"""
+Creating and updating a room's tasks in bulk, e.g. when importing a sprint
+backlog.
+
+A batch costs a fixed number of queries however many tasks it holds: one
+resolves every assignee and checks their membership of the room, one loads
+the tasks being updated, then one ``bulk_create`` and one ``bulk_update``.
+Items that fail validation are reported individually and the rest of the
+batch is still written. ``bulk_create`` and ``bulk_update`` send no signals,
+so the tasks are indexed for search here.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import CustomUser
+from cowork import metrics, search
+from cowork.models import Room, Task
+
+
+CREATED = metrics.counter("chat.tasks.bulk_created")
+UPDATED = metrics.counter("chat.tasks.bulk_updated")
+
+FIELDS = ("title", "description", "completed", "due_date", "assigned_to")
+
+
+def _members(room, usernames):
+    """Users among ``usernames`` who belong to ``room``; the creator counts."""
+    if not usernames:
+        return {}
+    members = Room.users.through.objects.filter(room_id=room.pk).values("customuser_id")
+    users = CustomUser.objects.filter(username__in=usernames).filter(Q(pk__in=members) | Q(pk=room.created_by_id))
+    return {user.username: user for user in users}
+
+
+def save_tasks(room, items):
+    """
+    Writes ``items`` (validated dicts of task fields, ``assigned_to`` being
+    a username) to ``room``. An item with an ``id`` updates that task of the
+    room with the fields it carries; any other item creates a task. ``None``
+    items (invalid upstream) are skipped.
+
+    Returns one ``{"id", "status"}`` (``created`` or ``updated``) or
+    ``{"errors"}`` per item, in order.
+    """
+    results = [None] * len(items)
+    members = _members(room, {item["assigned_to"] for item in items if item and "assigned_to" in item})
+    update_ids = [item["id"] for item in items if item and "id" in item]
+    existing = Task.objects.filter(room=room, pk__in=update_ids).in_bulk() if update_ids else {}
+
+    created, updated, changed = [], {}, set()
+    for index, item in enumerate(items):
+        if item is None:
+            continue
+        errors = {}
+        fields = {field: item[field] for field in FIELDS if field in item}
+        if "assigned_to" in fields:
+            fields["assigned_to"] = members.get(fields["assigned_to"])
+            if fields["assigned_to"] is None:
+                errors["assigned_to"] = ["The assigned user must be a member of the room or the room creator."]
+        if "id" in item:
+            task = existing.get(item["id"])
+            if task is None:
+                errors["id"] = ["No such task in this room."]
+            elif task.pk in updated:
+                errors["id"] = ["This task appears more than once in the batch."]
+        if errors:
+            results[index] = {"errors": errors}
+            continue
+        if "id" in item:
+            for field, value in fields.items():
+                setattr(task, field, value)
+            changed.update(fields)
+            updated[task.pk] = (index, task)
+        else:
+            created.append((index, Task(room=room, **fields)))
+
+    with transaction.atomic():
+        Task.objects.bulk_create([task for _, task in created])
+        if updated and changed:
+            Task.objects.bulk_update([task for _, task in updated.values()], sorted(changed))
+        search.index_tasks([task for _, task in created] + [task for _, task in updated.values()])
+
+    for index, task in created:
+        results[index] = {"id": task.pk, "status": "created"}
+    for index, task in updated.values():
+        results[index] = {"id": task.pk, "status": "updated"}
+    CREATED.inc(len(created))
+    UPDATED.inc(len(updated))
+    return results
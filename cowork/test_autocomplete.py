@@ -0,0 +1,126 @@
+import statistics
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.autocomplete import LRUCache, PrefixIndex, normalize, room_autocomplete
+from cowork.models import Room
+
+
+User = get_user_model()
+
+
+class PrefixIndexTests(APITestCase):
+    def setUp(self):
+        self.index = PrefixIndex([
+            (1, 'Weekly Design Sync', 'weekly'),
+            (2, 'Design reviews', 'reviews'),
+            (3, 'Café Órbita', 'cafe'),
+            (4, 'Launch', 'launch'),
+        ])
+
+    def names(self, query, limit=10):
+        return [name for name, slug in self.index.lookup(query, limit)]
+
+    def test_name_and_word_prefixes(self):
+        self.assertEqual(self.names('design'), ['Design reviews', 'Weekly Design Sync'])
+        self.assertEqual(self.names('  WEEKLY   des'), ['Weekly Design Sync'])
+        self.assertEqual(self.names('orb'), ['Café Órbita'])
+
+    def test_fuzzy_after_prefix_matches(self):
+        self.assertEqual(self.names('lanch'), ['Launch'])
+        self.assertEqual(self.names('dseign'), ['Design reviews', 'Weekly Design Sync'])
+        self.assertEqual(self.names('xq'), [])
+
+    def test_limit(self):
+        self.assertEqual(len(self.names('d', limit=1)), 1)
+
+    def test_add_and_remove(self):
+        self.index.add(4, 'Liftoff', 'launch')
+        self.assertEqual(self.names('launch'), [])
+        self.assertEqual(self.names('lift'), ['Liftoff'])
+        self.index.remove(4)
+        self.assertEqual(self.names('lift'), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_lookup_stays_fast(self):
+        words = ['alpha', 'design', 'weekly', 'launch', 'roadmap', 'infra', 'mobile', 'hiring']
+        index = PrefixIndex(
+            (i, f'{words[i % 8]} {words[i // 8 % 8]} {i}', str(i)) for i in range(100000))
+        timings = []
+        for query in ['d', 'des', 'weekly ro', 'lanch', 'infar', 'zzz'] * 50:
+            started = time.perf_counter()
+            index.lookup(query, 10)
+            timings.append(time.perf_counter() - started)
+        self.assertLess(statistics.median(timings), 0.001)
+
+
+class LRUCacheTests(APITestCase):
+    def test_eviction_and_expiry(self):
+        now = [0]
+        cache = LRUCache(2, ttl=10, clock=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        now[0] = 11
+        self.assertIsNone(cache.get('a'))
+
+
+class RoomAutocompleteTests(APITestCase):
+    def setUp(self):
+        room_autocomplete.reset()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.room = Room.objects.create(name='Release planning')
+        Room.objects.create(name='Release secrets', is_private=True)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('room-autocomplete')
+
+    def tearDown(self):
+        room_autocomplete.reset()
+
+    def suggest(self, q, **params):
+        response = self.client.get(self.url, dict(params, q=q))
+        self.assertEqual(response.status_code, 200, response.content)
+        return [room['name'] for room in response.json()['results']]
+
+    def test_public_rooms_only(self):
+        self.assertEqual(self.suggest('rel'), ['Release planning'])
+        self.assertEqual(self.suggest('planing'), ['Release planning'])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_index_follows_room_changes(self):
+        self.suggest('rel')
+        Room.objects.create(name='Release party')
+        self.assertEqual(self.suggest('release p'), ['Release party', 'Release planning'])
+        self.room.is_private = True
+        self.room.save()
+        self.assertEqual(self.suggest('release p'), ['Release party'])
+        Room.objects.filter(name='Release party').delete()
+        self.assertEqual(self.suggest('release p'), [])
+
+    def test_hot_prefixes_are_cached(self):
+        self.suggest('rel')
+        with mock.patch.object(PrefixIndex, 'lookup') as lookup, self.assertNumQueries(0):
+            self.assertEqual(self.suggest('REL'), ['Release planning'])
+        lookup.assert_not_called()
+
+    def test_strict_limit(self):
+        Room.objects.bulk_create([Room(name=f'Release {i}', slug=f'release-{i}') for i in range(30)])
+        room_autocomplete.reset()
+        self.assertEqual(len(self.suggest('rel')), 10)
+        self.assertEqual(len(self.suggest('rel', limit=3)), 3)
+        with self.settings(CHAT_AUTOCOMPLETE_MAX_LIMIT=5):
+            self.assertEqual(len(self.suggest('rel', limit=50)), 5)
+        self.assertEqual(self.client.get(self.url, {'q': 'rel', 'limit': 'x'}).status_code, 400)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url, {'q': 'rel'}).status_code, 401)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Ça  VA '), 'ca va')
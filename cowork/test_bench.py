@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from cowork.management.commands.bench_chat import Command
+from cowork.models import Message, Room
+
+
+User = get_user_model()
+
+
+class BenchFixtureTests(TestCase):
+    def test_teardown_deletes_only_its_own_fixtures(self):
+        alice = User.objects.create_user(email='alice@example.com', password='testpassword', username='bench-alice')
+        Room.objects.bulk_create([Room(name='Bench press club', slug='bench-press-club')])
+        command = Command()
+        users, rooms = command.setup_fixtures(3, 2)
+        self.assertNotIn(alice, users)
+        self.assertEqual(len({user.username for user in users}), 3)
+        self.assertNotIn('bench-press-club', [room.slug for room in rooms])
+        Message.objects.create(room=rooms[0], user=users[0], message='bench:1')
+
+        command.teardown_fixtures()
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['bench-alice'])
+        self.assertEqual(list(Room.objects.values_list('slug', flat=True)), ['bench-press-club'])
+        self.assertFalse(Message.objects.exists())
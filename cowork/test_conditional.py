@@ -0,0 +1,104 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.models import Message, Room
+from cowork.persistence import MessageWriteBehind
+
+
+User = get_user_model()
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        self.other = User.objects.create_user(
+            email='other@example.com', password='testpassword', username='otheruser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='etag-room')])
+        self.room = Room.objects.get(slug='etag-room')
+        Message.objects.create(room=self.room, user=self.user, message="hello")
+        self.client.force_authenticate(user=self.user)
+
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_room_detail_not_modified(self):
+        url = reverse('chat', args=['etag-room'])
+        etag = self.client.get(url)["ETag"]
+        with mock.patch("cowork.views.RoomSerializer") as serializer:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        serializer.assert_not_called()
+
+    def test_history_not_modified(self):
+        url = reverse('get-message', args=['etag-room'])
+        etag = self.client.get(url)["ETag"]
+        with mock.patch("cowork.views.ReceiveMessageSerializer") as serializer:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        serializer.assert_not_called()
+
+    def test_revalidation_does_not_flush(self):
+        url = reverse('get-message', args=['etag-room'])
+        etag = self.client.get(url)["ETag"]
+        with mock.patch.object(MessageWriteBehind, "flush_sync") as flush:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        flush.assert_not_called()
+
+    def test_queued_messages_invalidate(self):
+        writer = MessageWriteBehind()
+        url = reverse('get-message', args=['etag-room'])
+        etag = self.client.get(url)["ETag"]
+        writer._pending.append((Message(room=self.room, user=self.other, message="queued"), None))
+        with mock.patch("cowork.views.message_writer", writer):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["messages"][-1]["message"], "queued")
+        self.assertEqual(len(writer), 0)
+
+    def test_last_modified(self):
+        url = reverse('get-message', args=['etag-room'])
+        last_modified = self.client.get(url)["Last-Modified"]
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_new_message_invalidates(self):
+        self.assertRevalidates(
+            reverse('get-message', args=['etag-room']),
+            lambda: Message.objects.create(room=self.room, user=self.other, message="hi"),
+        )
+
+    def test_write_behind_flush_invalidates(self):
+        writer = MessageWriteBehind()
+        self.assertRevalidates(
+            reverse('get-message', args=['etag-room']),
+            lambda: writer._write([Message(room=self.room, user=self.other, message="hi")]),
+        )
+
+    def test_deleted_message_invalidates(self):
+        self.assertRevalidates(
+            reverse('get-message', args=['etag-room']),
+            lambda: Message.objects.filter(room=self.room).first().delete(),
+        )
+
+    def test_membership_invalidates(self):
+        url = reverse('chat', args=['etag-room'])
+        self.assertRevalidates(url, lambda: self.room.users.add(self.other))
+        self.assertRevalidates(url, lambda: self.other.room_set.remove(self.room))
+        self.assertRevalidates(url, lambda: self.room.users.add(self.other))
+        self.assertRevalidates(url, lambda: self.other.room_set.clear())
+
+    def test_likes_invalidate(self):
+        url = reverse('chat', args=['etag-room'])
+        self.assertRevalidates(url, lambda: self.client.post(reverse('like-room', args=['etag-room'])))
+        self.assertRevalidates(url, lambda: self.other.liked_rooms.add(self.room))
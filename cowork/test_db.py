@@ -0,0 +1,24 @@
+import time
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from cowork.db import chat_db
+
+
+@chat_db
+def remaining_connection_age():
+    """Seconds the connection this pool thread kept from an earlier call has left."""
+    close_at = connection.close_at if connection.connection is not None else None
+    connection.ensure_connection()
+    return None if close_at is None else close_at - time.monotonic()
+
+
+@override_settings(CHAT_DB_CONN_MAX_AGE=60)
+class ChatDatabasePoolTests(TransactionTestCase):
+    async def test_pool_keeps_connections_open_despite_conn_max_age_zero(self):
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], 0)
+        ages = [await remaining_connection_age() for _ in range(5)]
+        kept = [age for age in ages if age is not None]
+        self.assertTrue(kept)
+        self.assertTrue(all(age > 30 for age in kept), ages)
@@ -0,0 +1,155 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from cowork import derivatives
+from cowork.models import MediaBlob, Message, Room
+from serializers.serializers import ReceiveMessageSerializer
+
+
+User = get_user_model()
+
+
+def jpeg(width, height, color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class DerivativeTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmp, CHAT_DERIVATIVE_WORKERS=0)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='media-room')])
+        self.room = Room.objects.get(slug='media-room')
+        derivatives._cache_bytes = None
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp)
+
+    def message_with_image(self, width=2000, height=1000, color="red"):
+        message = Message(room=self.room, user=self.user, message="pic")
+        message.media.save(f"{color}.jpg", ContentFile(jpeg(width, height, color)), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            message.save()
+        return message
+
+    def test_saving_media_renders_derivatives(self):
+        message = self.message_with_image()
+        urls = ReceiveMessageSerializer(message).data["derivatives"]
+        self.assertIsNotNone(urls["thumbnail"])
+        self.assertIsNotNone(urls["preview"])
+        key = derivatives.source_of(message)[0]
+        with Image.open(os.path.join(self.tmp, derivatives.derivative_name(key, "thumbnail"))) as image:
+            self.assertEqual(image.size, (320, 160))
+
+    def test_blob_derivatives_are_shared(self):
+        blob = MediaBlob.objects.create(
+            sha256="ab" * 32, file=ContentFile(jpeg(800, 800), name="blob.jpg"),
+            size=1, content_type="image/jpeg")
+        first = Message.objects.create(room=self.room, user=self.user, media_blob=blob)
+        derivatives.schedule(first).result()
+        second = Message.objects.create(room=self.room, user=self.user, media_blob=blob)
+        # Already rendered for the first message: nothing to queue
+        with mock.patch.object(derivatives, "schedule") as schedule:
+            self.assertIsNotNone(derivatives.urls(second)["thumbnail"])
+        schedule.assert_not_called()
+
+    def test_reposted_file_is_rendered_once(self):
+        blob = MediaBlob.objects.create(
+            sha256="ef" * 32, file=ContentFile(jpeg(800, 800), name="repost.jpg"),
+            size=1, content_type="image/jpeg")
+        with mock.patch.object(derivatives.imaging, "render", wraps=derivatives.imaging.render) as render:
+            for _ in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Message.objects.create(room=self.room, user=self.user, media_blob=blob)
+            with self.captureOnCommitCallbacks(execute=True):
+                derivatives.schedule_on_commit([
+                    Message.objects.create(room=self.room, user=self.user, media_blob=blob) for _ in range(2)])
+        self.assertEqual(render.call_count, 1)
+
+    def test_cache_size_is_tracked_without_walking(self):
+        self.message_with_image(color="red")
+        with mock.patch.object(derivatives.os, "walk", wraps=os.walk) as walk:
+            self.message_with_image(color="green")
+            walk.assert_not_called()
+            with override_settings(CHAT_DERIVATIVE_CACHE_BYTES=1):
+                self.message_with_image(color="blue")
+        walk.assert_called_once()
+        # Over the cap, so everything was evicted
+        self.assertEqual(derivatives._cache_bytes, 0)
+
+    def test_not_ready_yet(self):
+        message = Message(room=self.room, user=self.user)
+        message.media.save("late.jpg", ContentFile(jpeg(100, 100)), save=False)
+        with override_settings(CHAT_DERIVATIVE_WORKERS=2):
+            # Nothing rendered yet: null urls, and the render is queued
+            derivatives._in_flight.add(derivatives.source_of(message)[0])
+            try:
+                self.assertEqual(derivatives.urls(message), {"thumbnail": None, "preview": None})
+            finally:
+                derivatives._in_flight.clear()
+
+    def test_unrenderable_media(self):
+        message = Message(room=self.room, user=self.user)
+        message.media.save("notes.txt", ContentFile(b"hello"), save=True)
+        self.assertIsNone(ReceiveMessageSerializer(message).data["derivatives"])
+        self.assertIsNone(
+            ReceiveMessageSerializer(Message(room=self.room, user=self.user)).data["derivatives"])
+
+    def test_broken_image_is_not_retried(self):
+        message = Message(room=self.room, user=self.user)
+        message.media.save("broken.jpg", ContentFile(b"not a jpeg"), save=False)
+        with self.assertLogs("cowork.derivatives", "ERROR"):
+            future = derivatives.schedule(message)
+        self.assertIsNotNone(future.exception())
+        self.assertIsNone(derivatives.schedule(message))
+        derivatives._failed.clear()
+
+    def test_cache_is_size_limited(self):
+        messages = [self.message_with_image(color=color) for color in ("red", "green", "blue")]
+        sizes = [
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(os.path.join(self.tmp, "derivatives")) for name in names
+        ]
+        self.assertEqual(len(sizes), 6)
+        # Make the first image's derivatives the least recently used
+        for kind in derivatives.KINDS:
+            key = derivatives.source_of(messages[0])[0]
+            os.utime(os.path.join(self.tmp, derivatives.derivative_name(key, kind)), (0, 0))
+
+        derivatives.enforce_cache_limit(max_bytes=sum(sizes) - 1)
+        with override_settings(CHAT_DERIVATIVE_WORKERS=2):
+            derivatives._in_flight.update(derivatives.source_of(m)[0] for m in messages)
+            try:
+                self.assertIn(None, derivatives.urls(messages[0]).values())
+                self.assertNotIn(None, derivatives.urls(messages[2]).values())
+            finally:
+                derivatives._in_flight.clear()
+
+
+@override_settings(CHAT_DERIVATIVE_WORKERS=1)
+class DerivativePoolTests(TestCase):
+    def test_renders_in_worker_process(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with override_settings(MEDIA_ROOT=tmp):
+            user = User.objects.create_user(
+                email='test@example.com', password='testpassword', username='testuser')
+            Room.objects.bulk_create([Room(name='Test Room', slug='pool-room')])
+            message = Message(room=Room.objects.get(slug='pool-room'), user=user)
+            message.media.save("pool.jpg", ContentFile(jpeg(640, 480)), save=True)
+            written = derivatives.schedule(message).result(timeout=60)
+            self.assertEqual(set(written), {"thumbnail", "preview"})
+            self.assertIsNotNone(derivatives.urls(message)["thumbnail"])
@@ -0,0 +1,146 @@
+import json
+import tracemalloc
+import warnings
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from cowork.export import export_queryset, iter_ndjson
+from cowork.models import Message, Room
+
+
+User = get_user_model()
+
+
+class RoomExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        self.other = User.objects.create_user(
+            email='other@example.com', password='testpassword', username='otheruser')
+        Room.objects.bulk_create([
+            Room(name='Test Room', slug='export-room'),
+            Room(name='Big Room', slug='big-room'),
+        ])
+        self.room = Room.objects.get(slug='export-room')
+        self.start = timezone.now() - timedelta(hours=1)
+        Message.objects.bulk_create([
+            Message(room=self.room, user=self.user if i % 2 else self.other, message=str(i),
+                    created_at=self.start + timedelta(minutes=i))
+            for i in range(10)
+        ])
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('export-messages', args=['export-room']), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b"".join(response.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_exports_every_message_in_order(self):
+        lines = self.export()
+        self.assertEqual([line["message"] for line in lines], [str(i) for i in range(10)])
+        self.assertEqual(lines[1]["user"], "testuser")
+
+    def test_filters(self):
+        lines = self.export(
+            since=(self.start + timedelta(minutes=2)).isoformat(),
+            until=(self.start + timedelta(minutes=8)).isoformat(),
+            user="otheruser",
+        )
+        self.assertEqual([line["message"] for line in lines], ["2", "4", "6"])
+
+    def test_invalid_datetime(self):
+        response = self.client.get(reverse('export-messages', args=['export-room']), {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    def peak_memory(self, room, rows):
+        Message.objects.filter(room=room).delete()
+        Message.objects.bulk_create(
+            (Message(room=room, user=self.user, message="x" * 100,
+                     created_at=self.start + timedelta(microseconds=i)) for i in range(rows)),
+            batch_size=2000,
+        )
+        tracemalloc.start()
+        try:
+            written = sum(len(chunk) for chunk in iter_ndjson(export_queryset(room), chunk_size=500))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(written, rows * 100)
+        return peak
+
+    def test_peak_memory_does_not_grow_with_room_size(self):
+        # Only chunk_size rows are in flight at any time, so a 1M-message
+        # room peaks where these do; ten times the rows must not cost more.
+        room = Room.objects.get(slug='big-room')
+        small = self.peak_memory(room, 2000)
+        large = self.peak_memory(room, 20000)
+        self.assertLess(large, small * 1.5)
+
+
+class AsgiExportStreamingTests(TransactionTestCase):
+    """Drives the ASGI handler itself, which is how the project serves HTTP."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Big Room', slug='big-room')])
+        room = Room.objects.get(slug='big-room')
+        start = timezone.now() - timedelta(hours=1)
+        Message.objects.bulk_create([
+            Message(room=room, user=self.user, message=str(i), created_at=start + timedelta(microseconds=i))
+            for i in range(2500)
+        ])
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    async def get(self, path, produced):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "server": ("testserver", 80), "client": ("127.0.0.1", 1234),
+            "headers": [(b"host", b"testserver"), (b"authorization", f"Bearer {self.token}".encode())],
+        }
+        received = iter([{"type": "http.request", "body": b"", "more_body": False}])
+        sent = []
+
+        async def receive():
+            return next(received, {"type": "http.disconnect"})
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                # How much of the export had been produced when this went out
+                sent.append((len(produced), message["body"]))
+            else:
+                sent.append(message)
+
+        await ASGIHandler()(scope, receive, send)
+        return sent
+
+    def test_first_chunk_is_sent_before_the_export_is_read(self):
+        produced = []
+
+        def spy(queryset):
+            for chunk in iter_ndjson(queryset):
+                produced.append(chunk)
+                yield chunk
+
+        with mock.patch("cowork.views.iter_ndjson", spy), warnings.catch_warnings():
+            warnings.filterwarnings("error", message="StreamingHttpResponse must consume")
+            sent = async_to_sync(self.get)(reverse('export-messages', args=['big-room']), produced)
+
+        self.assertEqual(sent[0]["status"], 200)
+        bodies = [item for item in sent[1:] if isinstance(item, tuple)]
+        self.assertEqual(len(produced), 5)
+        self.assertLess(bodies[0][0], len(produced))
+        lines = b"".join(body for _, body in bodies).decode().splitlines()
+        self.assertEqual([json.loads(line)["message"] for line in lines], [str(i) for i in range(2500)])
@@ -0,0 +1,40 @@
+import asyncio
+import tempfile
+
+from django.test import SimpleTestCase
+
+from cowork.layers import UnixSocketChannelLayer
+
+
+class UnixSocketChannelLayerTests(SimpleTestCase):
+    """Two layer instances stand in for two worker processes."""
+
+    def setUp(self):
+        self.socket_dir = tempfile.mkdtemp(prefix="coloby-layer-")
+
+    async def test_group_send_reaches_members_in_other_workers(self):
+        first = UnixSocketChannelLayer(socket_dir=self.socket_dir)
+        second = UnixSocketChannelLayer(socket_dir=self.socket_dir)
+        local = await first.new_channel()
+        remote = await second.new_channel()
+        await first.group_add("chat_room", local)
+        await second.group_add("chat_room", remote)
+
+        await first.group_send("chat_room", {"type": "chat_message", "message": "hi"})
+
+        self.assertEqual((await asyncio.wait_for(first.receive(local), 1))["message"], "hi")
+        self.assertEqual((await asyncio.wait_for(second.receive(remote), 1))["message"], "hi")
+        await first.close()
+        await second.close()
+
+    async def test_send_routes_to_owning_worker(self):
+        first = UnixSocketChannelLayer(socket_dir=self.socket_dir)
+        second = UnixSocketChannelLayer(socket_dir=self.socket_dir)
+        await first.new_channel()
+        remote = await second.new_channel()
+
+        await first.send(remote, {"type": "ping"})
+
+        self.assertEqual(await asyncio.wait_for(second.receive(remote), 1), {"type": "ping"})
+        await first.close()
+        await second.close()
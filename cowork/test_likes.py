@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.membership import memberships
+from cowork.models import Room
+
+
+User = get_user_model()
+
+
+class LikeRoomTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.room = Room.objects.create(name='Popular')
+        self.url = reverse('like-room', args=[self.room.slug])
+        self.client.force_authenticate(user=self.user)
+
+    def toggle_queries(self, room):
+        with CaptureQueriesContext(connection) as queries:
+            room.toggle_like(self.user)
+        room.toggle_like(self.user)
+        return len(queries)
+
+    def test_toggle(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.json(), {"message": "Room liked successfully.", "liked": True, "like_count": 1})
+        response = self.client.post(self.url)
+        self.assertEqual(response.json(), {"message": "Room unliked successfully.", "liked": False, "like_count": 0})
+        self.assertFalse(self.room.likes.exists())
+
+    def test_toggle_cost_does_not_grow_with_likes(self):
+        small = self.toggle_queries(self.room)
+        fans = User.objects.bulk_create([User(email=f'f{i}@example.com', username=f'f{i}') for i in range(2000)])
+        self.room.likes.add(*fans)
+        call_command("reconcile_like_counts", stdout=StringIO())
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.like_count, 2000)
+        self.assertEqual(self.toggle_queries(self.room), small)
+        self.assertTrue(self.room.toggle_like(self.user))
+        self.assertEqual(self.room.like_count, 2001)
+
+    def test_toggle_changes_room_etag(self):
+        etag = self.client.get(reverse('chat', args=[self.room.slug]))["ETag"]
+        self.client.post(self.url)
+        self.assertNotEqual(self.client.get(reverse('chat', args=[self.room.slug]))["ETag"], etag)
+
+    def test_room_detail_reports_count_and_own_like(self):
+        self.client.post(self.url)
+        data = self.client.get(reverse('chat', args=[self.room.slug])).json()
+        self.assertEqual((data["like_count"], data["liked"]), (1, True))
+        self.assertNotIn("likes", data)
+
+    def test_private_room(self):
+        room = Room.objects.create(name='Private', is_private=True)
+        self.assertEqual(self.client.post(reverse('like-room', args=[room.slug])).status_code, 403)
+
+    def test_reconcile_fixes_drift(self):
+        other = Room.objects.create(name='Other')
+        Room.objects.filter(pk=self.room.pk).update(like_count=7)
+        other.likes.add(self.user)
+        out = StringIO()
+        call_command("reconcile_like_counts", "--dry-run", stdout=out)
+        self.assertIn("Would fix 2", out.getvalue())
+        call_command("reconcile_like_counts", stdout=out)
+        self.assertEqual(
+            dict(Room.objects.values_list("name", "like_count")), {"Popular": 0, "Other": 1})
+        call_command("reconcile_like_counts", stdout=out)
+        self.assertIn("Fixed 0", out.getvalue())
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.membership import MembershipCache, memberships
+from cowork.models import Room
+
+
+User = get_user_model()
+
+
+class MembershipCacheTests(SimpleTestCase):
+    def test_answers_are_cached_until_they_expire(self):
+        now = [0]
+        cache = MembershipCache(max_entries=10, ttl=30, clock=lambda: now[0])
+        calls = []
+        lookup = lambda: calls.append(1) or True  # noqa: E731
+        self.assertTrue(cache.get(1, 1, lookup))
+        self.assertTrue(cache.get(1, 1, lookup))
+        self.assertEqual(len(calls), 1)
+        now[0] = 31
+        cache.get(1, 1, lookup)
+        self.assertEqual(len(calls), 2)
+
+    def test_least_recently_used_entries_are_dropped(self):
+        cache = MembershipCache(max_entries=2, ttl=30)
+        cache.get(1, 1, lambda: True)
+        cache.get(1, 2, lambda: True)
+        cache.get(1, 1, lambda: True)
+        cache.get(1, 3, lambda: True)
+        self.assertEqual(list(cache._entries), [(1, 1), (1, 3)])
+
+    def test_invalidation(self):
+        cache = MembershipCache(max_entries=10, ttl=30)
+        for room_id, user_id in [(1, 1), (1, 2), (2, 1), (2, 2)]:
+            cache.get(room_id, user_id, lambda: True)
+        cache.invalidate(room_ids=[1], user_ids=[1])
+        self.assertNotIn((1, 1), cache._entries)
+        cache.invalidate(room_ids=[2])
+        self.assertEqual(list(cache._entries), [(1, 2)])
+        cache.invalidate(user_ids=[2])
+        self.assertEqual(list(cache._entries), [])
+
+    def test_lookup_racing_an_invalidation_is_not_cached(self):
+        cache = MembershipCache(max_entries=10, ttl=30)
+
+        def lookup():
+            cache.invalidate(room_ids=[1], user_ids=[1])
+            return False
+
+        self.assertFalse(cache.get(1, 1, lookup))
+        self.assertNotIn((1, 1), cache._entries)
+
+
+class HasMemberTests(TestCase):
+    def setUp(self):
+        memberships.clear()
+        self.owner = User.objects.create_user(email='owner@example.com', password='testpassword', username='owner')
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.room = Room.objects.create(name='Private', is_private=True, created_by=self.owner)
+
+    def test_large_room_costs_one_query(self):
+        members = User.objects.bulk_create([
+            User(email=f'u{i}@example.com', username=f'u{i}') for i in range(500)])
+        self.room.users.add(*members)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.room.has_member(members[-1]))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.room.has_member(members[-1]))
+            self.assertTrue(self.room.has_member(self.owner))
+            self.assertFalse(self.room.has_member(AnonymousUser()))
+
+    def test_joining_and_leaving_invalidate(self):
+        self.assertFalse(self.room.has_member(self.user))
+        self.room.users.add(self.user)
+        self.assertTrue(self.room.has_member(self.user))
+        self.user.room_set.remove(self.room)
+        self.assertFalse(self.room.has_member(self.user))
+        self.user.room_set.add(self.room)
+        self.assertTrue(self.room.has_member(self.user))
+        self.room.users.clear()
+        self.assertFalse(self.room.has_member(self.user))
+
+
+class RoomDetailMembershipTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.room = Room.objects.create(name='Private', is_private=True)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('chat', args=[self.room.slug])
+
+    def test_private_room_detail(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.room.users.add(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
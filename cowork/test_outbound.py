@@ -0,0 +1,83 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from cowork.outbound import OutboundQueue, DROP_OLDEST, COALESCE, DISCONNECT
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def make_queue(self, policy, maxsize=2, batch_window=0):
+        self.sent = []
+        self.closed = False
+
+        async def send(frame):
+            self.sent.append(frame)
+
+        async def close():
+            self.closed = True
+
+        return OutboundQueue(
+            send, close, maxsize=maxsize, policy=policy, coalesce_max=3, batch_window=batch_window)
+
+    async def test_frames_are_sent_in_order(self):
+        queue = self.make_queue(DROP_OLDEST, maxsize=10)
+        queue.start()
+        for i in range(3):
+            queue.put(i)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.sent, [0, 1, 2])
+        await queue.stop()
+
+    async def test_drop_oldest_when_full(self):
+        queue = self.make_queue(DROP_OLDEST)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual(queue.dropped, 3)
+        queue.start()
+        await asyncio.sleep(0)
+        self.assertEqual(self.sent, [3, 4])
+        await queue.stop()
+
+    async def test_coalesce_keeps_single_frames_without_batching(self):
+        queue = self.make_queue(COALESCE)
+        for i in range(5):
+            queue.put(i)
+        self.assertEqual((queue.dropped, queue.coalesced), (1, 2))
+        queue.start()
+        await asyncio.sleep(0)
+        self.assertEqual(self.sent, [1, 2, 3, 4])
+        await queue.stop()
+
+    async def test_coalesce_folds_frames_into_array_when_batching(self):
+        queue = self.make_queue(COALESCE, batch_window=0.01)
+        for i in range(4):
+            queue.put(i)
+        self.assertEqual((queue.dropped, queue.coalesced), (0, 2))
+        # The newest entry already holds coalesce_max frames: drop the oldest
+        queue.put(4)
+        self.assertEqual((queue.dropped, queue.coalesced), (1, 2))
+        queue.start()
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.sent, [[1, 2, 3, 4]])
+        await queue.stop()
+
+    async def test_disconnect_policy_closes_socket(self):
+        queue = self.make_queue(DISCONNECT)
+        for i in range(3):
+            queue.put(i)
+        await asyncio.sleep(0)
+        self.assertTrue(self.closed)
+        self.assertTrue(queue.closed)
+        await queue.stop()
+
+    async def test_batching_sends_window_as_one_array_frame(self):
+        queue = self.make_queue(DROP_OLDEST, maxsize=10, batch_window=0.01)
+        queue.start()
+        for i in range(4):
+            queue.put(i)
+        await asyncio.sleep(0.05)
+        queue.put(4)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.sent, [[0, 1, 2, 3], 4])
+        await queue.stop()
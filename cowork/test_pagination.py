@@ -0,0 +1,96 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from cowork.membership import memberships
+from cowork.models import Message, Room
+
+
+User = get_user_model()
+
+
+class MessageHistoryPaginationTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='history-room')])
+        self.room = Room.objects.get(slug='history-room')
+        start = timezone.now() - timedelta(hours=1)
+        # Pairs of messages share a timestamp so pages must break ties on id
+        Message.objects.bulk_create([
+            Message(room=self.room, user=self.user, message=str(i),
+                    created_at=start + timedelta(seconds=i // 2))
+            for i in range(25)
+        ])
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('get-message', args=['history-room'])
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def texts(self, page):
+        return [message["message"] for message in page["messages"]]
+
+    def test_first_page_is_the_newest(self):
+        page = self.get(limit=10)
+        self.assertEqual(self.texts(page), [str(i) for i in range(15, 25)])
+        self.assertIsNotNone(page["previous"])
+        self.assertIsNone(page["next"])
+
+    def test_scroll_back_and_forward(self):
+        seen = []
+        page = self.get(limit=10)
+        while True:
+            seen = self.texts(page) + seen
+            if page["previous"] is None:
+                break
+            page = self.get(limit=10, before=page["previous"])
+        self.assertEqual(seen, [str(i) for i in range(25)])
+
+        # The oldest page leads forward again without gaps or repeats
+        self.assertEqual(self.texts(page), [str(i) for i in range(5)])
+        forward = self.get(limit=10, after=page["next"])
+        self.assertEqual(self.texts(forward), [str(i) for i in range(5, 15)])
+        forward = self.get(limit=10, after=forward["next"])
+        self.assertEqual(self.texts(forward), [str(i) for i in range(15, 25)])
+        self.assertIsNone(forward["next"])
+
+    def test_page_query_count_does_not_depend_on_depth(self):
+        page = self.get(limit=2)
+        with CaptureQueriesContext(connection) as shallow:
+            page = self.get(limit=2, before=page["previous"])
+        for _ in range(8):
+            page = self.get(limit=2, before=page["previous"])
+        with CaptureQueriesContext(connection) as deep:
+            self.get(limit=2, before=page["previous"])
+        self.assertEqual(len(shallow), len(deep))
+        self.assertNotIn("OFFSET", deep.captured_queries[-1]["sql"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_room(self):
+        response = self.client.get(reverse('get-message', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_private_room_needs_membership(self):
+        room = Room.objects.create(name='Private', is_private=True)
+        Message.objects.create(room=room, user=self.user, message='secret')
+        url = reverse('get-message', args=[room.slug])
+        with mock.patch("cowork.views.message_writer") as writer:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("ETag", response)
+        writer.flush_sync.assert_not_called()
+        room.users.add(self.user)
+        self.assertEqual(self.texts(self.client.get(url).json()), ['secret'])
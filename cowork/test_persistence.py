@@ -0,0 +1,92 @@
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+
+from cowork.models import Room, Message
+from cowork.persistence import MessageWriteBehind, message_writer
+from cowork.routing import websocket_urlpatterns
+
+
+User = get_user_model()
+
+
+class MessageWriteBehindTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        # bulk_create keeps Room.save() out of the fixture
+        Room.objects.bulk_create([Room(name='Test Room', slug='test-room')])
+        self.room = Room.objects.get(slug='test-room')
+
+    async def test_flush_persists_queued_messages_in_order(self):
+        writer = MessageWriteBehind(batch_size=50, flush_interval=60)
+        for i in range(10):
+            writer.enqueue(Message(room=self.room, user=self.user, message=f"message {i}"))
+        self.assertEqual(len(writer), 10)
+
+        await writer.flush()
+
+        self.assertEqual(len(writer), 0)
+        texts = await sync_to_async(list)(
+            Message.objects.order_by("created_at").values_list("message", flat=True))
+        self.assertEqual(texts, [f"message {i}" for i in range(10)])
+
+    def test_flush_sync_drains_queue_without_event_loop(self):
+        writer = MessageWriteBehind(batch_size=50, flush_interval=60)
+        writer._pending.append((Message(room=self.room, user=self.user, message="bye"), None))
+
+        writer.flush_sync()
+
+        self.assertTrue(Message.objects.filter(message="bye").exists())
+
+    async def test_sender_is_told_about_dropped_messages(self):
+        writer = MessageWriteBehind(batch_size=50, flush_interval=60)
+        dropped = []
+        writer.enqueue(Message(room=self.room, user=self.user, message="kept"), lambda: dropped.append("kept"))
+        # Its room no longer exists by the time the batch is written
+        gone = Room(pk=self.room.pk + 1, name="Gone", slug="gone")
+        writer.enqueue(Message(room=gone, user=self.user, message="lost"), lambda: dropped.append("lost"))
+
+        with self.assertLogs("cowork.persistence", "ERROR"):
+            await writer.flush()
+
+        self.assertEqual(dropped, ["lost"])
+        texts = await sync_to_async(list)(Message.objects.values_list("message", flat=True))
+        self.assertEqual(texts, ["kept"])
+
+
+class ChatInputTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='input-room')])
+
+    async def test_invalid_frames_are_rejected_without_closing_the_socket(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/chat/input-room/")
+        communicator.scope["user"] = self.user
+        await communicator.connect()
+
+        for frame in ({"text": "no message key"}, {"message": ["not", "a", "string"]}, ["list"]):
+            await communicator.send_json_to(frame)
+            self.assertEqual(await communicator.receive_json_from(), {"error": "invalid_message"})
+
+        await communicator.send_json_to({"message": "still here"})
+        self.assertEqual((await communicator.receive_json_from())["message"], "still here")
+        await communicator.disconnect()
+
+    async def test_sender_hears_about_a_message_that_was_not_saved(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/chat/input-room/")
+        communicator.scope["user"] = self.user
+        await communicator.connect()
+
+        with mock.patch.object(MessageWriteBehind, "_write", autospec=True, side_effect=lambda writer, batch: batch):
+            await communicator.send_json_to({"message": "lost"})
+            frame = await communicator.receive_json_from()
+            await message_writer.flush()
+        self.assertEqual(await communicator.receive_json_from(), {
+            "error": "not_saved", "seq": frame["seq"], "epoch": frame["epoch"]})
+        await communicator.disconnect()
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.models import Room
+from cowork.presence import PresenceTracker, presence
+from cowork.routing import websocket_urlpatterns
+
+
+User = get_user_model()
+
+
+class PresenceTrackerTests(SimpleTestCase):
+    def setUp(self):
+        self.tracker = PresenceTracker()
+
+    def test_user_stays_online_until_last_connection_closes(self):
+        self.assertTrue(self.tracker.connect(1, "alice"))
+        self.assertFalse(self.tracker.connect(1, "alice"))
+        self.assertEqual(self.tracker.connection_count(1), 2)
+
+        self.assertFalse(self.tracker.disconnect(1, "alice"))
+        self.assertTrue(self.tracker.is_online(1, "alice"))
+        self.assertTrue(self.tracker.disconnect(1, "alice"))
+        self.assertEqual(self.tracker.online(1), [])
+
+    def test_rooms_are_tracked_independently(self):
+        self.tracker.connect(1, "alice")
+        self.tracker.connect(2, "bob")
+
+        self.assertEqual(self.tracker.online(1), ["alice"])
+        self.assertEqual(self.tracker.online(2), ["bob"])
+
+    def test_unknown_disconnect_is_ignored(self):
+        self.assertFalse(self.tracker.disconnect(1, "alice"))
+
+
+class ChatPresenceTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='presence-room')])
+        self.room = Room.objects.get(slug='presence-room')
+
+    def communicator(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/chat/presence-room/")
+        communicator.scope["user"] = user
+        return communicator
+
+    async def test_anonymous_user_is_rejected(self):
+        member = self.communicator(self.user)
+        await member.connect()
+
+        anonymous = self.communicator(AnonymousUser())
+        connected, code = await anonymous.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+        self.assertEqual(presence.online(self.room.id), [self.user.id])
+        self.assertTrue(await member.receive_nothing())
+        await member.disconnect()
+
+
+class RoomPresenceViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        self.other = User.objects.create_user(
+            email='other@example.com', password='testpassword', username='other')
+        Room.objects.bulk_create([Room(name='Test Room', slug='presence-room')])
+        self.room = Room.objects.get(slug='presence-room')
+        self.client.force_authenticate(user=self.user)
+
+    def test_only_this_workers_connections_are_listed(self):
+        here, elsewhere = PresenceTracker(), PresenceTracker()
+        here.connect(self.room.id, self.user.id)
+        # Held by another worker process, whose tracker this one cannot see
+        elsewhere.connect(self.room.id, self.other.id)
+        with mock.patch("cowork.views.presence", here):
+            response = self.client.get(reverse('room-presence', args=['presence-room']))
+        self.assertEqual(response.json(), {"online": ["testuser"], "count": 1})
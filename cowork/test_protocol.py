@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import msgpack
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+
+from cowork.models import Message, Room
+from cowork.protocol import JSONCodec, MsgpackCodec, MSGPACK_SUBPROTOCOL, MESSAGE, USER, EPOCH, RESUME, negotiate
+from cowork.routing import websocket_urlpatterns
+
+
+User = get_user_model()
+
+
+class MsgpackCodecTests(SimpleTestCase):
+    frame = {
+        "message": "hi", "username": "alice", "seq": 7, "epoch": "abc",
+        "created_at": "2024-01-20T16:00:00.000123+00:00",
+    }
+
+    def test_users_are_interned_per_connection(self):
+        codec = MsgpackCodec()
+        first = msgpack.unpackb(codec.encode(self.frame)[1])
+        second = msgpack.unpackb(codec.encode(dict(self.frame, seq=8))[1])
+
+        self.assertEqual(first, [
+            [EPOCH, "abc"], [USER, 1, "alice"], [MESSAGE, 7, 1, 1705766400000123, "hi", None]])
+        self.assertEqual(second, [[MESSAGE, 8, 1, 1705766400000123, "hi", None]])
+
+    def test_replayed_messages_carry_their_id(self):
+        records = msgpack.unpackb(MsgpackCodec().encode(dict(self.frame, seq=None, epoch=None, id=42))[1])
+        self.assertEqual(records[-1], [MESSAGE, None, 1, 1705766400000123, "hi", 42])
+
+    def test_resume_record_is_translated(self):
+        data = msgpack.packb([3, 7, "abc", 1705766400000123, 42])
+        self.assertEqual(MsgpackCodec().decode(bytes_data=data), {
+            "type": "resume", "last_seq": 7, "epoch": "abc",
+            "since": "2024-01-20T16:00:00.000123+00:00", "since_id": 42,
+        })
+        # since_id is optional
+        data = msgpack.packb([3, 7, "abc", 1705766400000123])
+        self.assertIsNone(MsgpackCodec().decode(bytes_data=data)["since_id"])
+
+    def test_negotiation_defaults_to_json(self):
+        self.assertIsInstance(negotiate([]), JSONCodec)
+        self.assertIsInstance(negotiate(["other", MSGPACK_SUBPROTOCOL]), MsgpackCodec)
+
+
+class BinaryChatTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='binary-room')])
+
+    async def test_binary_client_round_trip(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), "/chat/binary-room/", subprotocols=[MSGPACK_SUBPROTOCOL])
+        communicator.scope["user"] = self.user
+        connected, subprotocol = await communicator.connect()
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+
+        await communicator.send_to(bytes_data=msgpack.packb([MESSAGE, "hello"]))
+        records = msgpack.unpackb(await communicator.receive_from())
+
+        self.assertEqual(records[-2], [USER, 1, "testuser"])
+        self.assertEqual(records[-1][4], "hello")
+        await communicator.disconnect()
+
+    async def test_binary_resume_keysets_on_timestamp_and_id(self):
+        room = await database_sync_to_async(Room.objects.get)(slug='binary-room')
+        at = timezone.now() - timedelta(minutes=1)
+        first, second, third = await database_sync_to_async(Message.objects.bulk_create)([
+            Message(room=room, user=self.user, message=text, created_at=at) for text in ("a", "b", "c")])
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), "/chat/binary-room/", subprotocols=[MSGPACK_SUBPROTOCOL])
+        communicator.scope["user"] = self.user
+        await communicator.connect()
+
+        since_us = (at - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1)
+        await communicator.send_to(bytes_data=msgpack.packb([RESUME, None, None, since_us, first.pk]))
+        records = msgpack.unpackb(await communicator.receive_from())
+        records += msgpack.unpackb(await communicator.receive_from())
+
+        messages = [record for record in records if record[0] == MESSAGE]
+        self.assertEqual([(record[4], record[5]) for record in messages], [("b", second.pk), ("c", third.pk)])
+        await communicator.disconnect()
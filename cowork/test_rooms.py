@@ -0,0 +1,109 @@
+import tempfile
+import threading
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.identifiers import EPOCH_MS, IdGenerator, base36, room_slug
+from cowork.models import Room
+
+
+User = get_user_model()
+
+
+class IdGeneratorTests(SimpleTestCase):
+    def test_unique_and_ordered_across_threads(self):
+        generator = IdGenerator(worker=7)
+        ids = []
+
+        def make():
+            ids.extend(generator.next() for _ in range(5000))
+
+        threads = [threading.Thread(target=make) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 20000)
+
+    def test_clock_going_backwards(self):
+        now = [(EPOCH_MS + 10000) / 1000]
+        generator = IdGenerator(worker=1, clock=lambda: now[0])
+        first = generator.next()
+        now[0] -= 5
+        self.assertGreater(generator.next(), first)
+
+    def test_sequence_overflow_moves_to_next_millisecond(self):
+        generator = IdGenerator(worker=1, clock=lambda: (EPOCH_MS + 10000) / 1000)
+        ids = [generator.next() for _ in range(5000)]
+        self.assertEqual(len(set(ids)), 5000)
+        self.assertEqual(ids, sorted(ids))
+
+    def test_workers_do_not_collide(self):
+        clock = lambda: (EPOCH_MS + 10000) / 1000  # noqa: E731
+        a, b = IdGenerator(worker=1, clock=clock), IdGenerator(worker=2, clock=clock)
+        self.assertFalse({a.next() for _ in range(100)} & {b.next() for _ in range(100)})
+
+    def test_unconfigured_workers_claim_distinct_numbers(self):
+        clock = lambda: (EPOCH_MS + 10000) / 1000  # noqa: E731
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(CHAT_ID_WORKER=None, CHAT_ID_WORKER_DIR=directory):
+            a, b = IdGenerator(clock=clock), IdGenerator(clock=clock)
+            self.assertFalse({a.next() for _ in range(100)} & {b.next() for _ in range(100)})
+            a._claim.close()
+            b._claim.close()
+
+    def test_slug(self):
+        self.assertEqual(base36(0), "0")
+        self.assertEqual(base36(71), "1z")
+        slug = room_slug("Weekly Sync!")
+        self.assertRegex(slug, r"^weekly-sync-[0-9a-z]+$")
+        self.assertLessEqual(len(room_slug("x" * 200)), 50)
+        self.assertRegex(room_slug("!!!"), r"^[0-9a-z]+$")
+
+
+class RoomSaveTests(TestCase):
+    def room_queries(self, queries):
+        return [q["sql"] for q in queries.captured_queries if '"cowork_room"' in q["sql"]]
+
+    def test_create_and_update_are_one_query_each(self):
+        # Other tables (the search index) may be written too, but the room
+        # table is never probed for a free slug.
+        with CaptureQueriesContext(connection) as queries:
+            room = Room.objects.create(name="Design review")
+        self.assertEqual(len(self.room_queries(queries)), 1)
+        self.assertTrue(self.room_queries(queries)[0].startswith("INSERT"))
+        self.assertTrue(room.slug.startswith("design-review-"))
+        slug = room.slug
+        room.description = "Fortnightly"
+        with CaptureQueriesContext(connection) as queries:
+            room.save()
+        self.assertEqual(len(self.room_queries(queries)), 1)
+        self.assertTrue(self.room_queries(queries)[0].startswith("UPDATE"))
+        room.refresh_from_db()
+        self.assertEqual(room.slug, slug)
+
+    def test_slug_collision_draws_a_new_slug(self):
+        Room.objects.create(name="Taken", slug="taken-1")
+        with mock.patch("cowork.models.room_slug", side_effect=["taken-1", "taken-2"]):
+            self.assertEqual(Room.objects.create(name="Taken").slug, "taken-2")
+
+    def test_explicit_slug_is_kept(self):
+        self.assertEqual(Room.objects.create(name="Named", slug="named").slug, "named")
+
+
+class RoomCreateViewTests(APITestCase):
+    def test_rooms_with_the_same_name_get_distinct_slugs(self):
+        user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.client.force_authenticate(user=user)
+        slugs = {
+            self.client.post(reverse('room-create-join'), {"action": "create", "room_name": "Standup"}).json()["slug"]
+            for _ in range(20)
+        }
+        self.assertEqual(len(slugs), 20)
+        self.assertEqual(Room.objects.filter(created_by=user).count(), 20)
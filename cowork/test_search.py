@@ -0,0 +1,142 @@
+import datetime
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork import search
+from cowork.membership import memberships
+from cowork.models import Comment, Message, Room, SearchDocument, Task
+
+
+User = get_user_model()
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.room = Room.objects.create(name='Release planning', description='Shipping the mobile app')
+        self.private = Room.objects.create(name='Secret launch', is_private=True)
+        self.task = Task.objects.create(
+            room=self.room, title='Write release notes', description='Summarize the changes',
+            due_date=datetime.date(2030, 1, 1), assigned_to=self.user)
+        self.comment = Comment.objects.create(task=self.task, user=self.user, text='Notes drafted for launch')
+        self.message = Message.objects.create(room=self.room, user=self.user, message='Launch is on friday')
+        Message.objects.create(room=self.private, user=self.user, message='Launch codes inside')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('search')
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def hits(self, **params):
+        return [(hit["type"], hit["id"]) for hit in self.get(**params)["results"]]
+
+    def test_saves_are_indexed(self):
+        self.assertEqual(SearchDocument.objects.count(), 6)
+        self.assertCountEqual(self.hits(q='launch'), [('comment', self.comment.pk), ('message', self.message.pk)])
+
+    def test_updates_and_deletes(self):
+        self.message.message = 'Postponed to monday'
+        self.message.save()
+        self.assertEqual(self.hits(q='monday'), [('message', self.message.pk)])
+        self.assertNotIn(('message', self.message.pk), self.hits(q='friday'))
+        Comment.objects.filter(pk=self.comment.pk).delete()
+        self.assertEqual(self.hits(q='drafted'), [])
+
+    def test_private_rooms_need_membership(self):
+        self.assertEqual(self.hits(q='codes'), [])
+        self.private.users.add(self.user)
+        self.assertEqual(len(self.hits(q='codes')), 1)
+
+    def test_ranking(self):
+        best = Message.objects.create(room=self.room, user=self.user, message='launch launch launch checklist')
+        self.assertEqual(self.hits(q='launch', type='message')[0], ('message', best.pk))
+
+    def test_stemming_and_all_words(self):
+        self.assertIn(('task', self.task.pk), self.hits(q='summarizing change'))
+        self.assertEqual(self.hits(q='release friday'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.get(q='"launch OR NEAR( *')["count"], 0)
+        self.assertEqual(len(self.hits(q='launch*')), 2)
+
+    def test_type_filter_and_pagination(self):
+        Message.objects.bulk_create([
+            Message(room=self.room, user=self.user, message=' '.join(['standup'] * (i % 3 + 1)) + f' {i}')
+            for i in range(30)
+        ])
+        call_command("rebuild_search_index", stdout=StringIO())
+        first = self.get(q='standup', type='message', limit=12)
+        self.assertEqual((first["count"], first["count_capped"], len(first["results"])), (30, False, 12))
+        self.assertIn("took_ms", first)
+        seen = [hit["id"] for hit in first["results"]]
+        cursor = first["next"]
+        while cursor:
+            page = self.get(q='standup', type='message', limit=12, after=cursor)
+            self.assertIsNone(page["count"])
+            seen += [hit["id"] for hit in page["results"]]
+            cursor = page["next"]
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(set(seen), set(Message.objects.filter(message__startswith='standup').values_list('pk', flat=True)))
+        self.assertEqual(self.hits(q='release', type='task'), [('task', self.task.pk)])
+
+    def test_count_is_capped(self):
+        for i in range(5):
+            Message.objects.create(room=self.room, user=self.user, message=f'retro {i}')
+        with self.settings(CHAT_SEARCH_COUNT_CAP=3):
+            page = self.get(q='retro')
+        self.assertEqual((page["count"], page["count_capped"]), (3, True))
+
+    def test_each_kind_is_loaded_with_one_query(self):
+        for i in range(10):
+            Message.objects.create(room=self.room, user=self.user, message=f'launch {i}')
+            Task.objects.create(room=self.room, title=f'launch task {i}', description='',
+                                due_date=datetime.date(2030, 1, 1), assigned_to=self.user)
+        # visible rooms are a subquery; then hits, capped count, and one query
+        # per kind on the page (comment, message, task)
+        with self.assertNumQueries(5):
+            page = self.get(q='launch', limit=50)
+        self.assertEqual(len(page["results"]), 22)
+        by_type = {hit["type"]: hit for hit in page["results"]}
+        self.assertEqual(by_type["task"]["assigned_to"], 'testuser')
+        self.assertEqual(by_type["message"]["room"], self.room.slug)
+        self.assertEqual(by_type["comment"]["task"], self.task.pk)
+
+    def test_bad_cursor(self):
+        response = self.client.get(self.url, {'q': 'launch', 'after': 'bm9wZQ'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'x', 'type': 'file'}).status_code, 400)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url, {'q': 'launch'}).status_code, 401)
+
+    def test_bulk_sent_messages_are_indexed(self):
+        self.client.post(reverse('send-message', args=[self.room.slug]),
+                         {"messages": [{"message": "quarterly roadmap"}]}, format="json")
+        self.assertEqual([hit[0] for hit in self.hits(q='roadmap')], ['message'])
+
+    def test_task_moving_rooms_moves_its_comments(self):
+        other = Room.objects.create(name='Elsewhere', is_private=True)
+        self.task.room = other
+        self.task.save()
+        self.assertEqual(self.hits(q='drafted'), [])
+
+    def test_rebuild(self):
+        SearchDocument.objects.all().delete()
+        out = StringIO()
+        call_command("rebuild_search_index", stdout=out)
+        self.assertIn("Indexed 6 documents", out.getvalue())
+        self.assertEqual(len(self.hits(q='launch')), 2)
+
+    def test_scan_fallback(self):
+        with mock.patch.object(search, "backend", return_value="scan"):
+            self.assertEqual(self.hits(q='release notes'), [('task', self.task.pk)])
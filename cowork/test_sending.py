@@ -0,0 +1,153 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork import sending
+from cowork.models import MediaBlob, Message, Room, UploadSession
+
+
+User = get_user_model()
+
+
+class SendMessageTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([
+            Room(name='Public', slug='public-room'),
+            Room(name='Private', slug='private-room', is_private=True),
+        ])
+        self.room = Room.objects.get(slug='public-room')
+        self.url = reverse('send-message', args=['public-room'])
+        self.client.force_authenticate(user=self.user)
+
+    def test_single_message(self):
+        response = self.client.post(self.url, {"message": "hello"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        message = Message.objects.get()
+        self.assertEqual(response.json()["id"], message.pk)
+        self.assertEqual((message.room, message.user, message.message), (self.room, self.user, "hello"))
+
+    def test_retry_with_idempotency_key_is_not_stored_twice(self):
+        first = self.client.post(self.url, {"message": "hello"}, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        retry = self.client.post(self.url, {"message": "hello"}, format="json", HTTP_IDEMPOTENCY_KEY="k1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertTrue(retry.json()["duplicate"])
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_concurrent_send_with_the_same_key_is_not_stored_twice(self):
+        first = self.client.post(self.url, {"message": "hello", "idempotency_key": "k1"}, format="json").json()
+        # The retry's lookup runs before the first request has committed, as
+        # when both reach different workers at once
+        lookups = [lambda user, keys: {}, sending._sent]
+        with mock.patch("cowork.sending._sent", side_effect=lambda user, keys: lookups.pop(0)(user, keys)):
+            response = self.client.post(self.url, {"messages": [
+                {"message": "hello", "idempotency_key": "k1"},
+                {"message": "new", "idempotency_key": "k2"},
+            ]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["messages"]
+        self.assertEqual([(r["id"] == first["id"], r["duplicate"]) for r in results], [(True, True), (False, False)])
+        self.assertEqual(sorted(Message.objects.values_list("message", flat=True)), ["hello", "new"])
+
+    def test_keys_are_per_user(self):
+        self.client.post(self.url, {"message": "a", "idempotency_key": "k1"}, format="json")
+        other = User.objects.create_user(email='o@example.com', password='testpassword', username='other')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(self.url, {"message": "b", "idempotency_key": "k1"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_batch_is_one_insert(self):
+        items = [{"message": str(i), "idempotency_key": f"k{i}"} for i in range(20)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {"messages": items}, format="json")
+        self.assertEqual(response.status_code, 201)
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith('INSERT INTO "cowork_message"')]
+        self.assertEqual(len(inserts), 1)
+        results = response.json()["messages"]
+        self.assertEqual(len(results), 20)
+        self.assertEqual(
+            list(Message.objects.order_by("id").values_list("message", flat=True)), [str(i) for i in range(20)])
+        self.assertEqual([r["id"] for r in results], list(Message.objects.order_by("id").values_list("id", flat=True)))
+
+    def test_batch_retry_only_stores_new_messages(self):
+        self.client.post(self.url, {"messages": [{"message": "a", "idempotency_key": "a"}]}, format="json")
+        response = self.client.post(self.url, {"messages": [
+            {"message": "a", "idempotency_key": "a"},
+            {"message": "b", "idempotency_key": "b"},
+            {"message": "b", "idempotency_key": "b"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["messages"]
+        self.assertEqual([r["duplicate"] for r in results], [True, False, True])
+        self.assertEqual(results[1]["id"], results[2]["id"])
+        self.assertEqual(sorted(Message.objects.values_list("message", flat=True)), ["a", "b"])
+
+    def test_batch_touches_room(self):
+        version = self.room.version
+        self.client.post(self.url, {"messages": [{"message": "a"}, {"message": "b"}]}, format="json")
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.version, version + 1)
+
+    @override_settings(CHAT_MESSAGE_BATCH_MAX=2)
+    def test_batch_size_limit(self):
+        response = self.client.post(self.url, {"messages": [{"message": "x"}] * 3}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.exists())
+
+    def test_uploads_are_resolved_per_item(self):
+        blob = MediaBlob.objects.create(sha256="ef" * 32, file="blobs/x", size=1, content_type="text/plain")
+        upload = UploadSession.objects.create(
+            user=self.user, room=self.room, filename="x.txt", size=1, received=1, blob=blob)
+        response = self.client.post(self.url, {"messages": [
+            {"message": "ok", "upload": str(upload.pk)},
+            {"message": "bad", "upload": "00000000-0000-0000-0000-000000000000"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["error"]["messages"]
+        self.assertEqual(errors[0], {})
+        self.assertIn("upload", errors[1])
+
+        response = self.client.post(self.url, {"messages": [{"message": "ok", "upload": str(upload.pk)}]},
+                                    format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Message.objects.get().media_blob, blob)
+
+    def test_failed_insert_releases_keys(self):
+        with mock.patch("cowork.sending.Message.objects.bulk_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, {"message": "a", "idempotency_key": "k"}, format="json")
+        response = self.client.post(self.url, {"message": "a", "idempotency_key": "k"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_private_room_requires_membership(self):
+        url = reverse('send-message', args=['private-room'])
+        self.assertEqual(self.client.post(url, {"message": "x"}, format="json").status_code, 403)
+        Room.objects.get(slug='private-room').users.add(self.user)
+        self.assertEqual(self.client.post(url, {"message": "x"}, format="json").status_code, 201)
+
+    def test_unknown_room(self):
+        url = reverse('send-message', args=['missing'])
+        self.assertEqual(self.client.post(url, {"message": "x"}, format="json").status_code, 404)
+
+    def test_multipart_media_file(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with self.settings(MEDIA_ROOT=tmp):
+            response = self.client.post(self.url, {
+                "message": "file", "media_file": SimpleUploadedFile("notes.txt", b"hello")})
+            self.assertEqual(response.status_code, 201)
+            message = Message.objects.get()
+            with message.media.open("rb") as fh:
+                self.assertEqual(fh.read(), b"hello")
@@ -0,0 +1,199 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.models import MediaBlob, Message, Room
+from cowork.serving import BLOCK_SIZE, RangeFile, parse_ranges, serve_file
+
+
+User = get_user_model()
+
+
+class ParseRangesTests(SimpleTestCase):
+    def test_forms(self):
+        self.assertEqual(parse_ranges("bytes=0-99", 1000), [(0, 99)])
+        self.assertEqual(parse_ranges("bytes=900-", 1000), [(900, 999)])
+        self.assertEqual(parse_ranges("bytes=-100", 1000), [(900, 999)])
+        self.assertEqual(parse_ranges("bytes=990-2000", 1000), [(990, 999)])
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assertEqual(parse_ranges("bytes=500-599,0-99,50-150,600-700", 1000), [(0, 150), (500, 700)])
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_ranges("bytes=1000-", 1000), [])
+        self.assertEqual(parse_ranges("bytes=-0", 1000), [])
+
+    def test_ignored(self):
+        self.assertIsNone(parse_ranges(None, 1000))
+        self.assertIsNone(parse_ranges("items=0-1", 1000))
+        self.assertIsNone(parse_ranges("bytes=5-1", 1000))
+        self.assertIsNone(parse_ranges("bytes=abc", 1000))
+        self.assertIsNone(parse_ranges("bytes=" + ",".join(f"{i * 2}-{i * 2}" for i in range(17)), 1000))
+
+
+class MessageMediaViewTests(APITestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmp, CHAT_DERIVATIVE_WORKERS=0)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([
+            Room(name='Public', slug='public-room'),
+            Room(name='Private', slug='private-room', is_private=True),
+        ])
+        self.room = Room.objects.get(slug='public-room')
+        self.data = bytes(range(256)) * 4096  # 1 MiB
+        self.blob = MediaBlob.objects.create(
+            sha256="cd" * 32, file=ContentFile(self.data, name="video.mp4"), size=len(self.data),
+            content_type="video/mp4")
+        self.message = Message.objects.create(room=self.room, user=self.user, media_blob=self.blob)
+        self.url = reverse('message-media', args=['public-room', self.message.pk])
+        self.client.force_authenticate(user=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp)
+
+    def body(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], '"%s"' % self.blob.sha256)
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(self.body(response), self.data)
+
+    def test_single_range_seeks_instead_of_streaming_from_start(self):
+        with mock.patch("cowork.serving.RangeFile", wraps=RangeFile) as range_file:
+            response = self.client.get(self.url, HTTP_RANGE="bytes=900000-900099")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(range_file.call_args[0][1:], (900000, 100))
+        self.assertEqual(response["Content-Range"], f"bytes 900000-900099/{len(self.data)}")
+        self.assertEqual(response["Content-Length"], "100")
+        self.assertEqual(self.body(response), self.data[900000:900100])
+
+    def test_multiple_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9,-10")
+        self.assertEqual(response.status_code, 206)
+        content_type = response["Content-Type"]
+        self.assertTrue(content_type.startswith("multipart/byteranges; boundary="))
+        boundary = content_type.split("boundary=")[1].encode()
+        body = self.body(response)
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        parts = [part for part in body.split(b"--" + boundary) if part.strip(b"-\r\n")]
+        self.assertEqual(len(parts), 2)
+        self.assertIn(b"Content-Range: bytes 0-9/", parts[0])
+        self.assertTrue(parts[0].endswith(b"\r\n\r\n" + self.data[:10] + b"\r\n"))
+        self.assertIn(f"Content-Range: bytes {len(self.data) - 10}-".encode(), parts[1])
+        self.assertTrue(parts[1].endswith(b"\r\n\r\n" + self.data[-10:] + b"\r\n"))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.data)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(self.data)}")
+
+    def test_stale_if_range_gets_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=response["ETag"])
+        self.assertEqual(response.status_code, 206)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_legacy_media_field(self):
+        message = Message(room=self.room, user=self.user)
+        message.media.save("notes.txt", ContentFile(b"hello world"), save=True)
+        url = reverse('message-media', args=['public-room', message.pk])
+        response = self.client.get(url, HTTP_RANGE="bytes=6-")
+        self.assertEqual(self.body(response), b"world")
+        self.assertTrue(response["ETag"].startswith('"'))
+
+    def test_private_room_requires_membership(self):
+        room = Room.objects.get(slug='private-room')
+        message = Message.objects.create(room=room, user=self.user, media_blob=self.blob)
+        url = reverse('message-media', args=['private-room', message.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        room.users.add(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_room_must_match(self):
+        url = reverse('message-media', args=['private-room', self.message.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_session_authentication(self):
+        self.client.force_authenticate(user=None)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(CHAT_MEDIA_SENDFILE="x-accel-redirect", CHAT_MEDIA_ACCEL_PREFIX="/protected/")
+    def test_x_accel_redirect(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected/" + self.blob.file.name)
+        self.assertEqual(response.content, b"")
+
+    @override_settings(CHAT_MEDIA_SENDFILE="x-sendfile")
+    def test_x_sendfile(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.tmp, self.blob.file.name))
+
+    def test_derivative(self):
+        url = reverse('message-media-derivative', args=['public-room', self.message.pk, 'thumbnail'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('message-media-derivative',
+                                    args=['public-room', self.message.pk, 'poster'])).status_code, 404)
+
+
+class AsgiServeFileTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        self.data = bytes(range(256)) * 4096
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(self.data)
+        self.addCleanup(os.remove, self.path)
+
+    def body(self, byte_range):
+        request = AsyncRequestFactory().get("/media", headers={"Range": byte_range})
+        response = serve_file(request, self.path, "video/mp4")
+        # Django's ASGI handler reads sync iterators to the end before sending
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(read)()
+        self.assertLessEqual(max(len(chunk) for chunk in chunks), BLOCK_SIZE)
+        return response, b"".join(chunks)
+
+    def test_whole_file_streams_in_blocks(self):
+        response, body = self.body("bytes=0-")
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(body == self.data)
+
+    def test_single_range(self):
+        response, body = self.body("bytes=1000-1999")
+        self.assertEqual((response["Content-Length"], body), ("1000", self.data[1000:2000]))
+
+    def test_multiple_ranges(self):
+        response, body = self.body("bytes=0-9,500-509")
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        self.assertIn(self.data[500:510], body)
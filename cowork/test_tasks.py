@@ -0,0 +1,186 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from cowork.membership import memberships
+from cowork.models import Room, Task
+
+
+User = get_user_model()
+
+
+class TaskListTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.other = User.objects.create_user(email='other@example.com', password='testpassword', username='other')
+        self.room = Room.objects.create(name='Planning', created_by=self.user)
+        self.room.users.add(self.other)
+        self.url = reverse('task-list', args=[self.room.slug])
+        self.client.force_authenticate(user=self.user)
+
+    def add_tasks(self, count, room=None, **fields):
+        fields.setdefault('assigned_to', self.user)
+        return Task.objects.bulk_create([
+            Task(room=room or self.room, title=f'Task {i}', description='',
+                 due_date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i), **fields)
+            for i in range(count)
+        ])
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get()
+        return len(queries)
+
+    def test_lists_only_this_rooms_tasks(self):
+        self.add_tasks(3)
+        self.add_tasks(2, room=Room.objects.create(name='Elsewhere'))
+        page = self.get()
+        self.assertEqual(page['count'], 3)
+        self.assertEqual([task['title'] for task in page['results']], ['Task 0', 'Task 1', 'Task 2'])
+        self.assertEqual(page['results'][0]['assigned_to'], 'testuser')
+
+    def test_query_count_does_not_grow_with_tasks(self):
+        self.add_tasks(2)
+        few = self.list_queries()
+        self.add_tasks(40, assigned_to=self.other)
+        self.assertEqual(self.list_queries(), few)
+        # room, count and page
+        self.assertEqual(few, 3)
+
+    def test_pagination(self):
+        self.add_tasks(7)
+        page = self.get(limit=5)
+        self.assertEqual((page['count'], len(page['results'])), (7, 5))
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 2)
+        with self.settings(CHAT_TASK_MAX_PAGE_SIZE=2):
+            self.assertEqual(len(self.get(limit=50)['results']), 2)
+
+    def test_filters(self):
+        tasks = self.add_tasks(4)
+        Task.objects.filter(pk=tasks[0].pk).update(completed=True)
+        Task.objects.filter(pk=tasks[1].pk).update(assigned_to=self.other)
+
+        def titles(**params):
+            return [task['title'] for task in self.get(**params)['results']]
+
+        self.assertEqual(titles(status='completed'), ['Task 0'])
+        self.assertEqual(titles(status='open'), ['Task 1', 'Task 2', 'Task 3'])
+        self.assertEqual(titles(assigned_to='other'), ['Task 1'])
+        self.assertEqual(titles(due_after='2030-01-02', due_before='2030-01-03'), ['Task 1', 'Task 2'])
+        self.assertEqual(self.client.get(self.url, {'status': 'late'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'due_before': '2030-02-31'}).status_code, 400)
+
+    def test_create_resolves_room_once(self):
+        data = {'title': 'Ship', 'description': 'Now', 'due_date': '2030-01-01', 'assigned_to': 'other'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(Task.objects.get(title='Ship').room, self.room)
+        room_lookups = [q for q in queries if q['sql'].startswith('SELECT') and 'FROM "cowork_room"' in q['sql']]
+        self.assertEqual(len(room_lookups), 1)
+
+    def test_assignee_must_be_a_member(self):
+        User.objects.create_user(email='out@example.com', password='testpassword', username='outsider')
+        data = {'title': 'Ship', 'description': 'Now', 'due_date': '2030-01-01', 'assigned_to': 'outsider'}
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('assigned_to', response.json())
+
+    def test_private_room(self):
+        room = Room.objects.create(name='Private', is_private=True)
+        url = reverse('task-list', args=[room.slug])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        room.users.add(self.user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(reverse('task-list', args=['missing'])).status_code, 404)
+
+
+class BulkTaskTests(APITestCase):
+    def setUp(self):
+        memberships.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpassword', username='testuser')
+        self.members = User.objects.bulk_create([
+            User(email=f'm{i}@example.com', username=f'member{i}') for i in range(5)])
+        User.objects.create_user(email='out@example.com', password='testpassword', username='outsider')
+        self.room = Room.objects.create(name='Sprint', created_by=self.user)
+        self.room.users.add(*self.members)
+        self.url = reverse('task-bulk', args=[self.room.slug])
+        self.client.force_authenticate(user=self.user)
+
+    def task(self, i, assignee='testuser', **fields):
+        return dict({'title': f'Story {i}', 'description': 'As a user', 'due_date': '2030-01-01',
+                     'assigned_to': assignee}, **fields)
+
+    def post(self, tasks):
+        return self.client.post(self.url, {'tasks': tasks}, format='json')
+
+    def batch_queries(self, count):
+        tasks = [self.task(i, f'member{i % 5}') for i in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(tasks)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(queries)
+
+    def test_creates_and_updates(self):
+        existing = Task.objects.create(room=self.room, title='Old', description='x',
+                                       due_date=datetime.date(2030, 1, 1), assigned_to=self.user)
+        response = self.post([self.task(1, 'member0'), {'id': existing.pk, 'completed': True, 'assigned_to': 'member1'}])
+        self.assertEqual(response.status_code, 200, response.content)
+        created, updated = response.json()['tasks']
+        self.assertEqual((created['status'], updated), ('created', {'id': existing.pk, 'status': 'updated'}))
+        self.assertEqual(Task.objects.get(pk=created['id']).assigned_to.username, 'member0')
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.completed, existing.assigned_to.username), ('Old', True, 'member1'))
+
+    def test_query_count_does_not_grow_with_batch(self):
+        self.assertEqual(self.batch_queries(2), self.batch_queries(50))
+        self.assertEqual(Task.objects.filter(room=self.room).count(), 52)
+
+    def test_per_item_errors(self):
+        other_room_task = Task.objects.create(room=Room.objects.create(name='Other'), title='Theirs',
+                                              description='x', due_date=datetime.date(2030, 1, 1),
+                                              assigned_to=self.user)
+        response = self.post([
+            self.task(1),
+            self.task(2, 'outsider'),
+            self.task(3, 'nobody'),
+            {'title': 'No date', 'description': 'x', 'assigned_to': 'testuser'},
+            {'id': other_room_task.pk, 'title': 'Mine now'},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['tasks']
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertIn('assigned_to', results[1]['errors'])
+        self.assertIn('assigned_to', results[2]['errors'])
+        self.assertIn('due_date', results[3]['errors'])
+        self.assertIn('id', results[4]['errors'])
+        self.assertEqual(Task.objects.filter(room=self.room).count(), 1)
+        self.assertEqual(Task.objects.get(pk=other_room_task.pk).title, 'Theirs')
+
+    def test_nothing_written_is_a_bad_request(self):
+        response = self.post([self.task(1, 'outsider')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'tasks': []}, format='json').status_code, 400)
+        with self.settings(CHAT_TASK_BATCH_MAX=2):
+            self.assertEqual(self.post([self.task(i) for i in range(3)]).status_code, 400)
+
+    def test_written_tasks_are_searchable(self):
+        created = self.post([self.task(1, title='Dark mode toggle')]).json()['tasks'][0]
+        self.post([{'id': created['id'], 'title': 'Light mode toggle'}])
+        hits = self.client.get(reverse('search'), {'q': 'mode', 'type': 'task'}).json()['results']
+        self.assertEqual([hit['title'] for hit in hits], ['Light mode toggle'])
+
+    def test_private_room(self):
+        room = Room.objects.create(name='Private', is_private=True)
+        response = self.client.post(reverse('task-bulk', args=[room.slug]), {'tasks': [self.task(1)]}, format='json')
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,159 @@
+import threading
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TransactionTestCase
+
+from cowork.models import Message, Room
+from cowork.persistence import message_writer
+from cowork.routing import websocket_urlpatterns
+from cowork.throttle import CacheBucketStore, FloodControl, LocalBucketStore
+
+
+User = get_user_model()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FloodControlTests(SimpleTestCase):
+    def flood_control(self, **kwargs):
+        self.clock = FakeClock()
+        options = dict(user_rate=5, user_burst=10, room_rate=50, room_burst=100,
+                       policy="reject", store=LocalBucketStore(), clock=self.clock)
+        options.update(kwargs)
+        return FloodControl(**options)
+
+    def test_burst_then_rate(self):
+        control = self.flood_control()
+        admitted = sum(1 for _ in range(1000) if control.acquire("room", "user") == 0)
+        self.assertEqual(admitted, 10)
+
+        # One second later the bucket has refilled by the sustained rate
+        self.clock.now += 1
+        admitted = sum(1 for _ in range(1000) if control.acquire("room", "user") == 0)
+        self.assertEqual(admitted, 5)
+
+    def test_retry_after(self):
+        control = self.flood_control()
+        for _ in range(10):
+            control.acquire("room", "user")
+        self.assertAlmostEqual(control.acquire("room", "user"), 0.2)
+
+    def test_users_have_separate_buckets(self):
+        control = self.flood_control()
+        for _ in range(50):
+            control.acquire("room", "flooder")
+        self.assertEqual(control.acquire("room", "someone-else"), 0)
+
+    def test_room_bucket_limits_all_senders(self):
+        control = self.flood_control(room_burst=20)
+        admitted = sum(
+            1 for i in range(1000) if control.acquire("room", f"user-{i % 100}") == 0
+        )
+        self.assertEqual(admitted, 20)
+
+    def test_rejected_frame_does_not_consume_user_token(self):
+        control = self.flood_control(room_burst=1)
+        self.assertEqual(control.acquire("room", "user"), 0)
+        for _ in range(100):
+            self.assertGreater(control.acquire("room", "user"), 0)
+        # The user bucket only paid for the one frame that went through
+        self.assertEqual(control.acquire("other-room", "user"), 0)
+
+    def test_cache_store_is_shared_between_instances(self):
+        cache.clear()
+        first = self.flood_control(store=CacheBucketStore())
+        second = self.flood_control(store=CacheBucketStore(), clock=self.clock)
+        for _ in range(5):
+            first.acquire("room", "user")
+        admitted = sum(1 for _ in range(100) if second.acquire("room", "user") == 0)
+        self.assertEqual(admitted, 5)
+
+    def test_local_store_is_bounded(self):
+        store = LocalBucketStore(max_keys=3)
+        for i in range(10):
+            store.set(str(i), float(i), 1)
+        self.assertIsNone(store.get("0"))
+        self.assertEqual(store.get("9"), 9.0)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.flood_control(policy="ignore")
+
+    async def test_cache_store_is_used_off_the_event_loop(self):
+        cache.clear()
+        store = CacheBucketStore()
+        threads = []
+        get = store.get
+        store.get = lambda key: threads.append(threading.get_ident()) or get(key)
+        control = FloodControl(policy="reject", store=store)
+
+        self.assertEqual(await control.admit("room", "user"), (True, 0.0))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_delay_policy_waits_for_a_token(self):
+        control = FloodControl(user_rate=100, user_burst=1, room_rate=100, room_burst=1,
+                               policy="delay", max_delay=1, store=LocalBucketStore())
+        results = [await control.admit("room", "user") for _ in range(5)]
+        self.assertEqual([allowed for allowed, _ in results], [True] * 5)
+
+    async def test_delay_policy_gives_up_after_max_delay(self):
+        control = FloodControl(user_rate=1, user_burst=1, room_rate=1, room_burst=1,
+                               policy="delay", max_delay=0.01, store=LocalBucketStore())
+        self.assertEqual(await control.admit("room", "user"), (True, 0.0))
+        allowed, retry_after = await control.admit("room", "user")
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0.9)
+
+
+class ChatFloodControlTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Test Room', slug='flood-room')])
+
+    def communicator(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/chat/flood-room/")
+        communicator.scope["user"] = self.user
+        return communicator
+
+    async def flood(self, policy, frames=200):
+        control = FloodControl(user_rate=1, user_burst=5, room_rate=100, room_burst=100,
+                               policy=policy, store=LocalBucketStore())
+        communicator = self.communicator()
+        with mock.patch("cowork.consumers.flood_control", control):
+            await communicator.connect()
+            for i in range(frames):
+                await communicator.send_json_to({"message": f"spam {i}"})
+            received = []
+            while not await communicator.receive_nothing(timeout=0.2):
+                received.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+        await message_writer.flush()
+        return received
+
+    async def test_reject_policy_reports_retry_after(self):
+        received = await self.flood("reject")
+        messages = [frame for frame in received if "message" in frame]
+        errors = [frame for frame in received if "error" in frame]
+        self.assertEqual([frame["message"] for frame in messages], [f"spam {i}" for i in range(5)])
+        self.assertEqual(len(errors), 195)
+        self.assertEqual(errors[0]["error"], "rate_limited")
+        self.assertGreater(errors[0]["retry_after"], 0)
+        self.assertEqual(await sync_to_async(Message.objects.filter(room__slug="flood-room").count)(), 5)
+
+    async def test_drop_policy_is_silent(self):
+        received = await self.flood("drop")
+        self.assertEqual(len(received), 5)
+        self.assertTrue(all("message" in frame for frame in received))
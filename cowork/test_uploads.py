@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from cowork import uploads
+from cowork.models import MediaBlob, Message, Room, UploadSession
+from serializers.serializers import ReceiveMessageSerializer
+
+
+User = get_user_model()
+
+
+class DroppedStream(io.BytesIO):
+    """A request body whose connection dies after ``limit`` bytes."""
+
+    def __init__(self, data, limit):
+        super().__init__(data)
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.tell() >= self.limit:
+            raise IOError("Connection reset")
+        return super().read(min(size, self.limit - self.tell()))
+
+
+class ResumableUploadTests(APITestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp, "media"), CHAT_UPLOAD_DIR=os.path.join(self.tmp, "partial"))
+        self.settings_override.enable()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpassword', username='testuser')
+        Room.objects.bulk_create([Room(name='Room A', slug='room-a'), Room(name='Room B', slug='room-b')])
+        self.client.force_authenticate(user=self.user)
+        self.data = os.urandom(300 * 1024)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmp)
+
+    def start(self, room_slug="room-a", data=None):
+        response = self.client.post(reverse('upload-create', args=[room_slug]), {
+            "filename": "data.bin", "content_type": "application/octet-stream", "size": len(data or self.data)})
+        self.assertEqual(response.status_code, 201)
+        return reverse('upload-detail', args=[room_slug, response.json()["id"]])
+
+    def send(self, url, offset, chunk):
+        return self.client.patch(url, data=chunk, content_type="application/offset+octet-stream",
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    def upload(self, room_slug="room-a", chunk_size=100 * 1024):
+        url = self.start(room_slug)
+        for offset in range(0, len(self.data), chunk_size):
+            response = self.send(url, offset, self.data[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_chunks_are_assembled_into_a_blob(self):
+        result = self.upload()
+        self.assertTrue(result["complete"])
+        self.assertEqual(result["sha256"], hashlib.sha256(self.data).hexdigest())
+        blob = MediaBlob.objects.get(sha256=result["sha256"])
+        with blob.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.data)
+        self.assertEqual(os.listdir(os.path.join(self.tmp, "partial")), [])
+
+    def test_recent_chunk_keeps_upload_from_being_pruned(self):
+        url = self.start()
+        session = UploadSession.objects.get()
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(hours=30))
+        self.assertEqual(self.send(url, 0, self.data[:1024]).status_code, 200)
+        call_command("prune_uploads", stdout=StringIO())
+        self.assertEqual(UploadSession.objects.get().received, 1024)
+
+        UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(hours=30))
+        call_command("prune_uploads", stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_offset_mismatch(self):
+        url = self.start()
+        self.send(url, 0, self.data[:1000])
+        response = self.send(url, 5000, self.data[5000:6000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "1000")
+
+    def test_resume_after_dropped_connection(self):
+        url = self.start()
+        session = UploadSession.objects.get()
+        with self.assertRaises(IOError):
+            uploads.append_chunk(session, 0, DroppedStream(self.data, 123457), len(self.data))
+        # A different worker picks up the rest: no cached hasher state
+        uploads._hashers.pop(session.pk)
+
+        response = self.client.get(url)
+        self.assertEqual(response["Upload-Offset"], "123457")
+        self.assertEqual(response.json()["received"], 123457)
+        response = self.send(url, 123457, self.data[123457:])
+        self.assertEqual(response.json()["sha256"], hashlib.sha256(self.data).hexdigest())
+
+    def test_identical_files_are_stored_once(self):
+        first = self.upload("room-a")
+        second = self.upload("room-b", chunk_size=64 * 1024)
+        self.assertEqual(first["sha256"], second["sha256"])
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        stored = [name for _, _, names in os.walk(os.path.join(self.tmp, "media")) for name in names]
+        self.assertEqual(stored, [first["sha256"]])
+
+    def test_chunk_past_declared_size(self):
+        url = self.start()
+        response = self.send(url, 0, self.data + b"extra")
+        self.assertEqual(response.status_code, 409)
+
+    def test_sessions_are_private_to_their_owner(self):
+        url = self.start()
+        other = User.objects.create_user(email='o@example.com', password='testpassword', username='other')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.send(url, 0, b"x").status_code, 404)
+
+    def test_message_references_blob(self):
+        result = self.upload()
+        response = self.client.post(reverse('send-message', args=['room-a']),
+                                    {"message": "look", "upload": result["id"]})
+        self.assertEqual(response.status_code, 201, response.content)
+        message = Message.objects.get(pk=response.json()["id"])
+        self.assertEqual(message.media_blob.sha256, result["sha256"])
+        self.assertEqual(
+            ReceiveMessageSerializer(message).data["media"],
+            reverse('message-media', args=['room-a', message.pk]))
+
+    def test_message_cannot_use_someone_elses_upload(self):
+        result = self.upload()
+        other = User.objects.create_user(email='o@example.com', password='testpassword', username='other')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(reverse('send-message', args=['room-a']),
+                                    {"message": "mine", "upload": result["id"]})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("upload", response.json()["error"])
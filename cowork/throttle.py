@@ -0,0 +1,171 @@
+"""
+Flood control for the chat socket.
+
+Every chat frame costs one token from the sender's bucket and one from the
+room's bucket. Buckets are tracked with GCRA (the "virtual scheduling" form
+of a token bucket): the only state per bucket is its theoretical arrival
+time, which keeps the shared backend down to a single cache value per key.
+
+Stores:
+
+``local``
+    per-process dict (bounded, least recently used keys are forgotten);
+``cache``
+    Django's default cache, shared by every worker that uses the same cache.
+    Updates are read-then-write, so concurrent workers may let a few extra
+    frames through; that is an acceptable trade for not adding a lock. Its
+    round trips run in a worker thread, off the event loop.
+
+Policies for a frame that finds an empty bucket:
+
+``reject``
+    drop it and tell the sender when to retry;
+``delay``
+    hold it until a token is available (up to ``CHAT_THROTTLE_MAX_DELAY``
+    seconds, after which it is rejected);
+``drop``
+    drop it silently.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from cowork import metrics
+
+
+REJECT = "reject"
+DELAY = "delay"
+DROP = "drop"
+POLICIES = (REJECT, DELAY, DROP)
+
+ALLOWED = metrics.counter("chat.throttle.allowed")
+REJECTED = metrics.counter("chat.throttle.rejected")
+DELAYED = metrics.counter("chat.throttle.delayed")
+DROPPED = metrics.counter("chat.throttle.dropped")
+DELAY_SECONDS = metrics.histogram("chat.throttle.delay_seconds")
+
+
+class LocalBucketStore:
+    # Answers from memory, so it is safe to call on the event loop
+    in_process = True
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._tats.get(key)
+
+    def set(self, key, tat, ttl):
+        with self._lock:
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+            if len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+
+
+class CacheBucketStore:
+    prefix = "chat-throttle:"
+    in_process = False
+
+    def get(self, key):
+        return cache.get(self.prefix + key)
+
+    def set(self, key, tat, ttl):
+        cache.set(self.prefix + key, tat, timeout=max(1, int(ttl) + 1))
+
+
+class FloodControl:
+    """
+    ``rate`` is in frames per second and ``burst`` is how many frames may be
+    sent back to back. ``clock`` is injectable for tests.
+    """
+
+    def __init__(self, user_rate=None, user_burst=None, room_rate=None, room_burst=None,
+                 policy=None, max_delay=None, store=None, clock=time.time):
+        self.user_rate = user_rate or getattr(settings, "CHAT_USER_RATE", 5)
+        self.user_burst = user_burst or getattr(settings, "CHAT_USER_BURST", 10)
+        self.room_rate = room_rate or getattr(settings, "CHAT_ROOM_RATE", 50)
+        self.room_burst = room_burst or getattr(settings, "CHAT_ROOM_BURST", 100)
+        self.policy = policy or getattr(settings, "CHAT_THROTTLE_POLICY", REJECT)
+        self.max_delay = max_delay if max_delay is not None else getattr(settings, "CHAT_THROTTLE_MAX_DELAY", 2.0)
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown throttle policy {self.policy!r}, expected one of {POLICIES}.")
+        if store is None:
+            backend = getattr(settings, "CHAT_THROTTLE_BACKEND", "local")
+            store = CacheBucketStore() if backend == "cache" else LocalBucketStore()
+        self.store = store
+        self.clock = clock
+
+    def _buckets(self, room_id, user_id):
+        return (
+            (f"user:{user_id}", self.user_rate, self.user_burst),
+            (f"room:{room_id}", self.room_rate, self.room_burst),
+        )
+
+    def acquire(self, room_id, user_id):
+        """
+        Takes a token from both buckets if both have one and returns 0.
+        Otherwise takes nothing and returns the seconds until both would.
+        """
+        now = self.clock()
+        buckets = self._buckets(room_id, user_id)
+        updates, wait = [], 0.0
+        for key, rate, burst in buckets:
+            interval = 1.0 / rate
+            tat = max(self.store.get(key) or now, now)
+            # Conforming while the bucket is at most burst - 1 intervals "ahead"
+            wait = max(wait, tat - now - (burst - 1) * interval)
+            updates.append((key, tat + interval, burst * interval))
+        # Ignore float noise from adding up intervals
+        if wait > 1e-9:
+            return wait
+        for key, tat, ttl in updates:
+            self.store.set(key, tat, ttl)
+        return 0.0
+
+    async def admit(self, room_id, user_id):
+        """
+        Applies the policy to one frame. Returns ``(True, 0)`` if it may be
+        broadcast and ``(False, retry_after)`` if not.
+        """
+        wait = await self._acquire(room_id, user_id)
+        if not wait:
+            record("allowed")
+            return True, 0.0
+        if self.policy != DELAY:
+            record(self.policy)
+            return False, wait
+
+        waited = 0.0
+        while wait and waited + wait <= self.max_delay:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = await self._acquire(room_id, user_id)
+        if wait:
+            record(REJECT)
+            return False, wait
+        record(DELAY, waited)
+        return True, 0.0
+
+    async def _acquire(self, room_id, user_id):
+        if getattr(self.store, "in_process", False):
+            return self.acquire(room_id, user_id)
+        return await sync_to_async(self.acquire, thread_sensitive=False)(room_id, user_id)
+
+
+def record(outcome, delay=0.0):
+    """Bumps the metrics for a throttling decision."""
+    {"allowed": ALLOWED, REJECT: REJECTED, DELAY: DELAYED, DROP: DROPPED}[outcome].inc()
+    if delay:
+        DELAY_SECONDS.observe(delay)
+
+
+flood_control = FloodControl()
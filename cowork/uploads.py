@@ -0,0 +1,197 @@
+"""
+Chunked, resumable media uploads stored by content hash.
+
+A client opens an ``UploadSession`` with the file's name and size, then sends
+the bytes in any number of chunks, each tagged with the offset it starts at.
+Bytes are streamed straight to a partial file and into a SHA-256 hasher as
+they are read, so a dropped connection loses nothing that reached the
+server: the client asks for the current offset and carries on from there.
+
+When the last byte arrives the digest names the blob. If a ``MediaBlob`` with
+that digest already exists, the partial file is simply deleted and the
+session points at the existing blob; otherwise the file is saved to storage
+once, under ``blobs/<aa>/<bb>/<sha256>``.
+
+Hasher state cannot be persisted, so it is cached per process. A chunk that
+lands on a worker without the state (or after a restart) rehashes the
+partial file first, once.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.utils import timezone
+
+from cowork import metrics
+from cowork.models import MediaBlob, UploadSession
+
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 64 * 1024
+
+RECEIVED_BYTES = metrics.counter("chat.upload.received_bytes")
+BLOBS_CREATED = metrics.counter("chat.upload.blobs_created")
+DEDUPLICATED = metrics.counter("chat.upload.deduplicated")
+BYTES_SAVED = metrics.counter("chat.upload.bytes_saved")
+REHASHED = metrics.counter("chat.upload.rehashed")
+
+
+class UploadError(Exception):
+    """Raised for chunks that cannot be applied; ``offset`` is where to resume."""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadBusy(UploadError):
+    pass
+
+
+class _HasherCache:
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def pop(self, session_id):
+        with self._lock:
+            return self._entries.pop(session_id, (None, None))
+
+    def put(self, session_id, offset, hasher):
+        with self._lock:
+            self._entries[session_id] = (offset, hasher)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_hashers = _HasherCache()
+
+
+def upload_dir():
+    return getattr(settings, "CHAT_UPLOAD_DIR", os.path.join(settings.BASE_DIR, "uploads"))
+
+
+def partial_path(session):
+    return os.path.join(upload_dir(), f"{session.pk}.part")
+
+
+def blob_name(digest):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def current_offset(session):
+    if session.is_complete:
+        return session.size
+    try:
+        return os.path.getsize(partial_path(session))
+    except FileNotFoundError:
+        return 0
+
+
+def _resume_hasher(session, fh, offset):
+    cached_offset, hasher = _hashers.pop(session.pk)
+    if hasher is not None and cached_offset == offset:
+        return hasher
+    REHASHED.inc()
+    hasher = hashlib.sha256()
+    fh.seek(0)
+    remaining = offset
+    while remaining:
+        data = fh.read(min(READ_SIZE, remaining))
+        if not data:
+            break
+        hasher.update(data)
+        remaining -= len(data)
+    return hasher
+
+
+def append_chunk(session, offset, stream, length):
+    """
+    Appends ``length`` bytes read from ``stream`` at ``offset`` and returns the
+    new offset. Completes the session when the last byte has arrived.
+    """
+    if session.is_complete:
+        raise UploadError("Upload already complete.", session.size)
+    if offset + length > session.size:
+        raise UploadError("Chunk runs past the declared size.", current_offset(session))
+
+    os.makedirs(upload_dir(), exist_ok=True)
+    with open(partial_path(session), "a+b") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy("Another chunk for this upload is being written.")
+        fh.seek(0, os.SEEK_END)
+        on_disk = fh.tell()
+        if offset != on_disk:
+            raise UploadError("Offset mismatch.", on_disk)
+
+        hasher = _resume_hasher(session, fh, on_disk)
+        fh.seek(0, os.SEEK_END)
+        written = 0
+        try:
+            while written < length:
+                data = stream.read(min(READ_SIZE, length - written))
+                if not data:
+                    break
+                fh.write(data)
+                hasher.update(data)
+                written += len(data)
+        finally:
+            # Whatever made it to disk counts, even if the client went away
+            fh.flush()
+            new_offset = on_disk + written
+            _hashers.put(session.pk, new_offset, hasher)
+            RECEIVED_BYTES.inc(written)
+            # update() skips auto_now, and prune_uploads expires on updated_at
+            now = timezone.now()
+            UploadSession.objects.filter(pk=session.pk).update(received=new_offset, updated_at=now)
+            session.received, session.updated_at = new_offset, now
+
+        if new_offset == session.size:
+            _hashers.pop(session.pk)
+            _finalize(session, fh, hasher.hexdigest())
+    return new_offset
+
+
+def _finalize(session, fh, digest):
+    blob = MediaBlob.objects.filter(sha256=digest).first()
+    if blob is None:
+        fh.seek(0)
+        name = default_storage.save(blob_name(digest), File(fh))
+        try:
+            blob = MediaBlob.objects.create(
+                sha256=digest, file=name, size=session.size, content_type=session.content_type)
+            BLOBS_CREATED.inc()
+        except IntegrityError:
+            # Another upload of the same content finished first
+            default_storage.delete(name)
+            blob = MediaBlob.objects.get(sha256=digest)
+            DEDUPLICATED.inc()
+            BYTES_SAVED.inc(session.size)
+    else:
+        DEDUPLICATED.inc()
+        BYTES_SAVED.inc(session.size)
+
+    session.blob = blob
+    session.save(update_fields=["blob", "received", "updated_at"])
+    os.remove(partial_path(session))
+
+
+def discard(session):
+    """Deletes an unfinished session and its partial file."""
+    _hashers.pop(session.pk)
+    try:
+        os.remove(partial_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
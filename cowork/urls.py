@@ -16,9 +16,15 @@ urlpatterns = [
     path("", TemplateView.as_view(template_name="base.html"), name='index'),
     path("room/<str:room_slug>/", views.RoomDetailView.as_view(), name='chat'),
     path("room/", views.RoomCreateJoinView.as_view(), name='room-create-join'),
+    path("room/<str:room_slug>/online/", views.RoomPresenceView.as_view(), name='room-presence'),
+    path('room/<str:room_slug>/uploads/', views.UploadSessionCreateView.as_view(), name='upload-create'),
+    path('room/<str:room_slug>/uploads/<uuid:pk>/', views.UploadSessionDetailView.as_view(), name='upload-detail'),
+    path('room/<str:room_slug>/messages/<int:pk>/media/', views.MessageMediaView.as_view(), name='message-media'),
+    path('room/<str:room_slug>/messages/<int:pk>/media/<str:kind>/', views.MessageMediaView.as_view(), name='message-media-derivative'),
     # path('public-room/<slug:slug>/', views.public_chat, name='public-room'),
     # path('post_message/', views.post_message, name='post-message'),
     path('room/<str:room_slug>/tasks/', views.TaskListCreateView.as_view(), name='task-list'),
+    path('room/<str:room_slug>/tasks/bulk/', views.bulk_tasks, name='task-bulk'),
     path('room/tasks/<int:pk>/', views.TaskRetrieveUpdateDestroyView.as_view(), name='task-detail'),
     path('room/tasks/<int:pk>/comments/', views.CommentCreateView.as_view(), name='comment-create'),
     path('room/comments/<int:pk>/', views.CommentRetrieveUpdateDestroyView.as_view(), name='comment-detail'),
@@ -37,6 +43,10 @@ urlpatterns = [
 
     # Search 
     path('search/', views.SearchAPIView.as_view(), name='search'),
+    path('rooms/autocomplete/', views.RoomAutocompleteView.as_view(), name='room-autocomplete'),
+
+    # Real-time path metrics (staff only)
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
     # path('room/upload/file/<str:room_slug>/', UploadFileView.as_view(), name='upload_file'),
     # path('room/switch/branch/<str:room_slug>/<int:file_id>/<int:branch_id>/', SwitchBranchView.as_view(), name='switch_branch'),
 
@@ -52,8 +62,9 @@ urlpatterns = [
     # path('room/commits/<str:room_slug>/', CommitList.as_view(), name='commit_list'),
     # path('room/commits/<str:room_slug>/<int:pk>/', CommitDetail.as_view(), name='commit_detail'),
     
-    # path('room/send/<str:room_slug>/', views.send_message, name='send-message'), 
-    # path('room/get/<str:room_slug>/', views.get_message, name='get-message'),
+    path('room/send/<str:room_slug>/', views.send_message, name='send-message'),
+    path('room/get/<str:room_slug>/', views.get_message, name='get-message'),
+    path('room/export/<str:room_slug>/', views.RoomMessageExportView.as_view(), name='export-messages'),
 ]
 
 
@@ -1,29 +1,34 @@
-import string
-import random
 import mimetypes
+import os
+import time
 # from serializers.serializers import UploadedFileSerializer, BranchSerializer, UploadedFileVersionSerializer, CommitSerializer
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.http import quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render, reverse, redirect, get_object_or_404
-from django.utils.text import slugify
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse, Http404, FileResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.http import HttpResponse, Http404, FileResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.urls import reverse
 from django.contrib import messages
-from rest_framework import status, generics, permissions, status, viewsets
+from rest_framework import exceptions, status, generics, permissions, status, viewsets
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.core.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.renderers import JSONRenderer
 from rest_framework.views import APIView
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.settings import api_settings
 
-from django.core.paginator import Paginator
 from django.db.models import Q
 from django.core.exceptions import ValidationError
 from serializers.serializers import (
-    TaskSerializer, CommentSerializer,
-    SendMessageSerializer, ReceiveMessageSerializer,
+    TaskSerializer, TaskItemSerializer, BulkTasksSerializer, CommentSerializer,
+    SendMessagesSerializer, ReceiveMessageSerializer, UploadSessionSerializer,
     RoomSerializer,
     # BranchSerializer,
     UserNoteSerializer,
@@ -36,8 +41,19 @@ from .models import (Task, Comment, Room, Message,
                     #  UploadedFile,
                      #  FileAccessLog,
                     #  Branch,
-                     UserNote, FeatureRequest
+                     UserNote, FeatureRequest, UploadSession
                      )
+from cowork import derivatives, metrics, search, serving, uploads
+from cowork.autocomplete import room_autocomplete
+from cowork.conditional import not_modified, with_validators
+from cowork.export import export_queryset, iter_ndjson
+from cowork.pagination import TaskPagination, paginate_messages
+from cowork.persistence import message_writer
+from cowork.presence import presence
+from cowork.sending import send_messages
+from cowork.streaming import streaming_content
+from cowork.task_batches import save_tasks
+from accounts.models import CustomUser
 
 
 
@@ -89,18 +105,15 @@ class RoomCreateJoinView(APIView):
             return Response({"detail": "Room name is required!"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            uid = str(''.join(random.choices(
-                string.ascii_letters + string.digits, k=4)))
-            room_slug = slugify(room_name + "_" + uid)
+            # Room.save gives it a unique slug
             room = Room.objects.create(
                 name=room_name,
-                slug=room_slug,
                 description=description,
                 is_private=is_private,
                 created_by=request.user
             )
 
-            serializer = RoomSerializer(room)
+            serializer = RoomSerializer(room, context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
@@ -117,7 +130,7 @@ class RoomCreateJoinView(APIView):
 
         if provided_slug == correct_slug:
             # The provided slug matches the actual slug, proceed to join the room
-            if not room.is_private or request.user in room.users.all():
+            if not room.is_private or room.has_member(request.user):
                 # Add the user to the room's users
                 room.users.add(request.user)
 
@@ -149,14 +162,40 @@ class RoomDetailView(APIView):
     def get(self, request, room_slug):
         try:
             room = Room.objects.get(slug=room_slug)
-            if room.is_private and request.user not in room.users.all():
+            if room.is_private and not room.has_member(request.user):
                 return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
-            serializer = RoomSerializer(room)
-            return Response(serializer.data)
+            cached = not_modified(request, room)
+            if cached is not None:
+                return cached
+            serializer = RoomSerializer(room, context={"request": request})
+            return with_validators(Response(serializer.data), room)
         except Room.DoesNotExist:
             return Response({"detail": "Room not found."}, status=status.HTTP_404_NOT_FOUND)
 
 
+class RoomPresenceView(APIView):
+    """
+    Lists the users that currently have the room open (live WebSocket
+    connections), as opposed to the room's members. Only connections held by
+    the worker process answering the request are counted (see
+    cowork.presence).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, room_slug):
+        try:
+            room = Room.objects.get(slug=room_slug)
+        except Room.DoesNotExist:
+            return Response({"detail": "Room not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if room.is_private and not room.has_member(request.user):
+            return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+        user_ids = presence.online(room.id)
+        usernames = CustomUser.objects.filter(id__in=user_ids).values_list('username', flat=True)
+        return Response({"online": list(usernames), "count": len(user_ids)}, status=status.HTTP_200_OK)
+
+
 # class UserRoomsView(APIView):
 #     permission_classes = [IsAuthenticated]
 #     def get(self, request):
@@ -176,82 +215,314 @@ class RoomDetailView(APIView):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def send_message(request, room_slug):
-    """Sends a message to a chat room, including media upload (optional).
+    """Sends one message, or a batch of them, to a chat room.
 
     Args:
-        request: The HTTP request.
+        request: The HTTP request. Either a single message (``message``, and
+            optionally ``media_file`` or ``upload``, with its idempotency key in
+            the ``Idempotency-Key`` header or an ``idempotency_key`` field), or
+            ``{"messages": [...]}`` holding up to ``CHAT_MESSAGE_BATCH_MAX``
+            such messages, each with its own ``idempotency_key``.
         room_slug: The slug of the chat room.
 
     Returns:
-        A JSON response with the status of the message send, or an error response if the request is invalid.
+        A JSON response with the id and timestamp of each message, or an error
+        response if the request is invalid. Messages that repeat an idempotency
+        key are not stored again and are flagged as ``duplicate``.
     """
-    if request.method == "POST":
-        # Set room and user based on the request context
-        room = Room.objects.get(slug=room_slug)
-        user = request.user
-
-        # Include room and user in the request data
-        request.data["room"] = room.id
-        request.data["user"] = user.id
-
-        serializer = SendMessageSerializer(data=request.data)
-
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"status": "Message successfully sent!"}, status=status.HTTP_201_CREATED)
-
-        return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
-
-    return Response({"error": "Invalid request method."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    room = get_object_or_404(Room, slug=room_slug)
+    if room.is_private and not room.has_member(request.user):
+        return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+    batch = "messages" in request.data
+    if batch:
+        data = request.data
+    else:
+        item = request.data.dict() if hasattr(request.data, "dict") else dict(request.data)
+        if "HTTP_IDEMPOTENCY_KEY" in request.META:
+            item.setdefault("idempotency_key", request.META["HTTP_IDEMPOTENCY_KEY"])
+        data = {"messages": [item]}
+
+    serializer = SendMessagesSerializer(data=data, context={"user": request.user})
+    if not serializer.is_valid():
+        errors = serializer.errors
+        if not batch and isinstance(errors.get("messages"), list):
+            errors = errors["messages"][0]
+        return Response({"error": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    results = send_messages(room, request.user, serializer.validated_data["messages"])
+    created = not all(result["duplicate"] for result in results)
+    response_status = status.HTTP_201_CREATED if created else status.HTTP_200_OK
+    if batch:
+        return Response({"messages": results}, status=response_status)
+    return Response(dict(results[0], status="Message successfully sent!"), status=response_status)
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_message(request, room_slug):
-    """Gets all messages from a chat room.
+    """Gets a page of messages from a chat room.
 
     Args:
-        request: The HTTP request.
+        request: The HTTP request. Optional query parameters: ``limit``, and
+            one of ``before``/``after`` holding a cursor from an earlier page.
         room_slug: The slug of the chat room.
 
     Returns:
-        A JSON response with a list of messages, or an error response if the request is invalid.
+        A JSON response with the page of messages (oldest first) and the
+        ``previous``/``next`` cursors, or an error response if the request is invalid.
     """
-    if request.method == "GET":
-        try:
-            room = Room.objects.get(slug=room_slug)
-            messages = Message.objects.filter(room=room).order_by("created_at")
+    room = get_object_or_404(Room, slug=room_slug)
+    if room.is_private and not room.has_member(request.user):
+        return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+    if message_writer.has_pending(room.pk):
+        # Include messages still waiting in the write-behind queue. This also
+        # bumps the room's version, so a revalidating client gets the new page.
+        message_writer.flush_sync()
+        room.refresh_from_db(fields=["version", "updated_at"])
+    cached = not_modified(request, room)
+    if cached is not None:
+        return cached
+    page, previous, next_cursor = paginate_messages(
+        Message.objects.filter(room=room).select_related("user", "room", "media_blob"),
+        before=request.query_params.get("before"),
+        after=request.query_params.get("after"),
+        limit=request.query_params.get("limit"),
+    )
+    serialized_messages = ReceiveMessageSerializer(page, many=True).data
+    return with_validators(Response(
+        {"messages": serialized_messages, "previous": previous, "next": next_cursor},
+        status=status.HTTP_200_OK,
+    ), room)
+
+
+class RoomMessageExportView(APIView):
+    """
+    Streams a room's whole message history as NDJSON (one message per line,
+    oldest first). Optional filters: ``since`` and ``until`` (ISO 8601, until
+    is exclusive) and ``user`` (username).
+    """
+    permission_classes = [IsAuthenticated]
 
-            serialized_messages = ReceiveMessageSerializer(
-                messages, many=True).data
+    def get(self, request, room_slug):
+        room = get_object_or_404(Room, slug=room_slug)
+        if room.is_private and not room.has_member(request.user):
+            return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+        bounds = {}
+        for name in ("since", "until"):
+            value = request.query_params.get(name)
+            bounds[name] = parse_datetime(value) if value else None
+            if value and bounds[name] is None:
+                return Response({name: "Expected an ISO 8601 datetime."}, status=status.HTTP_400_BAD_REQUEST)
+
+        message_writer.flush_sync()
+        queryset = export_queryset(room, username=request.query_params.get("user"), **bounds)
+        response = StreamingHttpResponse(
+            streaming_content(request, iter_ndjson(queryset)), content_type="application/x-ndjson")
+        response["Content-Disposition"] = f'attachment; filename="{room.slug}.ndjson"'
+        return response
+
+
+class UploadSessionCreateView(APIView):
+    """
+    Starts a resumable upload into a room. The response's ``id`` is then used
+    to send the file's bytes to ``UploadSessionDetailView`` in chunks.
+    """
+    permission_classes = [IsAuthenticated]
 
-            return Response({"messages": serialized_messages}, status=status.HTTP_200_OK)
-        except Room.DoesNotExist:
-            raise Http404("Room does not exist!")
-        except Exception as e:
-            messages.error(f"Error occurred: {str(e)}")
-            return HttpResponse(status=500)
+    def post(self, request, room_slug):
+        room = get_object_or_404(Room, slug=room_slug)
+        if room.is_private and not room.has_member(request.user):
+            return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = serializer.save(user=request.user, room=room)
+        response = Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        response["Upload-Offset"] = "0"
+        return response
+
+
+class UploadSessionDetailView(APIView):
+    """
+    GET reports how many bytes have arrived (also in the ``Upload-Offset``
+    header), PATCH appends a chunk: the raw bytes as the body and the offset
+    they start at in ``Upload-Offset``. A mismatched offset gets a 409 with
+    the offset to resume from. DELETE abandons the upload.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_session(self, request, room_slug, pk):
+        return get_object_or_404(
+            UploadSession.objects.select_related("blob"), pk=pk, room__slug=room_slug, user=request.user)
+
+    def respond(self, session, status_code=status.HTTP_200_OK):
+        response = Response(UploadSessionSerializer(session).data, status=status_code)
+        response["Upload-Offset"] = str(uploads.current_offset(session))
+        return response
 
-    return Response({"error": "Invalid request method."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    def get(self, request, room_slug, pk):
+        return self.respond(self.get_session(request, room_slug, pk))
+
+    def patch(self, request, room_slug, pk):
+        session = self.get_session(request, room_slug, pk)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return Response({"error": "Upload-Offset and Content-Length headers are required."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        max_chunk = getattr(settings, "CHAT_UPLOAD_MAX_CHUNK_SIZE", 8 * 1024 ** 2)
+        if length > max_chunk:
+            return Response({"error": f"Chunks are limited to {max_chunk} bytes."},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        try:
+            uploads.append_chunk(session, offset, request.stream, length)
+        except uploads.UploadBusy as e:
+            return Response({"error": str(e)}, status=status.HTTP_423_LOCKED)
+        except uploads.UploadError as e:
+            response = Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+            response["Upload-Offset"] = str(e.offset)
+            return response
+        return self.respond(session)
+
+    def delete(self, request, room_slug, pk):
+        session = self.get_session(request, room_slug, pk)
+        if not session.is_complete:
+            uploads.discard(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MessageMediaView(APIView):
+    """
+    Serves a message's media file, or one of its derivatives
+    (``thumbnail``/``preview``), to users who can read the room. Supports
+    Range requests; see cowork.serving. Session authentication is accepted too
+    so that plain ``<img>``/``<video>`` tags can load it.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES + [SessionAuthentication]
+
+    def get(self, request, room_slug, pk, kind=None):
+        message = get_object_or_404(
+            Message.objects.select_related("room", "media_blob"), pk=pk, room__slug=room_slug)
+        room = message.room
+        if room.is_private and not room.has_member(request.user):
+            return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+        blob = message.media_blob
+        if kind is not None:
+            if kind not in derivatives.KINDS:
+                raise Http404("Unknown derivative.")
+            source = derivatives.source_of(message)
+            path = source and default_storage.path(derivatives.derivative_name(source[0], kind))
+            if not path or not os.path.exists(path):
+                raise Http404("Not rendered yet.")
+            return serving.serve_file(request, path, "image/jpeg")
+
+        if blob is not None:
+            # Content-addressed: the digest is the strongest possible ETag and the
+            # bytes behind this URL never change.
+            return serving.serve_file(
+                request, blob.file.path, blob.content_type or "application/octet-stream",
+                etag=quote_etag(blob.sha256), cache_control="private, max-age=31536000, immutable")
+        if message.media:
+            content_type = mimetypes.guess_type(message.media.name)[0] or "application/octet-stream"
+            return serving.serve_file(request, message.media.path, content_type)
+        raise Http404("This message has no media.")
 
 
 class TaskListCreateView(generics.ListCreateAPIView):
-    queryset = Task.objects.all()
+    """
+    Tasks of one room, soonest due first, in numbered pages (``page``,
+    ``limit``).
+
+    Filters: ``assigned_to`` (username), ``status`` (``open`` or
+    ``completed``), and ``due_after`` / ``due_before`` (inclusive dates).
+    """
     serializer_class = TaskSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TaskPagination
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Looked up once for the queryset, the serializer context and creation
+        self.room = get_object_or_404(Room, slug=self.kwargs['room_slug'])
+        if self.room.is_private and not self.room.has_member(request.user):
+            raise exceptions.PermissionDenied("You do not have access to this room.")
+
+    def get_queryset(self):
+        tasks = Task.objects.filter(room=self.room).select_related('assigned_to')
+        params = self.request.query_params
+        if params.get('assigned_to'):
+            tasks = tasks.filter(assigned_to__username=params['assigned_to'])
+        task_status = params.get('status')
+        if task_status:
+            if task_status not in ('open', 'completed'):
+                raise exceptions.ValidationError({'status': "Must be 'open' or 'completed'."})
+            tasks = tasks.filter(completed=task_status == 'completed')
+        for param, lookup in (('due_after', 'due_date__gte'), ('due_before', 'due_date__lte')):
+            if params.get(param):
+                try:
+                    due = parse_date(params[param])
+                except ValueError:
+                    due = None
+                if due is None:
+                    raise exceptions.ValidationError({param: "Must be a date (YYYY-MM-DD)."})
+                tasks = tasks.filter(**{lookup: due})
+        return tasks.order_by('due_date', 'id')
 
     def perform_create(self, serializer):
-        room = get_object_or_404(Room, slug=self.kwargs['room_slug'])
-        serializer.save(room=room)
+        serializer.save(room=self.room)
 
     def get_serializer_context(self):
-        # Pass the room to the serializer context
         context = super().get_serializer_context()
-        context['room'] = get_object_or_404(
-            Room, slug=self.kwargs['room_slug'])
+        context['room'] = self.room
         return context
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_tasks(request, room_slug):
+    """Creates and updates up to ``CHAT_TASK_BATCH_MAX`` tasks of a room at once.
+
+    Args:
+        request: The HTTP request, ``{"tasks": [...]}``. A task with an ``id``
+            updates that task with the fields it carries; any other task is
+            created and needs every field, as with the task list endpoint.
+        room_slug: The slug of the room.
+
+    Returns:
+        A JSON response with, per task and in order, its id and whether it was
+        ``created`` or ``updated``, or the errors that kept it from being
+        written. Invalid tasks do not stop the valid ones; the response is a
+        400 only when no task could be written.
+    """
+    room = get_object_or_404(Room, slug=room_slug)
+    if room.is_private and not room.has_member(request.user):
+        return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+    serializer = BulkTasksSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+    items, errors = [], {}
+    for index, data in enumerate(serializer.validated_data["tasks"]):
+        item = TaskItemSerializer(data=data, partial="id" in data)
+        if item.is_valid():
+            items.append(item.validated_data)
+        else:
+            items.append(None)
+            errors[index] = {"errors": item.errors}
+
+    results = save_tasks(room, items)
+    for index, error in errors.items():
+        results[index] = error
+    written = any("id" in result for result in results)
+    return Response({"tasks": results}, status=status.HTTP_200_OK if written else status.HTTP_400_BAD_REQUEST)
+
+
 class TaskRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
@@ -310,13 +581,15 @@ def like_room(request, room_slug):
     try:
         room = Room.objects.get(slug=room_slug)
         user = request.user
-
-        if user in room.likes.all():
-            room.likes.remove(user)
-            return Response({"message": "Room unliked successfully."}, status=status.HTTP_200_OK)
-        else:
-            room.likes.add(user)
-            return Response({"message": "Room liked successfully."}, status=status.HTTP_200_OK)
+        if room.is_private and not room.has_member(user):
+            return Response({"detail": "You do not have access to this room."}, status=status.HTTP_403_FORBIDDEN)
+
+        liked = room.toggle_like(user)
+        return Response({
+            "message": "Room liked successfully." if liked else "Room unliked successfully.",
+            "liked": liked,
+            "like_count": room.like_count,
+        }, status=status.HTTP_200_OK)
     except Room.DoesNotExist:
         return Response({"error": "Room not found."}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -326,50 +599,81 @@ def like_room(request, room_slug):
 
 class SearchAPIView(APIView):
     """
-    Performs a search across multiple models and returns results in JSON format.
+    Full-text search across rooms, messages, tasks and comments the user can
+    see (cowork.search), best matches first.
+
+    Query parameters: ``q`` (required), ``type`` (comma-separated subset of
+    room, message, task, comment), ``limit``, and ``after`` holding the
+    ``next`` cursor of the previous page. The first page also carries the
+    number of hits, counted up to ``CHAT_SEARCH_COUNT_CAP`` (``count_capped``
+    says whether there are more).
+    """
+    permission_classes = [IsAuthenticated]
 
-    Requires authentication.
+    def get(self, request):
+        query = request.GET.get('q', '').strip()
+        if not query:
+            return Response({'error': "The 'q' parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        kinds = [kind for kind in request.GET.get('type', '').split(',') if kind]
+        unknown = set(kinds) - set(search.KINDS)
+        if unknown:
+            return Response({'error': f"Unknown type: {', '.join(sorted(unknown))}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.GET.get('limit', getattr(settings, "CHAT_SEARCH_PAGE_SIZE", 25)))
+        except ValueError:
+            return Response({'error': "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, getattr(settings, "CHAT_SEARCH_MAX_PAGE_SIZE", 100)))
+        after = request.GET.get('after')
+        after = search.decode_cursor(after) if after else None
+
+        started = time.perf_counter()
+        hits = search.search(query, request.user, kinds, after=after)
+        page = list(hits[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        count, capped = None, None
+        if after is None:
+            count, capped = search.capped_count(hits, getattr(settings, "CHAT_SEARCH_COUNT_CAP", 1000))
+        results = search.results(page)
+        took = time.perf_counter() - started
+        search.QUERY_SECONDS.observe(took)
+
+        return Response({
+            'results': results,
+            'count': count,
+            'count_capped': capped,
+            'next': search.encode_cursor(page[-1]) if has_more else None,
+            'took_ms': round(took * 1000, 2),
+        }, status=status.HTTP_200_OK)
+
+
+class RoomAutocompleteView(APIView):
+    """
+    Public rooms matching what the user has typed so far, for the search box
+    (cowork.autocomplete). Name and word prefixes come first, then close
+    misspellings.
 
-    Raises:
-        ValueError: If the 'q' query parameter is not provided in the request.
+    Query parameters: ``q`` and ``limit``, at most ``CHAT_AUTOCOMPLETE_MAX_LIMIT``.
     """
+    permission_classes = [IsAuthenticated]
+
     def get(self, request):
         try:
-            query = request.GET.get('q', '')
-            if not query:
-                raise ValueError("The 'q' parameter is required.")
-
-            all_results = []
-            all_results.extend(Room.objects.filter(Q(name__icontains=query)))
-            # all_results.extend(UploadedFile.objects.filter(Q(file__icontains=query)))
-            # all_results.extend(Task.objects.filter(Q(title__icontains=query)))
-            # # all_results.extend(Branch.objects.filter(Q(original_file__icontains=query)))
-            # all_results.extend(Message.objects.filter(Q(message__icontains=query)))
-
-            paginator = Paginator(all_results, 25)
-            page_number = request.GET.get('page', 1)
-            page_obj = paginator.get_page(page_number)
-
-            serialized_results = []
-            for result in page_obj:
-                if isinstance(result, Room):
-                    serialized_result = {'id': result.id, 'Room name': result.name}
-                # elif isinstance(result, UploadedFile):
-                #     serialized_result = {'id': result.id, 'file': result.file.name}
-                # elif isinstance(result, Task):
-                #     serialized_result = {'id': result.id, 'title': result.title}
-                # elif isinstance(result, Branch):
-                #     serialized_result = {'id': result.id, 'branch': result.original_file.file.name}
-                # elif isinstance(result, Message):
-                #     serialized_result = {'id': result.id, 'message': result.message}
-                else:
-                    serialized_result = {}
-                serialized_results.append(serialized_result)
-
-            return Response({'results': serialized_results}, status=status.HTTP_200_OK)
-
-        except ValidationError as ve:
-            return Response({'error': str(ve)}, status=status.HTTP_400_BAD_REQUEST)
-        
-        except Exception as e:
-            return Response({'error': f"An unexpected error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            limit = int(request.GET.get('limit', getattr(settings, "CHAT_AUTOCOMPLETE_LIMIT", 10)))
+        except ValueError:
+            return Response({'error': "'limit' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, getattr(settings, "CHAT_AUTOCOMPLETE_MAX_LIMIT", 20)))
+        query = request.GET.get('q', '')[:getattr(settings, "CHAT_AUTOCOMPLETE_MAX_QUERY", 64)]
+        return Response({'results': room_autocomplete.suggest(query, limit)}, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """
+    Exposes the in-process chat metrics (queue depths, latencies, counters)
+    of the worker that serves the request. Staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import authenticate
 from rest_framework import serializers
@@ -5,9 +6,10 @@ from allauth.account.models import EmailAddress
 from accounts.models import CustomUser
 from django.contrib.auth.hashers import check_password
 
+from cowork import derivatives, serving
 from cowork.models import (
     Room, Task, Comment,
-    Message,
+    Message, MediaBlob, UploadSession,
     # UploadedFile,
     # Branch,
     UserNote, FeatureRequest,
@@ -143,10 +145,13 @@ class CustomUserSerializer(serializers.ModelSerializer):
 class RoomSerializer(serializers.ModelSerializer):
     users = serializers.SerializerMethodField()
     created_by = serializers.SerializerMethodField()
+    # Whether the requesting user likes the room; the likers themselves are
+    # not listed, popular rooms have far too many of them.
+    liked = serializers.SerializerMethodField()
 
     class Meta:
         model = Room
-        fields = "__all__"
+        exclude = ["likes"]
 
     def get_users(self, room):
         return room.users.values_list('username', flat=True)
@@ -154,8 +159,12 @@ class RoomSerializer(serializers.ModelSerializer):
     def get_created_by(self, room):
         return room.created_by.username if room.created_by else None
 
+    def get_liked(self, room):
+        request = self.context.get("request")
+        return room.is_liked_by(request.user) if request is not None else None
+
     def remove_user(self, room, user):
-        if user in room.users.all():
+        if room.users.filter(pk=user.pk).exists():
             room.users.remove(user)
             return {"detail": f"User {user.username} removed from the room."}
         else:
@@ -175,30 +184,76 @@ class FeatureRequestSerializer(serializers.ModelSerializer):
         read_only_fields = ('room', 'user')
 
 
-class SendMessageSerializer(serializers.ModelSerializer):
+class OutgoingMessageSerializer(serializers.Serializer):
+    """One message of a send request; the room and sender come from the request."""
+    message = serializers.CharField(allow_blank=True, allow_null=True, required=False, trim_whitespace=False)
     media_file = serializers.FileField(allow_empty_file=True, required=False)
+    # A completed resumable upload (cowork.uploads) to attach instead of media_file
+    upload = serializers.UUIDField(required=False)
+    # Retries carrying the same key return the first message (cowork.sending)
+    idempotency_key = serializers.CharField(max_length=255, required=False)
+
+
+class SendMessagesSerializer(serializers.Serializer):
+    messages = OutgoingMessageSerializer(many=True, allow_empty=False)
+
+    def validate_messages(self, items):
+        max_batch = getattr(settings, "CHAT_MESSAGE_BATCH_MAX", 100)
+        if len(items) > max_batch:
+            raise serializers.ValidationError(f"At most {max_batch} messages can be sent at once.")
+
+        # Resolve every upload in the batch with one query
+        upload_ids = {item["upload"] for item in items if "upload" in item}
+        uploads = UploadSession.objects.filter(
+            pk__in=upload_ids, user=self.context["user"], blob__isnull=False).select_related("blob")
+        blobs = {upload.pk: upload.blob for upload in uploads}
+        errors = [{} for _ in items]
+        for item, error in zip(items, errors):
+            upload = item.pop("upload", None)
+            if upload is None:
+                continue
+            if upload not in blobs:
+                error["upload"] = ["Unknown upload."]
+            else:
+                item["media_blob"] = blobs[upload]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+
+class ReceiveMessageSerializer(serializers.ModelSerializer):
+    user = serializers.ReadOnlyField(source="user.username")
+    media = serializers.SerializerMethodField()
+    # {"thumbnail": url, "preview": url}; a url is null until it has been rendered
+    derivatives = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
-        fields = "__all__"
-
-    def create(self, validated_data):
-        media_file = validated_data.pop("media_file", None)
-        message = Message.objects.create(**validated_data)
+        fields = ["user", "message", "media", "derivatives", "created_at"]
 
-        if media_file:
-            message.media = media_file
-            message.save()
+    def get_media(self, message):
+        if message.media_blob_id or message.media:
+            return serving.media_url(message.room.slug, message.pk)
+        return None
 
-        return message
+    def get_derivatives(self, message):
+        return derivatives.urls(message)
 
 
-class ReceiveMessageSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source="user.username")
+class UploadSessionSerializer(serializers.ModelSerializer):
+    sha256 = serializers.ReadOnlyField(source="blob.sha256", default=None)
+    complete = serializers.ReadOnlyField(source="is_complete")
 
     class Meta:
-        model = Message
-        fields = ["user", "message", "media", "created_at"]
+        model = UploadSession
+        fields = ["id", "filename", "content_type", "size", "received", "complete", "sha256", "created_at"]
+        read_only_fields = ["id", "received", "created_at"]
+
+    def validate_size(self, size):
+        max_size = getattr(settings, "CHAT_UPLOAD_MAX_SIZE", 2 * 1024 ** 3)
+        if size > max_size:
+            raise serializers.ValidationError(f"Uploads are limited to {max_size} bytes.")
+        return size
 
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -214,18 +269,39 @@ class TaskSerializer(serializers.ModelSerializer):
         read_only_fields = ['room']
 
     def validate_assigned_to(self, value):
-        # Access the room and creator from the context
-        room = self.context['room']
-        creator = room.created_by
+        # The room comes from the view's context, or from the task on update
+        room = self.context.get('room') or self.instance.room
 
-        # Check if the assigned user is a member of the room (excluding the creator)
-        if not (room.users.filter(id=value.id).exists() or value == creator):
+        # The room creator counts as a member
+        if not room.has_member(value):
             raise serializers.ValidationError(
                 "The assigned user must be a member of the room or the room creator.")
 
         return value
 
 
+class TaskItemSerializer(serializers.Serializer):
+    """One task of a bulk request: with an ``id`` it updates that task, otherwise it creates one."""
+    id = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=100)
+    description = serializers.CharField()
+    completed = serializers.BooleanField(required=False)
+    due_date = serializers.DateField()
+    # Usernames, resolved and checked for the whole batch at once (cowork.task_batches)
+    assigned_to = serializers.CharField()
+
+
+class BulkTasksSerializer(serializers.Serializer):
+    # Validated item by item, so one bad task does not reject the batch
+    tasks = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+
+    def validate_tasks(self, items):
+        max_batch = getattr(settings, "CHAT_TASK_BATCH_MAX", 200)
+        if len(items) > max_batch:
+            raise serializers.ValidationError(f"At most {max_batch} tasks can be written at once.")
+        return items
+
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment